@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.http import JsonResponse
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Rechaza con 413 las peticiones cuyo Content-Length supera MAX_REQUEST_BODY_MB,
+    antes de que Django lea el cuerpo o escriba los archivos subidos a disco.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limit = settings.MAX_REQUEST_BODY_MB * 1024 * 1024
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+
+        if content_length > limit:
+            return JsonResponse({
+                'error': f'La petición supera el tamaño máximo permitido ({settings.MAX_REQUEST_BODY_MB} MB).'
+            }, status=413)
+
+        return self.get_response(request)
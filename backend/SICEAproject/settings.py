@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'SICEAproject.middleware.RequestSizeLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -155,5 +156,79 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True 
 
+# Intervalo de consulta de los reportes Excel en generación (ver writer/views.py)
+CORS_EXPOSE_HEADERS = ['Retry-After']
+
 MEDIA_ROOT = '/app/storage/'
 MEDIA_URL = '/media/'
+
+# Carpeta donde se guardan los PDF de las boletas
+BILL_STORAGE_DIR = os.environ.get('BILL_STORAGE_DIR', os.path.join(BASE_DIR, 'storage'))
+
+# Carpeta que vigila 'manage.py ingest_inbox' (p. ej. la carpeta compartida del escáner)
+BILL_INBOX_DIR = os.environ.get('BILL_INBOX_DIR', os.path.join(BASE_DIR, 'inbox'))
+
+# Tiempo (segundos) que un lote validado queda disponible para confirmarse con su batch_token
+VALIDATED_BATCH_TTL_SECONDS = int(os.environ.get('VALIDATED_BATCH_TTL_SECONDS', 1800))
+
+# Qué hacer al guardar una boleta de un período que ya existe: skip, replace o newest (ver reader/ingest.py)
+BILL_CONFLICT_POLICY = os.environ.get('BILL_CONFLICT_POLICY', 'skip')
+
+# Texto completo de las boletas en los resultados de los readers: drop, spill o keep (ver reader/reader.py)
+BILL_TEXT_RETENTION = os.environ.get('BILL_TEXT_RETENTION', 'drop')
+
+# Carpeta donde la política spill escribe el texto comprimido
+BILL_TEXT_SPILL_DIR = os.environ.get('BILL_TEXT_SPILL_DIR', os.path.join(BASE_DIR, 'output', 'text'))
+
+# Reportes Excel generados en segundo plano (ver writer/reports.py)
+EXCEL_REPORT_DIR = os.environ.get('EXCEL_REPORT_DIR', os.path.join(BASE_DIR, 'output', 'reports'))
+
+# Reportes que se generan a la vez en cada proceso del servidor
+EXCEL_REPORT_WORKERS = int(os.environ.get('EXCEL_REPORT_WORKERS', 1))
+
+# Segundos que la petición de exportación espera al reporte antes de responder 202 para consultar después
+EXCEL_REPORT_WAIT_SECONDS = float(os.environ.get('EXCEL_REPORT_WAIT_SECONDS', 10))
+
+# Un reporte en generación por más de este tiempo se considera abandonado y se vuelve a generar
+EXCEL_REPORT_TIMEOUT_SECONDS = int(os.environ.get('EXCEL_REPORT_TIMEOUT_SECONDS', 1800))
+
+# Versiones de boletas, cargos y medidores que invalidan las respuestas en caché de la API (ver reader/versions.py)
+RESOURCE_VERSION_DIR = os.environ.get('RESOURCE_VERSION_DIR', os.path.join(BASE_DIR, 'output', 'versions'))
+
+# Segundos que se guardan en caché las respuestas GET de boletas, cargos y medidores
+API_CACHE_SECONDS = int(os.environ.get('API_CACHE_SECONDS', 600))
+
+# Segundos que se guardan en caché las respuestas del análisis (la clave incluye la versión de los datos)
+ANALYTICS_CACHE_SECONDS = int(os.environ.get('ANALYTICS_CACHE_SECONDS', 3600))
+
+# Cargos que se pueden pedir por nombre en una consulta del análisis
+ANALYTICS_MAX_CHARGES = int(os.environ.get('ANALYTICS_MAX_CHARGES', 20))
+
+# Tiempo máximo (segundos) para procesar un PDF de boleta antes de marcarlo como inválido
+BILL_PARSE_TIMEOUT_SECONDS = int(os.environ.get('BILL_PARSE_TIMEOUT_SECONDS', 30))
+
+# Hilos del pool donde se procesan los PDF (extracción de texto y expresiones regulares)
+BILL_PARSE_WORKERS = int(os.environ.get('BILL_PARSE_WORKERS', 4))
+
+# Métricas de procesamiento de boletas (tiempo por extractor) en consola
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'reader': {
+            'handlers': ['console'],
+            'level': os.environ.get('READER_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Máximo de archivos por subida (la carga masiva de boletas envía cientos de PDF por lote)
+DATA_UPLOAD_MAX_NUMBER_FILES = int(os.environ.get('DATA_UPLOAD_MAX_NUMBER_FILES', 1000))
+
+# Tamaño máximo (MB) del cuerpo de una petición, p. ej. un lote de PDF
+MAX_REQUEST_BODY_MB = int(os.environ.get('MAX_REQUEST_BODY_MB', 200))
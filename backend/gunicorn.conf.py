@@ -0,0 +1,43 @@
+"""
+Configuración de gunicorn para el modo producción (ver start.sh).
+Todos los valores se ajustan con variables de entorno.
+"""
+import multiprocessing
+import os
+
+# Punto de entrada: wsgi (SICEAproject/wsgi.py con hilos) o asgi (SICEAproject/asgi.py con uvicorn)
+SERVER_INTERFACE = os.environ.get('SERVER_INTERFACE', 'wsgi')
+
+if SERVER_INTERFACE == 'asgi':
+    wsgi_app = 'SICEAproject.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'SICEAproject.wsgi:application'
+    worker_class = 'gthread'
+    # Hilos por proceso: una carga larga de PDF no bloquea los listados del mismo proceso
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# El análisis de PDF usa CPU, por lo que se usa un proceso por núcleo (mínimo 2)
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+
+# Con gthread y uvicorn el timeout vigila al proceso, no a cada petición: una carga
+# de muchas boletas puede durar más, cada archivo tiene su BILL_PARSE_TIMEOUT_SECONDS
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Reiniciar los procesos periódicamente libera la memoria que retienen pdfplumber y pandas
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Límites de la línea de petición y de las cabeceras; el tamaño del cuerpo lo limita
+# MAX_REQUEST_BODY_MB en Django (SICEAproject/middleware.py)
+limit_request_line = int(os.environ.get('GUNICORN_LIMIT_REQUEST_LINE', 4094))
+limit_request_fields = int(os.environ.get('GUNICORN_LIMIT_REQUEST_FIELDS', 100))
+limit_request_field_size = int(os.environ.get('GUNICORN_LIMIT_REQUEST_FIELD_SIZE', 8190))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Meter, Bill, Charge
+from .models import Meter, Bill, BillAnomalyScore, Charge, IngestedFile
+from .versions import bump
 
 
 @admin.register(Meter)
@@ -24,3 +25,26 @@ class ChargeAdmin(admin.ModelAdmin):
     search_fields = ('bill__meter__name', 'name', 'value_type')
     list_filter = ('value_type',)
     ordering = ('-bill__year', '-bill__month')
+
+    # Eliminar un queryset de cargos no pasa por Charge.delete() (ver reader.versions)
+    def delete_queryset(self, request, queryset):
+        bill_ids = set(queryset.values_list('bill_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Bill.touch(bill_ids)
+        bump('charge')
+
+
+@admin.register(IngestedFile)
+class IngestedFileAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'status', 'bill', 'processed_at')
+    search_fields = ('file_name', 'sha256')
+    list_filter = ('status',)
+    ordering = ('-processed_at',)
+
+
+@admin.register(BillAnomalyScore)
+class BillAnomalyScoreAdmin(admin.ModelAdmin):
+    list_display = ('bill', 'consumption_z', 'total_z', 'consumption_yoy', 'total_yoy', 'flagged', 'scored_at')
+    search_fields = ('bill__meter__client_number', 'bill__meter__name')
+    list_filter = ('flagged', 'bill__meter__meter_type', 'bill__year')
+    ordering = ('-bill__year', '-bill__month')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReaderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reader'
+
+    def ready(self):
+        from .versions import connect_signals
+        connect_signals()
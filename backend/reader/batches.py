@@ -0,0 +1,117 @@
+"""
+Lotes validados por ValidateBatchBillsView.
+
+Los PDF correctos y sus datos extraídos se guardan por un tiempo limitado
+(VALIDATED_BATCH_TTL_SECONDS) bajo un token, para que ProcessMultipleBillsView
+confirme el lote sin volver a recibir ni procesar los archivos.
+"""
+import json
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+MANIFEST_NAME = 'manifest.json'
+CLAIMED_SUFFIX = '.claimed'
+
+
+def batches_dir() -> Path:
+    return Path(settings.BILL_STORAGE_DIR) / 'batches'
+
+
+def batch_ttl() -> int:
+    return getattr(settings, 'VALIDATED_BATCH_TTL_SECONDS', 1800)
+
+
+def create_batch(entries: List[dict]) -> str:
+    """
+    Guarda un lote validado y retorna su token.
+    Cada entrada tiene 'file', 'provider', 'bill_data' y 'tmp_path'; el archivo temporal se mueve al lote.
+    El texto por página comprimido ('pages_compressed') se escribe junto al PDF y no en el manifiesto.
+    """
+    purge_expired_batches()
+
+    token = uuid.uuid4().hex
+    batch_path = batches_dir() / token
+    batch_path.mkdir(parents=True)
+
+    manifest_entries = []
+    for position, entry in enumerate(entries):
+        pdf_name = f'{position}.pdf'
+        shutil.move(entry['tmp_path'], batch_path / pdf_name)
+        # El texto completo no se necesita para guardar la boleta
+        bill_data = {
+            key: value for key, value in entry['bill_data'].items()
+            if key not in ('complete_text', 'pages_compressed')
+        }
+        pages_name = None
+        if entry['bill_data'].get('pages_compressed'):
+            pages_name = f'{position}.pages'
+            (batch_path / pages_name).write_bytes(entry['bill_data']['pages_compressed'])
+        manifest_entries.append({
+            'file': entry['file'],
+            'provider': entry['provider'],
+            'pdf': pdf_name,
+            'pages': pages_name,
+            'bill_data': bill_data,
+        })
+
+    with open(batch_path / MANIFEST_NAME, 'w', encoding='utf-8') as manifest_file:
+        json.dump({'created': time.time(), 'entries': manifest_entries}, manifest_file)
+
+    return token
+
+
+def claim_batch(token: str) -> Optional[Tuple[Path, dict]]:
+    """
+    Reserva un lote para confirmarlo y retorna (carpeta, manifiesto).
+    El renombrado es atómico, por lo que dos peticiones con el mismo token no pueden confirmarlo dos veces.
+    Retorna None si el token no existe, ya fue usado o expiró.
+    """
+    if not isinstance(token, str) or not TOKEN_PATTERN.match(token):
+        return None
+
+    batch_path = batches_dir() / token
+    claimed_path = batch_path.with_name(token + CLAIMED_SUFFIX)
+    try:
+        batch_path.rename(claimed_path)
+    except OSError:
+        return None
+
+    try:
+        with open(claimed_path / MANIFEST_NAME, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        discard_batch(claimed_path)
+        return None
+
+    if time.time() - manifest['created'] > batch_ttl():
+        discard_batch(claimed_path)
+        return None
+
+    return claimed_path, manifest
+
+
+def discard_batch(batch_path: Path):
+    shutil.rmtree(batch_path, ignore_errors=True)
+
+
+def purge_expired_batches():
+    """
+    Elimina los lotes que superaron su tiempo de vida sin ser confirmados.
+    """
+    root = batches_dir()
+    if not root.exists():
+        return
+    limit = time.time() - batch_ttl()
+    for batch_path in root.iterdir():
+        try:
+            if batch_path.stat().st_mtime < limit:
+                discard_batch(batch_path)
+        except OSError:
+            continue
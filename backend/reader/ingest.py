@@ -0,0 +1,289 @@
+"""
+Guardado idempotente de boletas.
+
+Las boletas de un lote se guardan con sentencias INSERT ... ON CONFLICT sobre (meter, month, year)
+(una para los períodos nuevos y otra para los existentes), por lo que dos cargas concurrentes del
+mismo período no fallan por la restricción única ni pierden el enlace al PDF, sin necesidad de
+serializar las peticiones. Las filas se bloquean y se escriben en orden (medidor, año, mes), de
+modo que dos lotes con períodos en común no se bloquean mutuamente.
+
+Política ante una boleta que ya existe (BILL_CONFLICT_POLICY):
+- skip: se conserva la boleta existente.
+- replace: se reemplazan el total, la tarifa, el número de factura, los cargos y el PDF.
+- newest: se reemplaza solo si el número de factura nuevo es mayor (boleta reemitida).
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from reader.models import Meter, Bill, BillText, Charge
+from reader.versions import bump
+
+CONFLICT_POLICIES = ('skip', 'replace', 'newest')
+
+# Filas por sentencia INSERT, para no superar el límite de parámetros de la base de datos
+UPSERT_CHUNK_SIZE = 500
+
+BILL_COLUMNS = (
+    'meter', 'month', 'year', 'total_to_pay', 'tarifa', 'invoice_number', 'pdf_filename', 'reader', 'reader_version',
+    'updated_at',
+)
+UPDATED_COLUMNS = ('total_to_pay', 'tarifa', 'invoice_number', 'pdf_filename', 'reader', 'reader_version', 'updated_at')
+
+
+def conflict_policy(policy: Optional[str] = None) -> str:
+    policy = policy or getattr(settings, 'BILL_CONFLICT_POLICY', 'skip')
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError(f"Política de conflicto desconocida: {policy}")
+    return policy
+
+
+def compressed_pages(bill_data: dict) -> Optional[bytes]:
+    """
+    Texto por página de la boleta para BillText: 'pages_compressed' si ya viene comprimido
+    (lotes validados, ver validate_bill()) o 'pages' de parse_bill().
+    """
+    if bill_data.get('pages_compressed'):
+        return bill_data['pages_compressed']
+    if bill_data.get('pages'):
+        return BillText.compress(bill_data['pages'])
+    return None
+
+
+def invoice_key(invoice_number: str) -> Tuple[int, str]:
+    """
+    Orden de los números de factura: numérico para folios de distinto largo.
+    """
+    invoice_number = invoice_number or ''
+    return len(invoice_number), invoice_number
+
+
+def upsert_bills(entries: List[dict], policy: Optional[str] = None) -> List[dict]:
+    """
+    Guarda las boletas de un lote y retorna, por cada entrada y en el mismo orden,
+    {'bill_id', 'action', 'replaced_pdf'}.
+
+    Cada entrada tiene 'meter_type', 'bill_data' (datos de parse_bill(), ya validados)
+    y opcionalmente 'pdf_filename' y 'provider' (con 'provider' se guarda el texto por página en BillText,
+    ver compressed_pages()).
+    'action' es 'created', 'updated' o 'skipped'; 'replaced_pdf' es el PDF anterior de una boleta
+    actualizada, que ya no queda enlazado.
+    """
+    policy = conflict_policy(policy)
+    outcomes = [{'bill_id': None, 'action': 'skipped', 'replaced_pdf': None} for _ in entries]
+    if not entries:
+        return outcomes
+
+    with transaction.atomic():
+        meters = resolve_meters(entries)
+
+        # Una sola fila por período dentro del lote, elegida con la misma política
+        chosen: Dict[tuple, int] = {}
+        for index, entry in enumerate(entries):
+            bill_data = entry['bill_data']
+            key = (meters[bill_data['client_number']], bill_data['month'], bill_data['year'])
+            if key not in chosen or policy == 'replace' or (
+                policy == 'newest'
+                and invoice_key(bill_data.get('invoice_number')) > invoice_key(entries[chosen[key]]['bill_data'].get('invoice_number'))
+            ):
+                chosen[key] = index
+
+        # Filas en orden (medidor, año, mes): dos lotes concurrentes bloquean los períodos en el mismo
+        # orden y no pueden quedar esperándose mutuamente
+        rows = sorted(
+            ((key, entries[index]) for key, index in chosen.items()),
+            key=lambda row: (row[0][0], row[0][2], row[0][1]),
+        )
+        existing = {}
+        if policy == 'skip':
+            written = insert_rows(rows, policy)
+            created = set(written)
+        else:
+            # PDF enlazados antes del cambio; las filas quedan bloqueadas hasta el fin de la transacción
+            existing = lock_bills(chosen)
+            # Los períodos nuevos se insertan sin tocar una fila que otro lote haya creado entretanto
+            new_rows = [row for row in rows if row[0] not in existing]
+            written = insert_rows(new_rows, 'skip')
+            created = set(written)
+            # Esas filas se bloquean y se leen como las demás existentes antes de actualizarlas
+            raced = {key for key, _ in new_rows} - created
+            if raced:
+                existing.update(lock_bills(raced))
+            written.update(insert_rows([row for row in rows if row[0] in existing], policy))
+
+        # Los cargos de las boletas creadas o actualizadas se reemplazan por los del PDF
+        if policy != 'skip':
+            Charge.objects.filter(bill_id__in=list(written.values())).delete()
+        Charge.objects.bulk_create([
+            Charge(
+                bill_id=bill_id,
+                name=charge_data['name'],
+                value=charge_data['value'],
+                value_type=charge_data['value_type'],
+                charge=charge_data['charge'],
+            )
+            for key, bill_id in written.items()
+            for charge_data in entries[chosen[key]]['bill_data'].get('charges', [])
+        ])
+
+        # Texto por página para reparse, de las entradas que lo traen
+        texts = []
+        for key, bill_id in written.items():
+            entry = entries[chosen[key]]
+            pages = compressed_pages(entry['bill_data'])
+            if entry.get('provider') and pages:
+                texts.append(BillText(bill_id=bill_id, reader=entry['provider'], pages=pages))
+        if texts:
+            BillText.objects.bulk_create(
+                texts, update_conflicts=True, unique_fields=['bill'], update_fields=['reader', 'pages']
+            )
+
+        # Las escrituras masivas no envían señales: se invalidan las respuestas en caché de la API
+        if written:
+            bump('bill', 'charge')
+
+    for key, index in chosen.items():
+        if key not in written:
+            continue
+        outcome = outcomes[index]
+        outcome['bill_id'] = written[key]
+        if key in created:
+            outcome['action'] = 'created'
+        else:
+            outcome['action'] = 'updated'
+            new_pdf = entries[index].get('pdf_filename')
+            if new_pdf and existing[key] and existing[key] != new_pdf:
+                outcome['replaced_pdf'] = existing[key]
+
+    return outcomes
+
+
+def release_unlinked_pdfs(entries: List[dict], outcomes: List[dict]) -> None:
+    """
+    Elimina del almacenamiento los PDF que no quedan enlazados a una boleta: el de una entrada
+    omitida o con error y el anterior de una boleta actualizada.
+    """
+    storage_dir = settings.BILL_STORAGE_DIR
+    for entry, outcome in zip(entries, outcomes):
+        if outcome['action'] in ('skipped', 'error'):
+            unlinked_pdf = entry.get('pdf_filename')
+        else:
+            unlinked_pdf = outcome['replaced_pdf']
+        if unlinked_pdf and os.path.exists(os.path.join(storage_dir, unlinked_pdf)):
+            os.unlink(os.path.join(storage_dir, unlinked_pdf))
+
+
+def resolve_meters(entries: List[dict]) -> Dict[str, int]:
+    """
+    Retorna {client_number: meter_id}, creando los medidores que no existen.
+    Si hay medidores repetidos se usa el primero creado, igual que la validación del lote.
+    """
+    meters = {}
+    client_numbers = {entry['bill_data']['client_number'] for entry in entries}
+    for client_number, meter_id in (
+        Meter.objects.filter(client_number__in=client_numbers).order_by('pk').values_list('client_number', 'pk')
+    ):
+        meters.setdefault(client_number, meter_id)
+
+    for entry in entries:
+        client_number = entry['bill_data']['client_number']
+        if client_number not in meters:
+            meter, _ = Meter.objects.get_or_create(
+                client_number=client_number,
+                defaults={
+                    'name': f"Meter {client_number}",
+                    'meter_type': entry['meter_type'],
+                    'coverage': 'Unknown',
+                }
+            )
+            meters[client_number] = meter.pk
+    return meters
+
+
+def lock_bills(keys) -> Dict[tuple, Optional[str]]:
+    """
+    Bloquea las boletas existentes de los períodos (meter_id, month, year) dados, en orden
+    (medidor, año, mes), y retorna {período: pdf_filename}.
+    """
+    keys = set(keys)
+    return {
+        (meter_id, month, year): pdf_filename
+        for meter_id, month, year, pdf_filename in Bill.objects.select_for_update().filter(
+            meter_id__in={key[0] for key in keys},
+            month__in={key[1] for key in keys},
+            year__in={key[2] for key in keys},
+        ).order_by('meter_id', 'year', 'month').values_list('meter_id', 'month', 'year', 'pdf_filename')
+        if (meter_id, month, year) in keys
+    }
+
+
+def insert_rows(rows: List[Tuple[tuple, dict]], policy: str) -> Dict[tuple, int]:
+    """
+    insert_on_conflict() por bloques de UPSERT_CHUNK_SIZE filas.
+    """
+    written = {}
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        written.update(insert_on_conflict(rows[start:start + UPSERT_CHUNK_SIZE], policy))
+    return written
+
+
+def insert_on_conflict(rows: List[Tuple[tuple, dict]], policy: str) -> Dict[tuple, int]:
+    """
+    Ejecuta INSERT ... ON CONFLICT para las filas dadas y retorna {(meter_id, month, year): bill_id}
+    de las boletas creadas o actualizadas; las omitidas por la política no aparecen.
+    """
+    table = connection.ops.quote_name(Bill._meta.db_table)
+    fields = [Bill._meta.get_field(name) for name in BILL_COLUMNS]
+    columns = {field.name: connection.ops.quote_name(field.column) for field in fields}
+    meter, month, year = columns['meter'], columns['month'], columns['year']
+
+    # La sentencia no pasa por save(), por lo que auto_now no aplica
+    now = timezone.now()
+    params = []
+    for (meter_id, bill_month, bill_year), entry in rows:
+        bill_data = entry['bill_data']
+        values = {
+            'meter': meter_id,
+            'month': bill_month,
+            'year': bill_year,
+            'total_to_pay': bill_data.get('total_amount', 0),
+            'tarifa': bill_data.get('tarifa') or '',
+            'invoice_number': bill_data.get('invoice_number') or '',
+            'pdf_filename': entry.get('pdf_filename'),
+            'reader': bill_data.get('reader') or '',
+            'reader_version': bill_data.get('reader_version'),
+            'updated_at': now,
+        }
+        params += [field.get_db_prep_save(values[field.name], connection) for field in fields]
+
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns.values())}) "
+        f"VALUES {', '.join([placeholders] * len(rows))} "
+        f"ON CONFLICT ({meter}, {month}, {year}) "
+    )
+    if policy == 'skip':
+        sql += "DO NOTHING "
+    else:
+        assignments = []
+        for name in UPDATED_COLUMNS:
+            if name == 'pdf_filename':
+                # Sin PDF nuevo se mantiene el enlace existente
+                assignments.append(f"{columns[name]} = COALESCE(EXCLUDED.{columns[name]}, {table}.{columns[name]})")
+            else:
+                assignments.append(f"{columns[name]} = EXCLUDED.{columns[name]}")
+        sql += f"DO UPDATE SET {', '.join(assignments)} "
+        if policy == 'newest':
+            invoice = columns['invoice_number']
+            sql += (
+                f"WHERE LENGTH(EXCLUDED.{invoice}) > LENGTH({table}.{invoice}) "
+                f"OR (LENGTH(EXCLUDED.{invoice}) = LENGTH({table}.{invoice}) AND EXCLUDED.{invoice} > {table}.{invoice}) "
+            )
+    sql += f"RETURNING {connection.ops.quote_name(Bill._meta.pk.column)}, {meter}, {month}, {year}"
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {(meter_id, bill_month, bill_year): bill_id for bill_id, meter_id, bill_month, bill_year in cursor.fetchall()}
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reader.ingest import CONFLICT_POLICIES, release_unlinked_pdfs, upsert_bills
+from reader.reader import READERS, ParseBudget, ParseTimeout, parse_upload
+
+
+def parse_archive_file(path: str):
+    """
+    Detecta el proveedor y extrae los datos de un PDF en un proceso del pool. El texto completo
+    no se retorna: repite el texto por página ('pages'), que es el que se guarda con la boleta.
+    """
+    budget = ParseBudget()
+    provider, bill_data = budget.run(parse_upload, path, budget)
+    if bill_data:
+        bill_data.pop('complete_text', None)
+    return provider, bill_data
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def walk_pdfs(root: Path):
+    """
+    Recorre el árbol de forma perezosa y en un orden estable: en cada carpeta primero sus PDF
+    y luego sus subcarpetas, ambos por nombre. Retorna rutas relativas a root.
+    """
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.startswith('.') or not filename.lower().endswith('.pdf'):
+                continue
+            yield (Path(directory) / filename).relative_to(root)
+
+
+def walk_key(relative_path: Path):
+    """
+    Clave con el mismo orden que walk_pdfs, para saltar lo ya procesado aunque el último
+    archivo del punto de control ya no exista.
+    """
+    return [(1, part) for part in relative_path.parts[:-1]] + [(0, relative_path.name)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga histórica de boletas desde un árbol de carpetas. Analiza los PDF en paralelo, "
+        "guarda por bloques en una transacción y escribe un punto de control tras cada bloque, "
+        "de modo que una ejecución interrumpida continúa donde quedó"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help="Carpeta raíz del archivo histórico")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Boletas por transacción")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Procesos de análisis (por defecto BILL_PARSE_WORKERS)")
+        parser.add_argument('--checkpoint', default=None,
+                            help="Archivo del punto de control (por defecto output/backfill-<raíz>.json)")
+        parser.add_argument('--restart', action='store_true', help="Ignorar el punto de control y empezar de cero")
+        parser.add_argument('--policy', choices=CONFLICT_POLICIES, default=None,
+                            help="Política ante boletas existentes (por defecto BILL_CONFLICT_POLICY)")
+
+    def handle(self, *args, **options):
+        self.root = Path(options['root']).resolve()
+        if not self.root.is_dir():
+            raise CommandError(f"No existe la carpeta {self.root}")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size debe ser mayor que 0")
+        self.policy = options['policy']
+        workers = options['workers'] or getattr(settings, 'BILL_PARSE_WORKERS', 4)
+
+        root_hash = hashlib.sha1(str(self.root).encode()).hexdigest()[:12]
+        self.checkpoint_path = Path(
+            options['checkpoint'] or Path(settings.BASE_DIR) / 'output' / f"backfill-{root_hash}.json"
+        )
+        self.failures_path = self.checkpoint_path.with_suffix('.failed.ndjson')
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.checkpoint = self.load_checkpoint(options['restart'])
+        resume_key = walk_key(Path(self.checkpoint['last_path'])) if self.checkpoint['last_path'] else None
+        if resume_key:
+            self.stdout.write(f"Continuando después de {self.checkpoint['last_path']}")
+
+        paths = (
+            path for path in walk_pdfs(self.root)
+            if resume_key is None or walk_key(path) > resume_key
+        )
+
+        # Detener con SIGTERM (docker stop) igual que con Ctrl+C
+        signal.signal(signal.SIGTERM, stop)
+
+        # Memoria acotada: a lo más window archivos en análisis y un bloque de resultados
+        window = workers * 2
+        in_flight = deque()
+        chunk = []
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            try:
+                for path in paths:
+                    in_flight.append((path, pool.submit(parse_archive_file, str(self.root / path))))
+                    if len(in_flight) >= window:
+                        chunk.append(self.collect(*in_flight.popleft()))
+                    if len(chunk) >= options['chunk_size']:
+                        self.commit_chunk(chunk)
+                        chunk = []
+                while in_flight:
+                    chunk.append(self.collect(*in_flight.popleft()))
+                    if len(chunk) >= options['chunk_size']:
+                        self.commit_chunk(chunk)
+                        chunk = []
+                self.commit_chunk(chunk)
+            except KeyboardInterrupt:
+                # Lo que no alcanzó a guardarse se vuelve a procesar al continuar
+                for _, future in in_flight:
+                    future.cancel()
+                self.stdout.write(f"Detenido; se continuará después de {self.checkpoint['last_path']}")
+                return
+
+        counts = self.checkpoint['counts']
+        self.stdout.write(self.style.SUCCESS(
+            f"Creadas {counts['created']}, actualizadas {counts['updated']}, "
+            f"omitidas {counts['skipped']}, fallidas {counts['failed']}"
+        ))
+        if counts['failed']:
+            self.stdout.write(f"Detalle de los fallidos en {self.failures_path}")
+
+    def load_checkpoint(self, restart):
+        if not restart and self.checkpoint_path.exists():
+            checkpoint = json.loads(self.checkpoint_path.read_text())
+            if checkpoint.get('root') != str(self.root):
+                raise CommandError(
+                    f"El punto de control {self.checkpoint_path} es de {checkpoint.get('root')}; "
+                    f"use --checkpoint o --restart"
+                )
+            return checkpoint
+
+        if self.failures_path.exists():
+            self.failures_path.unlink()
+        return {
+            'root': str(self.root),
+            'last_path': None,
+            'counts': {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0},
+        }
+
+    def collect(self, path, future):
+        """
+        Resultado de un archivo: (ruta, proveedor, datos, error).
+        """
+        try:
+            provider, bill_data = future.result()
+            if provider is None:
+                raise ValueError("No se pudo identificar el proveedor de la boleta")
+            READERS[provider]().check_required(bill_data)
+            return path, provider, bill_data, None
+        except ParseTimeout as e:
+            return path, None, None, f"{e} ({ParseBudget.format_timings(e.timings)})"
+        except Exception as e:
+            return path, None, None, str(e)
+
+    def commit_chunk(self, chunk):
+        """
+        Guarda un bloque en una sola transacción y luego escribe el punto de control.
+        Si la transacción falla no se avanza el punto de control y el bloque se reintenta al continuar.
+        """
+        if not chunk:
+            return
+
+        storage_dir = settings.BILL_STORAGE_DIR
+        os.makedirs(storage_dir, exist_ok=True)
+        entries = []
+        for path, provider, bill_data, error in chunk:
+            if error is None:
+                unique_pdf_name = f"{uuid.uuid4()}.pdf"
+                shutil.copyfile(self.root / path, os.path.join(storage_dir, unique_pdf_name))
+                entries.append({
+                    'provider': provider,
+                    'meter_type': READERS[provider].METER_TYPE,
+                    'bill_data': bill_data,
+                    'pdf_filename': unique_pdf_name,
+                })
+
+        try:
+            outcomes = upsert_bills(entries, self.policy)
+        except Exception:
+            release_unlinked_pdfs(entries, [{'action': 'error'} for _ in entries])
+            raise
+        release_unlinked_pdfs(entries, outcomes)
+
+        counts = self.checkpoint['counts']
+        for outcome in outcomes:
+            counts[outcome['action']] += 1
+        failures = [(path, error) for path, _, _, error in chunk if error is not None]
+        if failures:
+            counts['failed'] += len(failures)
+            with open(self.failures_path, 'a') as log:
+                for path, error in failures:
+                    log.write(json.dumps({'file': str(path), 'error': error}) + '\n')
+                    self.stdout.write(f"{path}: {error}")
+
+        self.checkpoint['last_path'] = str(chunk[-1][0])
+        # Escritura atómica: un corte a mitad de la escritura no deja un punto de control corrupto
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self.checkpoint, indent=2))
+        os.replace(tmp_path, self.checkpoint_path)
+
+        self.stdout.write(
+            f"Bloque guardado hasta {self.checkpoint['last_path']}: creadas {counts['created']}, "
+            f"actualizadas {counts['updated']}, omitidas {counts['skipped']}, fallidas {counts['failed']}"
+        )
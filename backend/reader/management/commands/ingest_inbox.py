@@ -0,0 +1,252 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reader.ingest import release_unlinked_pdfs, upsert_bills
+from reader.models import IngestedFile
+from reader.reader import READERS, ParseBudget, ParseTimeout, parse_upload
+
+# Archivos que el escáner aún está copiando
+PARTIAL_SUFFIXES = ('.part', '.tmp', '.crdownload')
+
+
+def parse_inbox_file(path: str):
+    """
+    Detecta el proveedor y extrae los datos de un PDF. Se ejecuta en un proceso del pool,
+    por lo que no usa la base de datos.
+    """
+    budget = ParseBudget()
+    return budget.run(parse_upload, path, budget)
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as pdf:
+        for chunk in iter(lambda: pdf.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Vigila una carpeta de entrada y procesa en paralelo los PDF que llegan, detectando el "
+        "proveedor con BillDetector. Los mueve a done/ o failed/ y registra cada archivo en "
+        "IngestedFile para no reprocesarlo tras un reinicio"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inbox', default=None, help="Carpeta de entrada (por defecto BILL_INBOX_DIR)")
+        parser.add_argument('--done-dir', default=None, help="Destino de los procesados (por defecto <inbox>/done)")
+        parser.add_argument('--failed-dir', default=None, help="Destino de los fallidos (por defecto <inbox>/failed)")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Procesos de análisis (por defecto BILL_PARSE_WORKERS)")
+        parser.add_argument('--interval', type=float, default=2.0, help="Segundos entre revisiones de la carpeta")
+        parser.add_argument('--debounce', type=float, default=5.0,
+                            help="Segundos que un archivo debe permanecer sin cambios antes de procesarse")
+        parser.add_argument('--once', action='store_true',
+                            help="Procesar los archivos presentes y terminar, sin esperar a que se estabilicen")
+        parser.add_argument('--keep-files', action='store_true',
+                            help="No mover los archivos; el registro evita reprocesarlos")
+
+    def handle(self, *args, **options):
+        self.inbox = Path(options['inbox'] or settings.BILL_INBOX_DIR)
+        self.done_dir = Path(options['done_dir'] or self.inbox / 'done')
+        self.failed_dir = Path(options['failed_dir'] or self.inbox / 'failed')
+        self.keep_files = options['keep_files']
+        self.debounce = 0 if options['once'] else options['debounce']
+        workers = options['workers'] or getattr(settings, 'BILL_PARSE_WORKERS', 4)
+
+        self.inbox.mkdir(parents=True, exist_ok=True)
+        if not self.keep_files:
+            self.done_dir.mkdir(parents=True, exist_ok=True)
+            self.failed_dir.mkdir(parents=True, exist_ok=True)
+
+        # Último (tamaño, mtime) visto de cada archivo y desde cuándo no cambia
+        self.seen = {}
+        # Archivos en análisis: future -> (ruta, sha256)
+        self.in_flight = {}
+        # (tamaño, mtime) de los archivos ya resueltos que siguen en la carpeta (--keep-files)
+        self.handled = {}
+        self.counts = {'done': 0, 'failed': 0, 'duplicate': 0}
+
+        # Detener con SIGTERM (docker stop) igual que con Ctrl+C
+        signal.signal(signal.SIGTERM, stop)
+
+        self.stdout.write(f"Vigilando {self.inbox} con {workers} procesos")
+        # spawn evita heredar conexiones a la base de datos y el pool de hilos del proceso padre
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            try:
+                while True:
+                    for path in self.ready_files():
+                        self.submit(pool, path, workers)
+
+                    if self.in_flight:
+                        done, _ = wait(list(self.in_flight), timeout=options['interval'], return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.finish(future)
+                    elif options['once']:
+                        break
+                    else:
+                        time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                self.stdout.write("Deteniendo; se terminan los archivos en análisis")
+                for future in list(self.in_flight):
+                    self.finish(future)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Procesados {self.counts['done']}, fallidos {self.counts['failed']}, "
+            f"ya registrados {self.counts['duplicate']}"
+        ))
+
+    def inbox_files(self):
+        """
+        Archivos de la carpeta de entrada y sus subcarpetas, ordenados. No entra en las
+        carpetas de procesados y fallidos, que crecen con cada lote.
+        """
+        skipped = {self.done_dir, self.failed_dir}
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.inbox):
+            directory = Path(dirpath)
+            dirnames[:] = [name for name in dirnames if directory / name not in skipped]
+            files.extend(directory / name for name in filenames)
+        return sorted(files)
+
+    def ready_files(self):
+        """
+        PDF de la carpeta de entrada (incluye subcarpetas) cuyo tamaño y fecha de modificación
+        no cambian hace al menos --debounce segundos.
+        """
+        now = time.monotonic()
+        in_flight = {path for path, _ in self.in_flight.values()}
+        current = set()
+        ready = []
+
+        for path in self.inbox_files():
+            if path.name.startswith('.') or path.name.lower().endswith(PARTIAL_SUFFIXES):
+                continue
+            if path.suffix.lower() != '.pdf' or path in in_flight:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if not path.is_file():
+                continue
+
+            current.add(path)
+            signature = (stat.st_size, stat.st_mtime)
+            if self.handled.get(path) == signature:
+                continue
+            previous = self.seen.get(path)
+            if previous is None or previous[0] != signature:
+                self.seen[path] = (signature, now)
+                previous = self.seen[path]
+            if now - previous[1] >= self.debounce:
+                ready.append(path)
+
+        # Olvidar los archivos que desaparecieron
+        for path in set(self.seen) - current:
+            del self.seen[path]
+        for path in set(self.handled) - current:
+            del self.handled[path]
+        return ready
+
+    def submit(self, pool, path, workers):
+        if len(self.in_flight) >= workers * 2:
+            # Cola acotada: el resto se toma en la siguiente revisión
+            return
+        try:
+            sha256 = file_sha256(path)
+        except OSError:
+            return
+
+        if sha256 in {in_flight_sha256 for _, in_flight_sha256 in self.in_flight.values()}:
+            # Copia de un archivo en análisis: se resuelve en la siguiente revisión con el registro
+            return
+
+        if IngestedFile.objects.filter(sha256=sha256, status='done').exists():
+            # Ya procesado antes de un reinicio, o el mismo PDF dejado de nuevo
+            self.counts['duplicate'] += 1
+            self.stdout.write(f"{path.name}: ya registrado")
+            self.move(path, self.done_dir)
+            return
+
+        self.in_flight[pool.submit(parse_inbox_file, str(path))] = (path, sha256)
+
+    def finish(self, future):
+        path, sha256 = self.in_flight.pop(future)
+        bill_id = None
+        try:
+            provider, bill_data = future.result()
+            if provider is None:
+                raise ValueError("No se pudo identificar el proveedor de la boleta")
+            bill_id, detail = self.save(path, provider, bill_data)
+            status = 'done'
+        except ParseTimeout as e:
+            status, detail = 'failed', f"{e} ({ParseBudget.format_timings(e.timings)})"
+        except Exception as e:
+            status, detail = 'failed', str(e)
+
+        IngestedFile.objects.update_or_create(
+            sha256=sha256,
+            defaults={'file_name': path.name, 'status': status, 'bill_id': bill_id, 'detail': detail},
+        )
+        self.counts[status] += 1
+        self.stdout.write(f"{path.name}: {status} {detail}")
+        self.move(path, self.done_dir if status == 'done' else self.failed_dir)
+
+    def save(self, path, provider, bill_data):
+        """
+        Guarda la boleta con el upsert de reader.ingest y copia el PDF al almacenamiento.
+        """
+        READERS[provider]().check_required(bill_data)
+
+        storage_dir = settings.BILL_STORAGE_DIR
+        os.makedirs(storage_dir, exist_ok=True)
+        unique_pdf_name = f"{uuid.uuid4()}.pdf"
+        shutil.copyfile(path, os.path.join(storage_dir, unique_pdf_name))
+
+        entry = {
+            'provider': provider,
+            'meter_type': READERS[provider].METER_TYPE,
+            'bill_data': bill_data,
+            'pdf_filename': unique_pdf_name,
+        }
+        try:
+            outcome = upsert_bills([entry])[0]
+        except Exception:
+            os.unlink(os.path.join(storage_dir, unique_pdf_name))
+            raise
+
+        # El PDF que no queda enlazado a una boleta se elimina
+        release_unlinked_pdfs([entry], [outcome])
+
+        detail = f"{outcome['action']} {bill_data['client_number']} {bill_data['month']}/{bill_data['year']}"
+        return outcome['bill_id'], detail
+
+    def move(self, path, target_dir):
+        signature = self.seen.pop(path, (None,))[0]
+        if self.keep_files:
+            self.handled[path] = signature
+            return
+        target = target_dir / path.name
+        counter = 1
+        while target.exists():
+            target = target_dir / f"{path.stem}-{counter}{path.suffix}"
+            counter += 1
+        shutil.move(str(path), str(target))
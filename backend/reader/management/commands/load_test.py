@@ -0,0 +1,100 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga contra un servidor en ejecución: cargas de PDF a validate-batch-bills/ "
+        "concurrentes con listados de bills/, informando rendimiento y latencias"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help="URL del servidor")
+        parser.add_argument('--uploads', type=int, default=20, help="Cantidad de cargas")
+        parser.add_argument('--listings', type=int, default=200, help="Cantidad de listados")
+        parser.add_argument('--concurrency', type=int, default=16, help="Peticiones simultáneas")
+        parser.add_argument('--files-per-upload', type=int, default=3, help="PDF por carga")
+        parser.add_argument('--pdf-dir', default='reader/input', help="Carpeta con los PDF de ejemplo")
+
+    def handle(self, *args, **options):
+        pdfs = sorted(Path(options['pdf_dir']).rglob('*.pdf'))
+        if not pdfs:
+            raise CommandError(f"No hay PDF en {options['pdf_dir']}")
+        files = [(pdf.name, pdf.read_bytes()) for pdf in pdfs]
+
+        base_url = options['base_url'].rstrip('/')
+        upload_url = f"{base_url}/api/reader/validate-batch-bills/"
+        listing_url = f"{base_url}/api/reader/bills/"
+
+        jobs = []
+        for index in range(options['uploads']):
+            batch = [files[(index + offset) % len(files)] for offset in range(options['files_per_upload'])]
+            jobs.append(('upload', lambda batch=batch: upload_request(upload_url, batch)))
+        jobs += [('listing', lambda: urllib.request.Request(listing_url))] * options['listings']
+        # Intercalar cargas y listados para que se atiendan al mismo tiempo
+        random.Random(0).shuffle(jobs)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            measurements = list(executor.map(lambda job: (job[0],) + timed_request(job[1]()), jobs))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{len(jobs)} peticiones en {elapsed:.2f}s ({len(jobs) / elapsed:.1f} req/s), "
+            f"concurrencia {options['concurrency']}"
+        )
+        for kind in ('upload', 'listing'):
+            latencies = sorted(latency for job_kind, latency, ok in measurements if job_kind == kind)
+            errors = sum(1 for job_kind, latency, ok in measurements if job_kind == kind and not ok)
+            if not latencies:
+                continue
+            self.stdout.write(
+                f"  {kind:<8} n={len(latencies):<5} errores={errors:<4} "
+                f"p50={percentile(latencies, 50):.3f}s p95={percentile(latencies, 95):.3f}s "
+                f"max={latencies[-1]:.3f}s"
+            )
+
+
+def upload_request(url, files):
+    """
+    Construye una petición multipart con los archivos en el campo 'files'.
+    """
+    boundary = uuid.uuid4().hex
+    body = b''
+    for name, content in files:
+        body += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'
+        ).encode() + content + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return urllib.request.Request(
+        url, data=body, method='POST',
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    )
+
+
+def timed_request(request):
+    """
+    Retorna (latencia, ok); ok indica una respuesta 2xx con JSON válido.
+    """
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            json.loads(response.read())
+            ok = 200 <= response.status < 300
+    except (urllib.error.URLError, ValueError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
@@ -1,23 +1,14 @@
-from pathlib import Path
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from reader.reader import EnelReader
-
 
 class Command(BaseCommand):
-    help = "Procesa las boletas de luz con EnelReader"
+    help = "Procesa las boletas de luz de ./reader/input/energy_bills (usa ingest_inbox)"
 
     def handle(self, *args, **options):
-        # Carpeta de entrada
-        energy_path = Path("./reader/input/energy_bills")
-
-        # Obtener PDFs
-        energy_pdfs = [file for file in energy_path.iterdir() if file.is_file()]
-
-        # Procesar facturas
-
-        reader = EnelReader()
-        reader.process_multiple_bills(energy_pdfs)
-
-        # Mensaje final
-        self.stdout.write(self.style.SUCCESS(f"Processed {len(reader.all_data)} bills"))
+        # Una pasada de ingest_inbox sobre la carpeta de entrada, sin mover los archivos;
+        # el registro de IngestedFile evita reprocesar los ya guardados
+        call_command(
+            'ingest_inbox', inbox='./reader/input/energy_bills', once=True, keep_files=True,
+            stdout=self.stdout, stderr=self.stderr,
+        )
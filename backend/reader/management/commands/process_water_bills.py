@@ -1,27 +1,14 @@
-from pathlib import Path
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from reader.reader import AguasAndinasReader
-
 
 class Command(BaseCommand):
-    help = "Procesa las boletas de agua con AguasAndinasReader"
+    help = "Procesa las boletas de agua de ./reader/input/water_bills (usa ingest_inbox)"
 
     def handle(self, *args, **options):
-        # Carpeta de entrada
-        water_path = Path("./reader/input/water_bills")
-
-        # Obtener PDFs
-        water_pdfs = [file for file in water_path.iterdir() if file.is_file()]
-
-        # Procesar facturas
-
-        reader = AguasAndinasReader()
-        reader.process_multiple_bills(water_pdfs)
-
-        # Mostrar primera factura
-        if reader.all_data:
-            self.stdout.write(str(reader.all_data[0]))
-
-        # Mensaje final
-        self.stdout.write(self.style.SUCCESS(f"Processed {len(reader.all_data)} bills"))
+        # Una pasada de ingest_inbox sobre la carpeta de entrada, sin mover los archivos;
+        # el registro de IngestedFile evita reprocesar los ya guardados
+        call_command(
+            'ingest_inbox', inbox='./reader/input/water_bills', once=True, keep_files=True,
+            stdout=self.stdout, stderr=self.stderr,
+        )
@@ -0,0 +1,127 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reader.models import Bill
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia los PDF de BILL_STORAGE_DIR con Bill.pdf_filename: informa los PDF que ninguna "
+        "boleta enlaza (huérfanos) y las boletas cuyo PDF no existe. Con --delete elimina los "
+        "huérfanos y con --quarantine los mueve a otra carpeta. Recorre la carpeta con os.scandir "
+        "y consulta la base de datos por bloques, por lo que usa memoria constante. Con -v 2 "
+        "lista cada archivo y boleta"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help="Eliminar los PDF huérfanos")
+        parser.add_argument('--quarantine', default=None, help="Mover los PDF huérfanos a esta carpeta")
+        parser.add_argument('--min-age', type=float, default=3600,
+                            help="Solo archivos sin modificar hace al menos estos segundos: un PDF recién "
+                                 "subido aún no está enlazado a su boleta")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Archivos o boletas por consulta")
+
+    def handle(self, *args, **options):
+        if options['delete'] and options['quarantine']:
+            raise CommandError("Use --delete o --quarantine, no ambos")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size debe ser mayor que 0")
+        self.options = options
+        self.verbosity = options['verbosity']
+        self.storage_dir = Path(settings.BILL_STORAGE_DIR)
+        self.quarantine = Path(options['quarantine']).resolve() if options['quarantine'] else None
+        if self.quarantine:
+            self.quarantine.mkdir(parents=True, exist_ok=True)
+
+        start = time.perf_counter()
+        scanned, orphans = self.reconcile_files()
+        checked, missing = self.find_missing()
+
+        if options['delete']:
+            verb = "eliminados"
+        elif self.quarantine:
+            verb = f"movidos a {self.quarantine}"
+        else:
+            verb = "sin cambios (use --delete o --quarantine)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{scanned} PDF revisados y {checked} boletas con PDF en {time.perf_counter() - start:.2f}s: "
+            f"{orphans} huérfanos {verb}, {missing} boletas sin su PDF"
+        ))
+
+    def storage_files(self):
+        """
+        PDF de la carpeta con la antigüedad mínima. No entra en subcarpetas: batches/ guarda los
+        lotes validados, que se purgan por su cuenta.
+        """
+        limit = time.time() - self.options['min_age']
+        with os.scandir(self.storage_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.name.lower().endswith('.pdf'):
+                    continue
+                try:
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime <= limit:
+                        yield entry.name
+                except OSError:
+                    # Eliminado mientras se recorría la carpeta
+                    continue
+
+    def reconcile_files(self):
+        """
+        Retorna (PDF revisados, huérfanos).
+        """
+        if not self.storage_dir.is_dir():
+            return 0, 0
+        scanned = orphans = 0
+        chunk = []
+        for name in self.storage_files():
+            chunk.append(name)
+            if len(chunk) >= self.options['chunk_size']:
+                orphans += self.release_orphans(chunk)
+                scanned += len(chunk)
+                chunk = []
+        if chunk:
+            orphans += self.release_orphans(chunk)
+            scanned += len(chunk)
+        return scanned, orphans
+
+    def release_orphans(self, names):
+        linked = set(Bill.objects.filter(pdf_filename__in=names).values_list('pdf_filename', flat=True))
+        orphans = [name for name in names if name not in linked]
+        for name in orphans:
+            path = self.storage_dir / name
+            try:
+                if self.options['delete']:
+                    path.unlink(missing_ok=True)
+                elif self.quarantine:
+                    shutil.move(str(path), str(self.quarantine / name))
+            except OSError as e:
+                self.stderr.write(f"{name}: {e}")
+                continue
+            if self.verbosity >= 2:
+                self.stdout.write(f"Huérfano: {name}")
+        return len(orphans)
+
+    def find_missing(self):
+        """
+        Boletas con un PDF que no está en el almacenamiento, por bloques de clave primaria.
+        Retorna (boletas revisadas, boletas sin PDF).
+        """
+        queryset = Bill.objects.exclude(pdf_filename=None).exclude(pdf_filename='').order_by('pk')
+        checked = missing = 0
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_id).values_list('pk', 'pdf_filename')[:self.options['chunk_size']])
+            if not rows:
+                return checked, missing
+            for bill_id, pdf_filename in rows:
+                if not (self.storage_dir / pdf_filename).is_file():
+                    missing += 1
+                    if self.verbosity >= 2:
+                        self.stdout.write(f"Bill {bill_id}: no existe {pdf_filename}")
+            checked += len(rows)
+            last_id = rows[-1][0]
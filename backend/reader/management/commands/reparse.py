@@ -0,0 +1,261 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from reader.models import Bill, BillText, Charge
+from reader.reader import READERS, extract_pdf_pages, join_pages
+from reader.versions import bump
+
+# Reader de las boletas sin sello, según el tipo de su medidor
+METER_TYPE_READERS = {reader.METER_TYPE: provider for provider, reader in READERS.items()}
+
+
+def reparse_rows(rows):
+    """
+    Aplica los extractores actuales a cada boleta en un proceso del pool, usando el texto guardado
+    o, si la boleta no lo tiene, el PDF del almacenamiento.
+    Recibe [(bill_id, reader, pages comprimidas o None, ruta del PDF o None)] y retorna
+    [(bill_id, datos extraídos, pages leídas del PDF o None, error)].
+    """
+    results = []
+    for bill_id, reader, data, pdf_path in rows:
+        try:
+            if data is not None:
+                pages, pdf_pages = BillText.decompress(data), None
+            elif pdf_path and os.path.exists(pdf_path):
+                pages = pdf_pages = extract_pdf_pages(pdf_path)
+            else:
+                raise ValueError("La boleta no tiene texto guardado ni PDF")
+            extracted_data = READERS[reader]().parse_text(join_pages(pages), pdf_path or '')
+            READERS[reader]().check_required(extracted_data)
+            extracted_data.pop('complete_text', None)
+            results.append((bill_id, extracted_data, pdf_pages, None))
+        except Exception as e:
+            results.append((bill_id, None, None, str(e)))
+    return results
+
+
+def charge_key(name, value, value_type, charge):
+    return name, Decimal(str(value)).quantize(Decimal('0.01')), value_type, int(charge)
+
+
+def amount(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+class Command(BaseCommand):
+    help = (
+        "Vuelve a derivar las boletas con los extractores actuales a partir del texto guardado en "
+        "BillText (o del PDF si no lo tiene), informa las diferencias de total y cargos, las guarda "
+        "y sella cada boleta con la versión del reader. Con --outdated solo procesa las boletas con "
+        "un sello anterior al reader actual"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--outdated', action='store_true',
+                            help="Solo boletas sin sello o con una versión anterior a la del reader")
+        parser.add_argument('--reader', choices=sorted(READERS), default=None, help="Solo boletas de este reader")
+        parser.add_argument('--year', type=int, default=None, help="Solo boletas de este año")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Procesos de análisis (por defecto BILL_PARSE_WORKERS)")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Boletas por transacción")
+        parser.add_argument('--task-size', type=int, default=50, help="Boletas por tarea del pool")
+        parser.add_argument('--max-writes', type=float, default=0,
+                            help="Máximo de boletas escritas por segundo (0 = sin límite)")
+        parser.add_argument('--dry-run', action='store_true', help="Informar las diferencias sin guardarlas")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.verbosity = options['verbosity']
+        workers = options['workers'] or getattr(settings, 'BILL_PARSE_WORKERS', 4)
+        queryset = self.get_queryset()
+
+        self.counts = {'checked': 0, 'changed': 0, 'unchanged': 0, 'failed': 0}
+        start = time.perf_counter()
+        # spawn evita heredar conexiones a la base de datos del proceso padre
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            # El bloque siguiente se analiza mientras se escribe el actual
+            pending = deque()
+            for rows in self.chunks(queryset):
+                pending.append((rows, self.submit(pool, rows)))
+                if len(pending) > 1:
+                    self.finish(*pending.popleft())
+            while pending:
+                self.finish(*pending.popleft())
+
+        verb = "cambiarían" if options['dry_run'] else "actualizadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.counts['checked']} boletas revisadas en {time.perf_counter() - start:.2f}s: "
+            f"{self.counts['changed']} {verb}, {self.counts['unchanged']} sin cambios, "
+            f"{self.counts['failed']} con error"
+        ))
+
+    def get_queryset(self):
+        queryset = Bill.objects.order_by('pk')
+        if self.options['reader']:
+            reader = READERS[self.options['reader']]
+            queryset = queryset.filter(Q(reader=self.options['reader']) | Q(reader='', meter__meter_type=reader.METER_TYPE))
+        if self.options['year']:
+            queryset = queryset.filter(year=self.options['year'])
+        if self.options['outdated']:
+            outdated = Q(reader_version__isnull=True)
+            for provider, reader in READERS.items():
+                outdated |= Q(reader=provider, reader_version__lt=reader.VERSION)
+            queryset = queryset.filter(outdated)
+        return queryset
+
+    def chunks(self, queryset):
+        """
+        Bloques de filas por clave primaria, para no cargar todas las boletas a la vez.
+        """
+        last_id = 0
+        storage_dir = settings.BILL_STORAGE_DIR
+        while True:
+            rows = []
+            for bill_id, reader, meter_type, text_reader, data, pdf_filename in queryset.filter(pk__gt=last_id).values_list(
+                'pk', 'reader', 'meter__meter_type', 'extracted_text__reader', 'extracted_text__pages', 'pdf_filename'
+            )[:self.options['chunk_size']]:
+                reader = text_reader or reader or METER_TYPE_READERS[meter_type]
+                rows.append((
+                    bill_id,
+                    reader,
+                    # La base de datos puede entregar memoryview, que no se puede enviar al pool
+                    bytes(data) if data is not None else None,
+                    os.path.join(storage_dir, pdf_filename) if pdf_filename else None,
+                ))
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    def submit(self, pool, rows):
+        task_size = self.options['task_size']
+        return [pool.submit(reparse_rows, rows[index:index + task_size]) for index in range(0, len(rows), task_size)]
+
+    def finish(self, rows, tasks):
+        chunk_start = time.monotonic()
+        derived = {}
+        for task in tasks:
+            for bill_id, extracted_data, pdf_pages, error in task.result():
+                if error is None:
+                    derived[bill_id] = (extracted_data, pdf_pages)
+                else:
+                    self.counts['failed'] += 1
+                    self.stdout.write(f"Bill {bill_id}: {error}")
+        self.counts['checked'] += len(rows)
+
+        readers = {bill_id: reader for bill_id, reader, _, _ in rows}
+        changed_charges, changed_bills = self.diff(derived)
+        self.counts['changed'] += len(changed_bills)
+        self.counts['unchanged'] += len(derived) - len(changed_bills)
+        if self.options['dry_run'] or not derived:
+            return
+
+        self.save(derived, changed_charges, changed_bills, readers)
+
+        # Limitar el ritmo de escritura para no competir con el uso normal de la base de datos
+        if self.options['max_writes']:
+            wait = len(derived) / self.options['max_writes'] - (time.monotonic() - chunk_start)
+            if wait > 0:
+                time.sleep(wait)
+
+    def diff(self, derived):
+        """
+        Compara lo derivado con lo guardado e informa las diferencias de total y de cargos.
+        Retorna (boletas con cargos distintos, boletas con total o cargos distintos).
+        """
+        stored_totals = dict(Bill.objects.filter(pk__in=list(derived)).values_list('pk', 'total_to_pay'))
+        stored_charges = {bill_id: [] for bill_id in derived}
+        for bill_id, *charge in Charge.objects.filter(bill_id__in=list(derived)).values_list(
+            'bill_id', 'name', 'value', 'value_type', 'charge'
+        ):
+            stored_charges[bill_id].append(charge_key(*charge))
+
+        changed_charges, changed_bills = set(), set()
+        for bill_id, (extracted_data, _) in derived.items():
+            new_charges = sorted(
+                charge_key(charge['name'], charge['value'], charge['value_type'], charge['charge'])
+                for charge in extracted_data['charges']
+            )
+            old_charges = sorted(stored_charges[bill_id])
+            old_total, new_total = stored_totals[bill_id], amount(extracted_data['total_amount'])
+
+            changes, details = [], []
+            if new_total != old_total:
+                changes.append(f"total {old_total} -> {new_total}")
+            if new_charges != old_charges:
+                changed_charges.add(bill_id)
+                added = set(new_charges) - set(old_charges)
+                removed = set(old_charges) - set(new_charges)
+                changes.append(f"cargos +{len(added)} -{len(removed)}")
+                details += [f"  + {name} {charge}" for name, _, _, charge in sorted(added)]
+                details += [f"  - {name} {charge}" for name, _, _, charge in sorted(removed)]
+            if changes:
+                changed_bills.add(bill_id)
+                self.stdout.write(
+                    f"Bill {bill_id} ({extracted_data['client_number']} "
+                    f"{extracted_data['month']}/{extracted_data['year']}): {'; '.join(changes)}"
+                )
+                if self.verbosity > 1:
+                    for line in details:
+                        self.stdout.write(line)
+        return changed_charges, changed_bills
+
+    @transaction.atomic
+    def save(self, derived, changed_charges, changed_bills, readers):
+        now = timezone.now()
+        bills = [
+            Bill(
+                pk=bill_id,
+                total_to_pay=extracted_data['total_amount'],
+                reader=extracted_data['reader'],
+                reader_version=extracted_data['reader_version'],
+                updated_at=now,
+            )
+            for bill_id, (extracted_data, _) in derived.items()
+        ]
+        # Solo las boletas con diferencias cambian su fecha de modificación, que invalida los reportes
+        Bill.objects.bulk_update(
+            [bill for bill in bills if bill.pk in changed_bills],
+            ['total_to_pay', 'reader', 'reader_version', 'updated_at'],
+        )
+        Bill.objects.bulk_update(
+            [bill for bill in bills if bill.pk not in changed_bills],
+            ['reader', 'reader_version'],
+        )
+
+        Charge.objects.filter(bill_id__in=list(changed_charges)).delete()
+        Charge.objects.bulk_create([
+            Charge(
+                bill_id=bill_id,
+                name=charge['name'],
+                value=charge['value'],
+                value_type=charge['value_type'],
+                charge=charge['charge'],
+            )
+            for bill_id in changed_charges
+            for charge in derived[bill_id][0]['charges']
+        ])
+
+        if changed_bills:
+            bump('bill', 'charge')
+
+        # El texto leído de los PDF queda guardado para las siguientes ejecuciones
+        texts = [
+            BillText(bill_id=bill_id, reader=readers[bill_id], pages=BillText.compress(pdf_pages))
+            for bill_id, (_, pdf_pages) in derived.items()
+            if pdf_pages is not None
+        ]
+        if texts:
+            BillText.objects.bulk_create(texts)
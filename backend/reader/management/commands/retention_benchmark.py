@@ -0,0 +1,77 @@
+import gc
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reader.reader import READERS, ParseBudget, ResultRetention, parse_upload
+
+# Comportamiento previo a ResultRetention: el resultado completo, con el texto, queda en all_data
+PREVIOUS = 'anterior'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la memoria que retienen los readers en all_data al procesar muchas boletas, "
+        "con cada política de BILL_TEXT_RETENTION. Extrae los PDF de ejemplo una vez y repite "
+        "sus resultados, por lo que no mide el tiempo de pdfplumber"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bills', type=int, default=5000, help="Boletas simuladas")
+        parser.add_argument('--pdf-dir', default='reader/input', help="Carpeta con los PDF de ejemplo")
+
+    def handle(self, *args, **options):
+        samples = []
+        for pdf in sorted(Path(options['pdf_dir']).rglob('*.pdf')):
+            budget = ParseBudget()
+            provider, bill_data = budget.run(parse_upload, str(pdf), budget)
+            if provider is not None:
+                samples.append((provider, bill_data, bill_data.pop('complete_text').encode('utf-8')))
+        if not samples:
+            raise CommandError(f"No hay PDF reconocibles en {options['pdf_dir']}")
+
+        average_text = sum(len(text) for _, _, text in samples) / len(samples)
+        self.stdout.write(
+            f"{options['bills']} boletas a partir de {len(samples)} PDF de ejemplo "
+            f"(texto promedio {average_text / 1024:.1f} KiB)"
+        )
+        for mode in (PREVIOUS,) + ResultRetention.POLICIES:
+            with tempfile.TemporaryDirectory() as spill_dir:
+                elapsed, current, peak = self.measure(samples, options['bills'], mode, spill_dir)
+                disk = sum(path.stat().st_size for path in Path(spill_dir).iterdir())
+            self.stdout.write(
+                f"  {mode:<9} retenido={current / 2 ** 20:8.2f} MiB  pico={peak / 2 ** 20:8.2f} MiB  "
+                f"disco={disk / 2 ** 20:7.2f} MiB  {elapsed:.2f}s"
+            )
+
+    def measure(self, samples, bills, mode, spill_dir):
+        """
+        Retorna (segundos, bytes retenidos al final, bytes en el pico) de acumular `bills` resultados
+        en los readers tal como lo hace process_bill().
+        """
+        readers = {provider: READERS[provider]() for provider in READERS}
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        for index in range(bills):
+            provider, sample, text = samples[index % len(samples)]
+            extracted_data = dict(
+                sample,
+                file=f"{index}-{sample['file']}",
+                # Un texto nuevo por boleta, como al leer un PDF distinto
+                complete_text=text.decode('utf-8'),
+                charges=[dict(charge) for charge in sample.get('charges', [])],
+            )
+            extracted_data.pop('charges')
+            if mode == PREVIOUS:
+                readers[provider].all_data.append(extracted_data)
+            else:
+                extracted_data = ResultRetention.apply(extracted_data, mode, spill_dir)
+                readers[provider].all_data.append(ResultRetention.summary(extracted_data))
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, current, peak
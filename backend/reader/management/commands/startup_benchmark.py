@@ -0,0 +1,110 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Marca que separa las importaciones del inicio de las de la primera petición
+REQUEST_MARKER = '--- first request ---'
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+FIRST_REQUEST_SCRIPT = f"""
+import sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.test import Client
+setup_time = time.perf_counter() - start
+print({REQUEST_MARKER!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+response = Client(SERVER_NAME='localhost').generic(sys.argv[1], sys.argv[2])
+print(setup_time, time.perf_counter() - start, response.status_code)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tiempo de 'manage.py check' y de la primera petición en un proceso nuevo, "
+        "con el desglose de tiempo de importación por paquete"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help="Repeticiones de cada medición (se informa la mediana)")
+        parser.add_argument('--method', default='POST', help="Método de la primera petición")
+        parser.add_argument('--url', default='/api/reader/validate-batch-bills/', help="URL de la primera petición")
+        parser.add_argument('--top', type=int, default=10, help="Paquetes a mostrar en el desglose")
+
+    def handle(self, *args, **options):
+        manage_py = str(Path(settings.BASE_DIR) / 'manage.py')
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+
+        check_times = []
+        request_times = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            check = self.run_python(['-X', 'importtime', manage_py, 'check'], env)
+            check_times.append(time.perf_counter() - start)
+
+            request = self.run_python(
+                ['-X', 'importtime', '-c', FIRST_REQUEST_SCRIPT, options['method'], options['url']], env
+            )
+            setup_time, request_time, status_code = request.stdout.split()[-3:]
+            request_times.append((float(setup_time), float(request_time)))
+
+        self.stdout.write(f"manage.py check: {median(check_times):.3f}s (mediana de {options['runs']})")
+        self.print_breakdown(import_times(check.stderr), options['top'])
+
+        startup_imports, request_imports = request.stderr.split(REQUEST_MARKER, 1)
+        self.stdout.write(
+            f"\ndjango.setup(): {median([t[0] for t in request_times]):.3f}s, "
+            f"primera petición {options['method']} {options['url']} ({status_code}): "
+            f"{median([t[1] for t in request_times]):.3f}s"
+        )
+        self.stdout.write("Importaciones al iniciar:")
+        self.print_breakdown(import_times(startup_imports), options['top'])
+        self.stdout.write("Importaciones durante la primera petición:")
+        self.print_breakdown(import_times(request_imports), options['top'])
+
+        loaded = {match.group(4).split('.')[0] for match in map(IMPORT_LINE.match, request.stderr.splitlines()) if match}
+        heavy = [name for name in ('pandas', 'numpy', 'pdfplumber', 'openpyxl') if name in loaded]
+        self.stdout.write(f"\nDependencias pesadas cargadas: {', '.join(heavy) or 'ninguna'}")
+
+    def run_python(self, arguments, env):
+        result = subprocess.run(
+            [sys.executable] + arguments, cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr[-2000:])
+        return result
+
+    def print_breakdown(self, times, top):
+        total = sum(times.values())
+        self.stdout.write(f"  total {total / 1e6:.3f}s")
+        for package, microseconds in sorted(times.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {package:<30} {microseconds / 1e6:.3f}s")
+
+
+def import_times(stderr):
+    """
+    Suma el tiempo acumulado de las importaciones de primer nivel de la salida de -X importtime,
+    agrupado por paquete raíz.
+    """
+    times = defaultdict(int)
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        # Las importaciones anidadas están indentadas y ya se cuentan en su padre
+        if match and len(match.group(3)) == 1:
+            times[match.group(4).split('.')[0]] += int(match.group(2))
+    return times
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
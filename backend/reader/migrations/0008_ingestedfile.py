@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0007_bill_invoice_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('done', 'Done'), ('failed', 'Failed')], max_length=10)),
+                ('detail', models.TextField(blank=True, default='')),
+                ('processed_at', models.DateTimeField(auto_now=True)),
+                ('bill', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingested_files', to='reader.bill')),
+            ],
+        ),
+    ]
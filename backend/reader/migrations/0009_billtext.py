@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0008_ingestedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillText',
+            fields=[
+                ('bill', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='extracted_text', serialize=False, to='reader.bill')),
+                ('reader', models.CharField(max_length=20)),
+                ('pages', models.BinaryField()),
+            ],
+        ),
+    ]
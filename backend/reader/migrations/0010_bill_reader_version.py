@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0009_billtext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='reader',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='reader_version',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
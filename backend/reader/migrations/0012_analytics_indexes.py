@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bill',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='meter',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['year', 'month'], name='reader_bill_year_aef350_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meter',
+            index=models.Index(fields=['meter_type'], name='reader_mete_meter_t_ee80b4_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0012_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillAnomalyScore',
+            fields=[
+                ('bill', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='anomaly_score', serialize=False, to='reader.bill')),
+                ('consumption_z', models.FloatField(blank=True, null=True)),
+                ('total_z', models.FloatField(blank=True, null=True)),
+                ('consumption_yoy', models.FloatField(blank=True, null=True)),
+                ('total_yoy', models.FloatField(blank=True, null=True)),
+                ('flagged', models.BooleanField(db_index=True, default=False)),
+                ('scored_at', models.DateTimeField()),
+            ],
+        ),
+    ]
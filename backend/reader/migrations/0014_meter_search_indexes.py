@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Campos con búsqueda por prefijo en MeterListView
+SEARCH_FIELDS = ('client_number', 'name', 'macrozona', 'instalacion')
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Índices para istartswith, que en PostgreSQL se traduce a UPPER(campo::text) LIKE 'PREFIJO%'.
+    Requieren la misma expresión y text_pattern_ops, que los índices de Meta no permiten declarar
+    de forma portable; en otras bases de datos no se crean.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS reader_meter_{field}_prefix_idx '
+            f'ON reader_meter (UPPER({field}::text) text_pattern_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS reader_meter_{field}_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0013_billanomalyscore'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,4 +1,10 @@
+import json
+import zlib
+
 from django.db import models
+from django.utils import timezone
+
+from .versions import bump
 
 
 class Meter(models.Model):
@@ -15,6 +21,12 @@ class Meter(models.Model):
     
     # Campo deprecado pero mantenido para compatibilidad
     coverage = models.CharField(max_length=250, blank=True, default='')
+    # Última modificación
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Filtros y agrupaciones por tipo de medidor (writer.reports, writer.analytics)
+        indexes = [models.Index(fields=['meter_type'])]
 
     def __str__(self):
         return f"{self.name or self.instalacion or 'Sin nombre'} ({self.client_number})"
@@ -28,13 +40,28 @@ class Bill(models.Model):
     pdf_filename = models.CharField(max_length=255, null=True, blank=True, default=None)
     tarifa = models.CharField(max_length=100, blank=True, default='')  # Para facturas de electricidad
     invoice_number = models.CharField(max_length=50, blank=True, default='')  # Número de factura del PDF
+    # Reader y versión de sus extractores que derivaron los datos (ver comando reparse)
+    reader = models.CharField(max_length=20, blank=True, default='')
+    reader_version = models.IntegerField(null=True, blank=True)
+    # Última modificación de la boleta o de sus cargos (ver detect_anomalies)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = (('meter', 'month', 'year'),)
+        # Rangos de períodos de los reportes y el análisis, sin importar el medidor
+        indexes = [models.Index(fields=['year', 'month'])]
 
     def __str__(self):
         return f"Bill {self.month}/{self.year} - Meter {self.meter.name}"
 
+    @staticmethod
+    def touch(bill_ids):
+        """
+        Actualiza updated_at de las boletas cuyos cargos cambiaron. Charge.save() y delete() la
+        llaman; quien escribe cargos de forma masiva sin guardar la boleta debe llamarla.
+        """
+        Bill.objects.filter(pk__in=list(bill_ids)).update(updated_at=timezone.now())
+
 
 class Charge(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='charges')
@@ -44,4 +71,77 @@ class Charge(models.Model):
     charge = models.IntegerField()
 
     def __str__(self):
-        return f"{self.name} - Bill {self.bill.id}"
\ No newline at end of file
+        return f"{self.name} - Bill {self.bill.id}"
+
+    # Editar un cargo modifica su boleta (ver Bill.updated_at)
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Bill.touch([self.bill_id])
+
+    def delete(self, *args, **kwargs):
+        bill_id = self.bill_id
+        result = super().delete(*args, **kwargs)
+        Bill.touch([bill_id])
+        # Charge no tiene receptor de post_delete (ver reader.versions.connect_signals)
+        bump('charge')
+        return result
+
+class BillText(models.Model):
+    """
+    Texto extraído de cada página del PDF de una boleta, comprimido con zlib.
+    Permite volver a aplicar los extractores (comando reparse) sin leer los PDF.
+    """
+    bill = models.OneToOneField(Bill, on_delete=models.CASCADE, primary_key=True, related_name='extracted_text')
+    reader = models.CharField(max_length=20)  # Clave en reader.READERS
+    pages = models.BinaryField()
+
+    @staticmethod
+    def compress(pages) -> bytes:
+        return zlib.compress(json.dumps(pages, ensure_ascii=False).encode('utf-8'), 6)
+
+    @staticmethod
+    def decompress(data) -> list:
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    def __str__(self):
+        return f"Texto - Bill {self.bill_id}"
+
+
+class BillAnomalyScore(models.Model):
+    """
+    Comparación de una boleta con la historia de su medidor (comando detect_anomalies).
+    Los z-scores comparan el consumo y el total con la media y desviación de las boletas anteriores
+    del medidor; yoy es la variación respecto del mismo mes del año anterior. Quedan en None si no
+    hay historia suficiente.
+    """
+    bill = models.OneToOneField(Bill, on_delete=models.CASCADE, primary_key=True, related_name='anomaly_score')
+    consumption_z = models.FloatField(null=True, blank=True)
+    total_z = models.FloatField(null=True, blank=True)
+    consumption_yoy = models.FloatField(null=True, blank=True)
+    total_yoy = models.FloatField(null=True, blank=True)
+    flagged = models.BooleanField(default=False, db_index=True)
+    # Una boleta modificada después de esta fecha se vuelve a puntuar
+    scored_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Puntaje - Bill {self.bill_id}{' (anómala)' if self.flagged else ''}"
+
+
+class IngestedFile(models.Model):
+    """
+    Registro de los PDF procesados desde la carpeta de entrada (ingest_inbox).
+    El hash del contenido evita reprocesar un archivo tras un reinicio o si se deja de nuevo.
+    """
+    STATUS_CHOICES = (
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    sha256 = models.CharField(max_length=64, unique=True)
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    bill = models.ForeignKey(Bill, on_delete=models.SET_NULL, null=True, blank=True, related_name='ingested_files')
+    detail = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
@@ -1,26 +1,294 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
-import pdfplumber
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
 from pathlib import Path
-import pandas as pd
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from datetime import datetime
-from reader.models import Meter, Bill, Charge
+from functools import lru_cache
+from django.conf import settings
+from reader.ingest import upsert_bills
+from reader.models import BillText
+
+logger = logging.getLogger(__name__)
+
+# Abreviaturas de meses aceptadas en las fechas dd-MMM-yyyy (español e inglés)
+MONTH_ABBREVIATIONS = {
+    'ENE': 1, 'FEB': 2, 'MAR': 3, 'ABR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AGO': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DIC': 12,
+    'JAN': 1, 'APR': 4, 'AUG': 8, 'DEC': 12,
+}
+
+# Nombres completos de meses en español
+MONTH_NAMES_ES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
+    'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
+    'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12
+}
+
+
+class ParseTimeout(Exception):
+    """
+    Se lanza cuando el procesamiento de una boleta excede su presupuesto de tiempo.
+    Indica el extractor que consumió más tiempo.
+    """
+
+    def __init__(self, elapsed: float, limit: float, timings: Dict[str, float]):
+        self.elapsed = elapsed
+        self.limit = limit
+        self.timings = dict(timings)
+        self.extractor = max(self.timings, key=self.timings.get) if self.timings else None
+        super().__init__(
+            f"Tiempo de procesamiento excedido ({elapsed:.1f}s de {limit}s), "
+            f"principalmente en {self.extractor}"
+        )
+
+    def __reduce__(self):
+        # Permite enviar la excepción entre procesos (ingest_inbox)
+        return ParseTimeout, (self.elapsed, self.limit, self.timings)
+
+
+PARSE_THREAD_PREFIX = 'bill-parse'
+
+
+@lru_cache(maxsize=None)
+def get_parse_executor() -> ThreadPoolExecutor:
+    """
+    Pool acotado de hilos donde se extrae el texto y se aplican los extractores de cada PDF.
+    """
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, 'BILL_PARSE_WORKERS', 4),
+        thread_name_prefix=PARSE_THREAD_PREFIX,
+    )
+
+
+class ParseBudget:
+    """
+    Presupuesto de tiempo para procesar un archivo PDF (BILL_PARSE_TIMEOUT_SECONDS).
+
+    El trabajo se ejecuta con run() en el pool de procesamiento y quien lo llama espera
+    como máximo el tiempo restante, de modo que un extractor atascado nunca bloquea la
+    petición. Cada paso se mide con track(), que verifica el plazo antes y después del paso.
+
+    Un hilo no se puede interrumpir: al agotarse el plazo el hilo de trabajo sigue ocupado hasta
+    que termina el paso en curso (una expresión regular no cede el control antes) y recién ahí se
+    detiene, sin ejecutar los pasos siguientes. Los trabajos que aún esperaban en la cola del pool
+    se cancelan, para que no ocupen un hilo cuando ya nadie espera su resultado.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        if seconds is None:
+            seconds = getattr(settings, 'BILL_PARSE_TIMEOUT_SECONDS', 30)
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.timings = {}
+        self.running_step = None  # (nombre, inicio) del paso en ejecución
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> Optional[float]:
+        if not self.seconds:
+            return None
+        return max(self.seconds - self.elapsed(), 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Tiempos por paso, incluyendo el paso que aún está en ejecución.
+        """
+        timings = dict(self.timings)
+        running_step = self.running_step
+        if running_step is not None:
+            step, step_started = running_step
+            timings[step] = timings.get(step, 0.0) + time.monotonic() - step_started
+        if not timings:
+            # Nada alcanzó a ejecutarse: el archivo esperó en la cola del pool
+            timings['queue'] = self.elapsed()
+        return timings
+
+    def timeout_error(self) -> ParseTimeout:
+        return ParseTimeout(self.elapsed(), self.seconds, self.snapshot())
+
+    def check(self):
+        if self.seconds and self.elapsed() > self.seconds:
+            raise self.timeout_error()
+
+    @contextmanager
+    def track(self, step: str):
+        """
+        Mide el tiempo de un paso y verifica el presupuesto antes de empezarlo y al terminar.
+        """
+        self.check()
+        start = time.monotonic()
+        self.running_step = (step, start)
+        try:
+            yield
+        finally:
+            self.timings[step] = self.timings.get(step, 0.0) + time.monotonic() - start
+            self.running_step = None
+        self.check()
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn en el pool de procesamiento esperando como máximo el tiempo restante.
+        Si se agota lanza ParseTimeout sin esperar a fn: si fn aún no empezaba se cancela y si no,
+        el hilo sigue ocupado hasta el próximo track() de fn.
+        """
+        if threading.current_thread().name.startswith(PARSE_THREAD_PREFIX):
+            # Ya estamos en un hilo del pool: ejecutar en línea para no agotar el pool
+            return fn(*args, **kwargs)
+
+        future = get_parse_executor().submit(self.call, fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.remaining())
+        except FutureTimeoutError:
+            future.cancel()
+            raise self.log_timeout(fn)
+
+    async def arun(self, fn, *args, **kwargs):
+        """
+        Igual que run(), para vistas async: la espera no bloquea el event loop.
+        """
+        future = get_parse_executor().submit(self.call, fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.remaining())
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise self.log_timeout(fn)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn en el hilo del pool, salvo que el plazo se haya agotado mientras esperaba en la cola.
+        """
+        self.check()
+        return fn(*args, **kwargs)
+
+    def log_timeout(self, fn) -> ParseTimeout:
+        error = self.timeout_error()
+        logger.warning("%s: %s (%s)", getattr(fn, '__qualname__', fn), error, self.format_timings(error.timings))
+        return error
+
+    @staticmethod
+    def format_timings(timings: Dict[str, float]) -> str:
+        return ", ".join(f"{step}={seconds:.3f}s" for step, seconds in timings.items())
+
+    def log(self, file_pdf: str):
+        logger.info("Boleta %s procesada en %.3fs: %s", file_pdf, self.elapsed(), self.format_timings(self.timings))
+
+
+class ResultRetention:
+    """
+    Qué conservan los readers de cada boleta procesada, según BILL_TEXT_RETENTION:
+    - drop: se descarta el texto completo.
+    - spill: el texto se escribe comprimido en BILL_TEXT_SPILL_DIR y el resultado guarda su ruta en 'text_path'.
+    - keep: el resultado conserva el texto completo (para depurar pocos archivos).
+    all_data acumula solo el resumen de cada boleta, de modo que su tamaño no depende del texto.
+    El texto por página ('pages') no depende de la política: solo se retorna cuando se guardará con
+    la boleta (ver validate_bill()).
+    """
+    POLICIES = ('drop', 'spill', 'keep')
+    SUMMARY_FIELDS = (
+        'file', 'client_number', 'account_number', 'invoice_number',
+        'total_amount', 'month', 'year', 'month_year', 'text_path',
+    )
+
+    @classmethod
+    def policy(cls, policy: Optional[str] = None) -> str:
+        policy = policy or getattr(settings, 'BILL_TEXT_RETENTION', 'drop')
+        if policy not in cls.POLICIES:
+            raise ValueError(f"Política de retención desconocida: {policy}")
+        return policy
+
+    @classmethod
+    def apply(cls, extracted_data: dict, policy: Optional[str] = None, spill_dir: Optional[str] = None) -> dict:
+        """
+        Aplica la política al texto completo del resultado de parse_bill().
+        """
+        policy = cls.policy(policy)
+        if policy == 'keep' or 'complete_text' not in extracted_data:
+            return extracted_data
+
+        complete_text = extracted_data.pop('complete_text')
+        if policy == 'spill':
+            spill_dir = spill_dir or settings.BILL_TEXT_SPILL_DIR
+            os.makedirs(spill_dir, exist_ok=True)
+            name = hashlib.sha1(str(extracted_data.get('file', '')).encode()).hexdigest()
+            text_path = os.path.join(spill_dir, f"{name}.txt.gz")
+            with gzip.open(text_path, 'wt', compresslevel=6, encoding='utf-8') as text_file:
+                text_file.write(complete_text)
+            extracted_data['text_path'] = text_path
+        return extracted_data
+
+    @classmethod
+    def summary(cls, extracted_data: dict) -> dict:
+        return {field: extracted_data[field] for field in cls.SUMMARY_FIELDS if field in extracted_data}
+
+
+def extract_pdf_pages(file_pdf: str, budget: Optional[ParseBudget] = None, max_pages: Optional[int] = None) -> List[str]:
+    """
+    Extrae el texto de cada página del PDF, verificando el presupuesto de tiempo después de cada página.
+    """
+    budget = budget or ParseBudget()
+    pages = []
+    with budget.track('pdf_text'):
+        # pdfplumber se importa al leer el primer PDF para no cargarlo al iniciar Django
+        import pdfplumber
+
+        with pdfplumber.open(file_pdf) as pdf:
+            for page in pdf.pages[:max_pages]:
+                pages.append(page.extract_text() or "")
+                budget.check()
+    return pages
+
+
+def join_pages(pages: List[str]) -> str:
+    """
+    Texto completo de la boleta a partir del texto de sus páginas.
+    """
+    return "".join(text + "\n" for text in pages if text)
+
+
+def extract_pdf_text(file_pdf: str, budget: Optional[ParseBudget] = None, max_pages: Optional[int] = None) -> str:
+    return join_pages(extract_pdf_pages(file_pdf, budget, max_pages))
+
+
+def find_section(text: str, anchors: List[str], end_pattern: str, flags: int = 0) -> Optional[str]:
+    """
+    Retorna el texto entre el final de la secuencia de `anchors` y la primera aparición de `end_pattern`.
+    Equivale a re.search(r'A1.*?A2.*?(.*?)(?:END)', text, re.DOTALL) pero buscando cada ancla una sola
+    vez desde la posición anterior, sin backtracking sobre todo el documento.
+    """
+    position = 0
+    for anchor in anchors:
+        anchor_match = re.compile(anchor, flags).search(text, position)
+        if not anchor_match:
+            return None
+        position = anchor_match.end()
+
+    end_match = re.compile(end_pattern, flags).search(text, position)
+    if not end_match:
+        return None
+    return text[position:end_match.start()]
+
 
 class BillDetector:
     @staticmethod
-    def detect_provider(file_path: str) -> str:
+    def detect_provider(file_path: str, budget: Optional[ParseBudget] = None) -> str:
         """
         Detect whether the bill is from Enel (electricity) or Aguas Andinas (water).
         Returns: "enel", "aguas", or "unknown"
         """
+        budget = budget or ParseBudget()
         try:
-            with pdfplumber.open(file_path) as pdf:
-                text = ""
-                for page in pdf.pages[:2]:  # leer solo primeras páginas, más rápido
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text.lower()
+            # leer solo primeras páginas, más rápido
+            text = budget.run(extract_pdf_text, file_path, budget, max_pages=2).lower()
 
             if "agua" in text or "Agua" in text or "AGUA" in text:
                 return "aguas"
@@ -28,13 +296,296 @@ class BillDetector:
                 return "enel"
             return "unknown"
 
+        except ParseTimeout:
+            raise
         except Exception:
             return "unknown"
 
-class AguasAndinasReader:
+
+@lru_cache(maxsize=1024)
+def parse_date_token(token: str) -> Optional[datetime]:
+    """
+    Convierte un token de fecha 'dd-MMM-yyyy' (meses en español o inglés) o 'dd/mm/yyyy'
+    a datetime. Retorna None si el token no corresponde a una fecha válida.
+    """
+    token = token.upper()
+    try:
+        if '/' in token:
+            day, month, year = token.split('/')
+            month = int(month)
+        else:
+            day, month_abbr, year = token.split('-')
+            month = MONTH_ABBREVIATIONS.get(month_abbr)
+            if month is None:
+                return None
+        return datetime(int(year), month, int(day))
+    except ValueError:
+        return None
+
+
+class ReadingDateResolver:
+    """
+    Determina el mes/año de una boleta de agua a partir de las fechas del texto.
+    Recorre el texto una sola vez buscando todas las etiquetas de fecha y elige
+    el candidato de mayor prioridad. Ninguna expresión cruza el documento con
+    backtracking, por lo que el tiempo es lineal aun en PDFs mal formados.
+    """
+
+    LABEL_PATTERN = re.compile(
+        r'(?=(LECTURA ACTUAL|Periodo de Lectura|FECHA ESTIMADA PRÓXIMA LECTURA|FECHA EMISIÓN:|VENCIMIENTO)(\s*))',
+        re.IGNORECASE
+    )
+    DATE_PATTERN = re.compile(r'\d{2}-[A-Z]{3}-\d{4}|\d{2}/\d{2}/\d{4}', re.IGNORECASE)
+    NAMED_DATE_PATTERN = re.compile(r'\d{2}-[A-Z]{3}-\d{4}', re.IGNORECASE)
+    MONTH_YEAR_PATTERN = re.compile(
+        r'(Enero|Febrero|Marzo|Abril|Mayo|Junio|Julio|Agosto|Septiembre|Octubre|Noviembre|Diciembre)\s+(\d{4})',
+        re.IGNORECASE
+    )
+
+    # Etiquetas que exigen al menos un espacio antes de la fecha
+    LABELS_REQUIRING_SPACE = {'FECHA ESTIMADA PRÓXIMA LECTURA', 'VENCIMIENTO'}
+
+    # (etiqueta, formato de fecha, meses a restar) en orden de prioridad.
+    # Próxima lectura y vencimiento caen dos meses después del período facturado.
+    PRIORITY_RULES = [
+        ('LECTURA ACTUAL', 'named', 1),        # 01-AGO-2024
+        ('LECTURA ACTUAL', 'numeric', 1),      # 01/08/2024
+        ('PERIODO DE LECTURA', 'named', 1),    # Primera fecha después de la etiqueta
+        ('FECHA ESTIMADA PRÓXIMA LECTURA', 'named', 2),
+        ('FECHA EMISIÓN:', 'named', 1),
+        ('VENCIMIENTO', 'named', 2),
+    ]
+
+    @classmethod
+    def find_candidates(cls, text: str) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Retorna los tokens de fecha encontrados para cada (etiqueta, formato),
+        en orden de aparición.
+        """
+        candidates = {}
+        periodo_end = None
+
+        for label_match in cls.LABEL_PATTERN.finditer(text):
+            label = label_match.group(1).upper()
+
+            if label == 'PERIODO DE LECTURA':
+                # Solo importa la primera aparición: la fecha es la siguiente del texto
+                if periodo_end is None:
+                    periodo_end = label_match.end(1)
+                continue
+
+            if label in cls.LABELS_REQUIRING_SPACE and not label_match.group(2):
+                continue
+
+            date_match = cls.DATE_PATTERN.match(text, label_match.end(2))
+            if date_match:
+                token = date_match.group(0)
+                kind = 'numeric' if '/' in token else 'named'
+                candidates.setdefault((label, kind), []).append(token)
+
+        if periodo_end is not None:
+            date_match = cls.NAMED_DATE_PATTERN.search(text, periodo_end)
+            if date_match:
+                candidates[('PERIODO DE LECTURA', 'named')] = [date_match.group(0)]
+
+        return candidates
+
+    @staticmethod
+    def shift_month(month: int, year: int, months_back: int) -> Tuple[int, int]:
+        """
+        Resta meses a un (mes, año), ajustando el año si corresponde.
+        """
+        month -= months_back
+        while month <= 0:
+            month += 12
+            year -= 1
+        return month, year
+
+    @classmethod
+    def resolve(cls, text: str) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Retorna (mes, año) de la boleta o (None, None) si no se encuentra ninguna fecha.
+        """
+        candidates = cls.find_candidates(text)
+
+        # Si una aparición no es una fecha válida se prueban las siguientes
+        for label, kind, months_back in cls.PRIORITY_RULES:
+            for token in candidates.get((label, kind), []):
+                reading_date = parse_date_token(token)
+                if reading_date:
+                    return cls.shift_month(reading_date.month, reading_date.year, months_back)
+
+        # Si no se encuentra la fecha de lectura, buscar mes en texto
+        # y también restar un mes (mismo comportamiento que con fecha de lectura)
+        month_year_match = cls.MONTH_YEAR_PATTERN.search(text)
+        if month_year_match:
+            found_month = MONTH_NAMES_ES[month_year_match.group(1).lower()]
+            return cls.shift_month(found_month, int(month_year_match.group(2)), 1)
+
+        return None, None
+
+
+class BillReader:
+    """
+    Flujo común de los readers: extraer el texto del PDF, aplicar los extractores del proveedor,
+    validar los campos requeridos y guardar la boleta. Cada proveedor define PROVIDER, VERSION,
+    METER_TYPE, extract_info_from_text() y en CHARGE_EXTRACTORS los métodos que extraen sus cargos.
+    """
+    PROVIDER = None
+    VERSION = None
+    METER_TYPE = None
+    CHARGE_EXTRACTORS = ()
+    MISSING_MONTH = "No se pudo extraer el mes del PDF"
+
     def __init__(self):
         self.all_data = []
 
+    @staticmethod
+    def extract_info_from_text(text: str, file_pdf: str) -> dict:
+        raise NotImplementedError
+
+    def parse_bill(self, file_pdf: str, budget: ParseBudget) -> dict:
+        """
+        Extrae la información y todos los cargos de la boleta sin tocar la base de datos.
+        Se ejecuta en el pool de procesamiento mediante ParseBudget.run().
+        """
+        pages = extract_pdf_pages(file_pdf, budget)
+        extracted_data = self.parse_text(join_pages(pages), file_pdf, budget)
+        # El texto por página se guarda con la boleta (BillText) para el comando reparse
+        extracted_data['pages'] = pages
+        return extracted_data
+
+    def parse_text(self, complete_text: str, file_pdf: str, budget: Optional[ParseBudget] = None) -> dict:
+        """
+        Aplica los extractores al texto completo de la boleta.
+        """
+        budget = budget or ParseBudget()
+
+        # Extract specific information
+        with budget.track('extract_info_from_text'):
+            extracted_data = self.extract_info_from_text(complete_text, file_pdf)
+
+        charges = []
+        for extractor in self.CHARGE_EXTRACTORS:
+            with budget.track(extractor):
+                charges += getattr(self, extractor)(complete_text)
+
+        extracted_data['charges'] = charges
+        extracted_data['complete_text'] = complete_text
+        extracted_data['reader'] = self.PROVIDER
+        extracted_data['reader_version'] = self.VERSION
+        return extracted_data
+
+    def check_required(self, extracted_data: dict):
+        """
+        Valida que parse_bill() haya extraído los campos necesarios para guardar la boleta.
+        """
+        if not extracted_data.get('client_number'):
+            raise ValueError("No se pudo extraer el número de cliente del PDF")
+        if extracted_data.get('month') is None:
+            raise ValueError(self.MISSING_MONTH)
+        if extracted_data.get('year') is None:
+            raise ValueError("No se pudo extraer el año del PDF")
+        if extracted_data.get('total_amount') is None:
+            raise ValueError("No se pudo extraer el monto total del PDF")
+
+    def save_bill(self, extracted_data: dict, pdf_filename: Optional[str] = None, policy: Optional[str] = None) -> dict:
+        """
+        Guarda el medidor, la boleta y sus cargos a partir de los datos de parse_bill().
+        Si la boleta del período ya existe se aplica la política de conflicto (ver reader.ingest).
+        """
+        self.check_required(extracted_data)
+        return upsert_bills([{
+            'provider': self.PROVIDER,
+            'meter_type': self.METER_TYPE,
+            'bill_data': extracted_data,
+            'pdf_filename': pdf_filename,
+        }], policy)[0]
+
+    def process_bill(self, file_pdf: str, budget: Optional[ParseBudget] = None) -> dict:
+        """
+        Procesa y guarda una boleta PDF del proveedor.
+        Lanza ParseTimeout si se agota el presupuesto de tiempo del archivo.
+        """
+        print(f"Processing bill: {file_pdf}")
+        budget = budget or ParseBudget()
+
+        try:
+            # Toda la extracción ocurre antes de escribir en la base de datos,
+            # así una boleta que agota su tiempo no queda guardada a medias.
+            extracted_data = budget.run(self.parse_bill, file_pdf, budget)
+            budget.log(file_pdf)
+
+            self.save_bill(extracted_data)
+            extracted_data.pop('charges')
+            extracted_data.pop('pages')
+            extracted_data = ResultRetention.apply(extracted_data)
+
+            # Solo el resumen de la boleta queda en la lista de procesadas
+            self.all_data.append(ResultRetention.summary(extracted_data))
+
+            return extracted_data
+
+        except ParseTimeout:
+            raise
+        except Exception as e:
+            print(f"Error processing bill {file_pdf}: {e}")
+            return {}
+
+    def process_multiple_bills(self, pdf_files: list):
+        """
+        Process multiple PDF files
+        """
+        for pdf_file in pdf_files:
+            self.process_bill(pdf_file)
+
+    def clear_data(self):
+        """
+        Clear all stored data
+        """
+        self.all_data = []
+        print("All data cleared")
+
+    def validate_bill(self, file_pdf: str, budget: Optional[ParseBudget] = None, keep_pages: bool = False) -> dict:
+        """
+        Extrae la información relevante de la boleta sin crear instancias en la base de datos.
+        El texto por página solo se retorna con keep_pages=True, ya comprimido para BillText
+        en 'pages_compressed', para quien lo guardará con la boleta.
+        Lanza ParseTimeout si se agota el presupuesto de tiempo del archivo.
+        """
+        budget = budget or ParseBudget()
+        try:
+            extracted_data = budget.run(self.parse_bill, file_pdf, budget)
+            budget.log(file_pdf)
+            pages = extracted_data.pop('pages')
+            if keep_pages:
+                extracted_data['pages_compressed'] = BillText.compress(pages)
+            return ResultRetention.apply(extracted_data)
+        except ParseTimeout:
+            raise
+        except Exception as e:
+            print(f"Error validating bill {file_pdf}: {e}")
+            return {}
+
+
+class AguasAndinasReader(BillReader):
+    PROVIDER = 'aguas'
+    # Aumentar al cambiar un extractor: reparse --outdated vuelve a derivar las boletas anteriores
+    VERSION = 1
+    METER_TYPE = 'WATER'
+    CHARGE_EXTRACTORS = (
+        # Cargos principales (cuadro superior)
+        'extract_main_charges',
+        # Tarifas unitarias (cuadro aguas informa)
+        'extract_unit_rates',
+        # Detalles de consumo (cuadro inferior izquierdo)
+        'extract_consumption_details',
+    )
+    MISSING_MONTH = (
+        "No se pudo extraer el mes del PDF. Verifique que el PDF contenga la fecha de lectura "
+        "o el período de facturación."
+    )
+
     @staticmethod
     def extract_main_charges(text: str) -> list:
         """
@@ -46,14 +597,13 @@ class AguasAndinasReader:
         
         # Extraer la sección de cargos (entre VENCIMIENTO y "El valor neto")
         # Esto incluye cargos antes y después de "TOTAL VENTA" (como descuentos)
-        charge_section_match = re.search(
-            r'VENCIMIENTO.*?TOTAL A PAGAR.*?\n(.*?)(?:El valor neto|Acogido Pago|Los valores con IVA)',
+        charge_section = find_section(
             text,
-            re.DOTALL
+            [r'VENCIMIENTO', r'TOTAL A PAGAR', r'\n'],
+            r'El valor neto|Acogido Pago|Los valores con IVA'
         )
         
-        if charge_section_match:
-            charge_section = charge_section_match.group(1)
+        if charge_section is not None:
             
             # Patrones dinámicos para capturar cargos
             # Formato 1: NOMBRE (con paréntesis) valor1 valor2 o solo valor
@@ -112,14 +662,13 @@ class AguasAndinasReader:
         rates = []
         
         # Buscar la sección de tarifas (desde "Los valores con IVA" hasta "Plantas de Tratamiento" o similar)
-        rate_section_match = re.search(
-            r'Los valores con IVA.*?son los siguientes:(.*?)(?:Plantas de Tratamiento|LECTURA ACTUAL|Corte o Reposición)',
+        rate_section = find_section(
             text,
-            re.DOTALL
+            [r'Los valores con IVA', r'son los siguientes:'],
+            r'Plantas de Tratamiento|LECTURA ACTUAL|Corte o Reposición'
         )
         
-        if rate_section_match:
-            rate_section = rate_section_match.group(1)
+        if rate_section is not None:
             
             # Patrón para capturar tarifas en formato: "descripción = $ valor"
             rate_pattern = r'([A-Za-zÁÉÍÓÚáéíóúñÑ][A-Za-zÁÉÍÓÚáéíóúñÑ\s\d°]+?)\s*[=:]\s*\$\s*([\d.,]+)'
@@ -266,94 +815,9 @@ class AguasAndinasReader:
             data_tmp['client_number'] = account_match.group(1)
 
         # Extract Current Reading Date and calculate month/year
-        # Intentar múltiples patrones para encontrar la fecha
-        reading_date_patterns = [
-            r'LECTURA ACTUAL\s*(\d{2}-[A-Z]{3}-\d{4})',  # 01-AGO-2024
-            r'LECTURA ACTUAL\s*(\d{2}/\d{2}/\d{4})',     # 01/08/2024
-            r'LECTURA ACTUAL\s+(\d{2}-[A-Za-z]{3}-\d{4})',  # Variante con mayúsculas/minúsculas
-            r'Periodo de Lectura.*?(\d{2}-[A-Z]{3}-\d{4})',  # Buscar en período
-            r'LECTURA ANTERIOR\s*\d{2}-[A-Z]{3}-\d{4}\s*[\d.,]+\s*m3.*?LECTURA ACTUAL\s*(\d{2}-[A-Z]{3}-\d{4})',
-            r'FECHA ESTIMADA PRÓXIMA LECTURA\s+(\d{2}-[A-Z]{3}-\d{4})',  # Próxima lectura (restar 2 meses)
-            r'FECHA EMISIÓN:\s*(\d{2}-[A-Z]{3}-\d{4})',  # Fecha de emisión
-            r'VENCIMIENTO\s+(\d{2}-[A-Z]{3}-\d{4})',  # Fecha de vencimiento (restar 1 mes)
-        ]
-        
-        reading_date = None
-        is_next_reading = False  # Flag para saber si es fecha de próxima lectura
-        
-        for pattern in reading_date_patterns:
-            reading_date_match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-            if reading_date_match:
-                reading_date_str = reading_date_match.group(1).upper()  # Normalizar a mayúsculas
-                
-                # Detectar si necesita restar 2 meses (próxima lectura o vencimiento)
-                if 'PRÓXIMA LECTURA' in pattern or 'VENCIMIENTO' in pattern:
-                    is_next_reading = True
-                
-                # Primero intentar convertir meses en español a inglés
-                month_map_es = {
-                    'ENE': 'JAN', 'FEB': 'FEB', 'MAR': 'MAR', 'ABR': 'APR',
-                    'MAY': 'MAY', 'JUN': 'JUN', 'JUL': 'JUL', 'AGO': 'AUG',
-                    'SEP': 'SEP', 'OCT': 'OCT', 'NOV': 'NOV', 'DIC': 'DEC'
-                }
-                reading_date_str_converted = reading_date_str
-                for es, en in month_map_es.items():
-                    if es in reading_date_str:
-                        reading_date_str_converted = reading_date_str.replace(es, en)
-                        break
-                
-                # Intentar parsear con formato dd-MMM-yyyy (ahora con meses convertidos a inglés)
-                try:
-                    reading_date = datetime.strptime(reading_date_str_converted, '%d-%b-%Y')
-                    break
-                except ValueError:
-                    pass
-                
-                # Intentar parsear con formato dd/mm/yyyy
-                try:
-                    reading_date = datetime.strptime(reading_date_str_converted, '%d/%m/%Y')
-                    break
-                except ValueError:
-                    pass
-        
-        if reading_date:
-            # Si es fecha de próxima lectura, restar 2 meses; si es lectura actual, restar 1 mes
-            months_to_subtract = 2 if is_next_reading else 1
-            
-            # Calcular el mes correspondiente a la factura
-            target_month = reading_date.month - months_to_subtract
-            target_year = reading_date.year
-            
-            # Ajustar si el mes es negativo o cero
-            while target_month <= 0:
-                target_month += 12
-                target_year -= 1
-            
-            data_tmp['month'] = target_month
-            data_tmp['year'] = target_year
-        else:
-            # Si no se encuentra la fecha de lectura, buscar mes en texto
-            # y también restar un mes (mismo comportamiento que con fecha de lectura)
-            month_year_match = re.search(r'(Enero|Febrero|Marzo|Abril|Mayo|Junio|Julio|Agosto|Septiembre|Octubre|Noviembre|Diciembre)\s+(\d{4})', text, re.IGNORECASE)
-            if month_year_match:
-                month_names_es = {
-                    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
-                    'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
-                    'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12
-                }
-                month_name = month_year_match.group(1).lower()
-                found_year = int(month_year_match.group(2))
-                found_month = month_names_es.get(month_name)
-                
-                # Restar un mes (mismo comportamiento que con fecha de lectura)
-                previous_month = found_month - 1 if found_month > 1 else 12
-                year = found_year if previous_month != 12 else found_year - 1
-                
-                data_tmp['month'] = previous_month
-                data_tmp['year'] = year
-            else:
-                data_tmp['month'] = None
-                data_tmp['year'] = None
+        month, year = ReadingDateResolver.resolve(text)
+        data_tmp['month'] = month
+        data_tmp['year'] = year
 
         # Extract Total to Pay
         total_match = re.search(r'TOTAL A PAGAR\s*\$\s*([\d.,]+)', text)
@@ -369,95 +833,6 @@ class AguasAndinasReader:
 
         return data_tmp
 
-    def process_bill(self, file_pdf: str) -> dict:
-        """
-        Process a PDF bill from Aguas Andinas and extract relevant information.
-        """
-        print(f"Processing bill: {file_pdf}")
-
-        try:
-            with pdfplumber.open(file_pdf) as pdf:
-                complete_text = ""
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        complete_text += text + "\n"
-
-            # Extract specific information
-            extracted_data = self.extract_info_from_text(complete_text, file_pdf)
-
-            # Validar campos requeridos
-            if not extracted_data.get('client_number'):
-                raise ValueError("No se pudo extraer el número de cliente del PDF")
-            if extracted_data.get('month') is None:
-                raise ValueError("No se pudo extraer el mes del PDF. Verifique que el PDF contenga la fecha de lectura o el período de facturación.")
-            if extracted_data.get('year') is None:
-                raise ValueError("No se pudo extraer el año del PDF")
-            if extracted_data.get('total_amount') is None:
-                raise ValueError("No se pudo extraer el monto total del PDF")
-
-            # Retrieve or create the Meter
-            meter, _ = Meter.objects.get_or_create(
-                client_number=extracted_data['client_number'],
-                defaults={
-                    'name': f"Meter {extracted_data['client_number']}",
-                    'meter_type': 'WATER',
-                    'coverage': 'Unknown',
-                }
-            )
-
-            # Create the Bill
-            bill = Bill.objects.create(
-                meter=meter,
-                month=extracted_data['month'],
-                year=extracted_data['year'],
-                total_to_pay=extracted_data['total_amount'],
-                invoice_number=extracted_data.get('invoice_number', ''),
-            )
-
-            # Extraer y guardar todos los cargos principales (cuadro superior)
-            main_charges = self.extract_main_charges(complete_text)
-            for charge_data in main_charges:
-                Charge.objects.create(
-                    bill=bill,
-                    name=charge_data['name'],
-                    value=charge_data['value'],
-                    value_type=charge_data['value_type'],
-                    charge=charge_data['charge'],
-                )
-
-            # Extraer y guardar las tarifas unitarias (cuadro aguas informa)
-            unit_rates = self.extract_unit_rates(complete_text)
-            for rate_data in unit_rates:
-                Charge.objects.create(
-                    bill=bill,
-                    name=rate_data['name'],
-                    value=rate_data['value'],
-                    value_type=rate_data['value_type'],
-                    charge=rate_data['charge'],
-                )
-
-            # Extraer y guardar los detalles de consumo (cuadro inferior izquierdo)
-            consumption_details = self.extract_consumption_details(complete_text)
-            for detail_data in consumption_details:
-                Charge.objects.create(
-                    bill=bill,
-                    name=detail_data['name'],
-                    value=detail_data['value'],
-                    value_type=detail_data['value_type'],
-                    charge=detail_data['charge'],
-                )
-
-            # Add to the list of all processed bills
-            extracted_data['complete_text'] = complete_text
-            self.all_data.append(extracted_data)
-
-            return extracted_data
-
-        except Exception as e:
-            print(f"Error processing bill {file_pdf}: {e}")
-            return {}
-
     def export_to_excel(self, output_filename: str = "aguas_andinas_bills.xlsx"):
         """
         Export all processed data to an Excel file
@@ -471,7 +846,8 @@ class AguasAndinasReader:
             output_dir = Path("output")
             output_dir.mkdir(exist_ok=True)
 
-            # Create DataFrame
+            # Create DataFrame (pandas solo se usa al exportar)
+            import pandas as pd
             df = pd.DataFrame(self.all_data)
 
             # Select and order relevant columns
@@ -492,41 +868,19 @@ class AguasAndinasReader:
             print(f"Error exporting to Excel: {e}")
             return False
 
-    def process_multiple_bills(self, pdf_files: list):
-        """
-        Process multiple PDF files
-        """
-        for pdf_file in pdf_files:
-            self.process_bill(pdf_file)
-
-    def clear_data(self):
-        """
-        Clear all stored data
-        """
-        self.all_data = []
-        print("All data cleared")
 
-    def validate_bill(self, file_pdf: str) -> dict:
-        """
-        Extrae la información relevante de la boleta sin crear instancias en la base de datos.
-        """
-        try:
-            with pdfplumber.open(file_pdf) as pdf:
-                complete_text = ""
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        complete_text += text + "\n"
-            extracted_data = self.extract_info_from_text(complete_text, file_pdf)
-            extracted_data['complete_text'] = complete_text
-            return extracted_data
-        except Exception as e:
-            print(f"Error validating bill {file_pdf}: {e}")
-            return {}
-
-class EnelReader:
-    def __init__(self):
-        self.all_data = []
+class EnelReader(BillReader):
+    PROVIDER = 'enel'
+    # Aumentar al cambiar un extractor: reparse --outdated vuelve a derivar las boletas anteriores
+    VERSION = 1
+    METER_TYPE = 'ELECTRICITY'
+    CHARGE_EXTRACTORS = (
+        # Cargos de electricidad
+        'extract_electricity_charges',
+        # Totales (Monto Neto, IVA, etc.)
+        'extract_electricity_summary',
+    )
+    MISSING_MONTH = "No se pudo extraer el mes del PDF. Verifique que el PDF contenga el período de lectura."
 
     @staticmethod
     def extract_info_from_text(text: str, file_pdf: str) -> dict:
@@ -667,14 +1021,14 @@ class EnelReader:
         
         # Buscar la sección de cargos (entre datos de medidor y totales)
         # Típicamente después de "CLUB HIPICO" o datos de medidores y antes de "Total Monto Neto"
-        charge_section_match = re.search(
-            r'(?:CLUB HIPICO|AVD TUPPER|Dirección suministro).*?\n(.*?)(?:Total Monto Neto|\d+-[\dkK]\s+[\d,]+\s+[\d,]+\s+\d+\s+\d+-\d+-\d+)',
+        charge_section = find_section(
             text,
-            re.DOTALL | re.IGNORECASE
+            [r'CLUB HIPICO|AVD TUPPER|Dirección suministro', r'\n'],
+            r'Total Monto Neto|\d+-[\dkK]\s+[\d,]+\s+[\d,]+\s+\d+\s+\d+-\d+-\d+',
+            re.IGNORECASE
         )
         
-        if charge_section_match:
-            charge_section = charge_section_match.group(1)
+        if charge_section is not None:
             
             for line in charge_section.split('\n'):
                 line = line.strip()
@@ -768,106 +1122,30 @@ class EnelReader:
         
         return summary
 
-    def process_bill(self, file_pdf: str) -> dict:
-        """
-        Process a PDF bill from Enel and extract relevant information.
-        """
-        print(f"Processing bill: {file_pdf}")
-
-        try:
-            with pdfplumber.open(file_pdf) as pdf:
-                complete_text = ""
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        complete_text += text + "\n"
-
-            # Extract specific information
-            extracted_data = self.extract_info_from_text(complete_text, file_pdf)
 
-            # Validar campos requeridos
-            if not extracted_data.get('client_number'):
-                raise ValueError("No se pudo extraer el número de cliente del PDF")
-            if extracted_data.get('month') is None:
-                raise ValueError("No se pudo extraer el mes del PDF. Verifique que el PDF contenga el período de lectura.")
-            if extracted_data.get('year') is None:
-                raise ValueError("No se pudo extraer el año del PDF")
-            if extracted_data.get('total_amount') is None:
-                raise ValueError("No se pudo extraer el monto total del PDF")
-
-            # Retrieve or create the Meter
-            meter, _ = Meter.objects.get_or_create(
-                client_number=extracted_data.get('client_number', ''),
-                defaults={
-                    'name': f"Meter {extracted_data.get('client_number', '')}",
-                    'meter_type': 'ELECTRICITY',
-                    'coverage': 'Unknown',
-                }
-            )
-
-            # Create the Bill
-            bill = Bill.objects.create(
-                meter=meter,
-                month=extracted_data.get('month'),
-                year=extracted_data.get('year'),
-                total_to_pay=extracted_data.get('total_amount', 0),
-                tarifa=extracted_data.get('tarifa', ''),
-                invoice_number=extracted_data.get('invoice_number', ''),
-            )
-
-            # Extraer y guardar todos los cargos de electricidad
-            electricity_charges = self.extract_electricity_charges(complete_text)
-            for charge_data in electricity_charges:
-                Charge.objects.create(
-                    bill=bill,
-                    name=charge_data['name'],
-                    value=charge_data['value'],
-                    value_type=charge_data['value_type'],
-                    charge=charge_data['charge'],
-                )
-
-            # Extraer y guardar los totales (Monto Neto, IVA, etc.)
-            summary_charges = self.extract_electricity_summary(complete_text)
-            for charge_data in summary_charges:
-                Charge.objects.create(
-                    bill=bill,
-                    name=charge_data['name'],
-                    value=charge_data['value'],
-                    value_type=charge_data['value_type'],
-                    charge=charge_data['charge'],
-                )
-
-            # Add to the list of all processed bills
-            extracted_data['complete_text'] = complete_text
-            self.all_data.append(extracted_data)
-
-            return extracted_data
-
-        except Exception as e:
-            print(f"Error processing bill {file_pdf}: {e}")
-            return {}
-
-    def process_multiple_bills(self, pdf_files: list):
-        """
-        Process multiple PDF files
-        """
-        for pdf_file in pdf_files:
-            self.process_bill(pdf_file)
-
-    def validate_bill(self, file_pdf: str) -> dict:
-        """
-        Extrae la información relevante de la boleta sin crear instancias en la base de datos.
-        """
-        try:
-            with pdfplumber.open(file_pdf) as pdf:
-                complete_text = ""
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        complete_text += text + "\n"
-            extracted_data = self.extract_info_from_text(complete_text, file_pdf)
-            extracted_data['complete_text'] = complete_text
-            return extracted_data
-        except Exception as e:
-            print(f"Error validating bill {file_pdf}: {e}")
-            return {}
+READERS = {
+    'enel': EnelReader,
+    'aguas': AguasAndinasReader,
+}
+
+
+def parse_upload(tmp_path, budget, validate=False):
+    """
+    Detecta el proveedor y extrae los datos de la boleta; retorna (provider, bill_data),
+    con provider None si no se reconoce. Se ejecuta completa en el pool de procesamiento
+    con ParseBudget.arun(), por lo que los budget.run() internos corren en línea.
+    Con validate=True usa validate_bill(), con el texto por página comprimido para guardarlo al
+    confirmar el lote; si no, parse_bill() y verifica los campos requeridos.
+    """
+    provider = BillDetector.detect_provider(tmp_path, budget)
+    if provider not in READERS:
+        return None, None
+
+    reader = READERS[provider]()
+    if validate:
+        return provider, reader.validate_bill(tmp_path, budget, keep_pages=True)
+
+    bill_data = reader.parse_bill(tmp_path, budget)
+    budget.log(tmp_path)
+    reader.check_required(bill_data)
+    return provider, bill_data
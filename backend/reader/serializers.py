@@ -1,5 +1,11 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import Bill, Charge, Meter
+from .versions import bump
+
+# Campos editables de un cargo
+CHARGE_FIELDS = ["name", "value", "value_type", "charge"]
+
 
 class ChargeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
@@ -17,6 +23,7 @@ class BillSerializer(serializers.ModelSerializer):
         model = Bill
         fields = ["id", "meter", "meter_id", "month", "year", "total_to_pay", "pdf_filename", "charges"]
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         charges_data = validated_data.pop("charges", None)
         meter_data = validated_data.pop("meter", None)
@@ -28,14 +35,128 @@ class BillSerializer(serializers.ModelSerializer):
         instance.save()
 
         if charges_data is not None:
-            # Replace existing charges with submitted ones
-            instance.charges.all().delete()
-            for c in charges_data:
-                Charge.objects.create(bill=instance, **c)
+            self.update_charges(instance, charges_data)
 
         return instance
 
+    @staticmethod
+    def update_charges(bill, charges_data):
+        """
+        Aplica los cargos enviados como diferencia con los guardados: los que traen el id de un cargo
+        de la boleta se actualizan si cambió algún campo, los que no traen id (o traen uno ajeno) se
+        crean y los que no vienen se eliminan. Son a lo más una consulta por operación y los cargos
+        que se mantienen conservan su id.
+        """
+        existing = {charge.pk: charge for charge in bill.charges.all()}
+        kept, to_update, to_create = set(), [], []
+        for data in charges_data:
+            charge = existing.get(data.get("id"))
+            if charge is None or charge.pk in kept:
+                to_create.append(Charge(bill=bill, **{field: value for field, value in data.items() if field != "id"}))
+                continue
+            kept.add(charge.pk)
+            changed = False
+            for field in CHARGE_FIELDS:
+                if field in data and getattr(charge, field) != data[field]:
+                    setattr(charge, field, data[field])
+                    changed = True
+            if changed:
+                to_update.append(charge)
+
+        removed = set(existing) - kept
+        if removed:
+            Charge.objects.filter(pk__in=removed).delete()
+        if to_update:
+            Charge.objects.bulk_update(to_update, CHARGE_FIELDS)
+        if to_create:
+            Charge.objects.bulk_create(to_create)
+        # Las operaciones masivas no envían señales (ver reader.versions)
+        if removed or to_update or to_create:
+            bump('charge')
+
+class BillFilterSerializer(serializers.Serializer):
+    """
+    Filtros de BillListView para elegir las boletas de una operación masiva.
+    """
+    client_number = serializers.CharField(required=False)
+    meter_type = serializers.CharField(required=False)
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    year = serializers.IntegerField(required=False)
+    start_date = serializers.RegexField(r"^\d{4}-\d{1,2}$", required=False)
+    end_date = serializers.RegexField(r"^\d{4}-\d{1,2}$", required=False)
+
+    def to_internal_value(self, data):
+        # Un filtro mal escrito no puede ignorarse: ampliaría las boletas afectadas
+        if isinstance(data, dict):
+            unknown = sorted(set(data) - set(self.fields))
+            if unknown:
+                raise serializers.ValidationError(f"Filtros desconocidos: {', '.join(unknown)}")
+        return super().to_internal_value(data)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Indique al menos un filtro")
+        if ("start_date" in data) != ("end_date" in data):
+            raise serializers.ValidationError("El rango requiere start_date y end_date")
+        return data
+
+
+class BillBulkFieldsSerializer(serializers.Serializer):
+    """
+    Campos que se pueden asignar a varias boletas a la vez.
+    """
+    meter_id = serializers.PrimaryKeyRelatedField(queryset=Meter.objects.all(), required=False)
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    year = serializers.IntegerField(required=False)
+    total_to_pay = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    tarifa = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Indique al menos un campo")
+        if "meter_id" in data:
+            data["meter_id"] = data["meter_id"].pk
+        return data
+
+
+class BulkBillSerializer(serializers.Serializer):
+    """
+    Petición de BillBulkView: las boletas se eligen por 'ids' o por 'filter' y 'action' indica si
+    se editan con 'fields' o se eliminan.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = BillFilterSerializer(required=False)
+    action = serializers.ChoiceField(choices=["update", "delete"])
+    fields = BillBulkFieldsSerializer(required=False)
+
+    def validate(self, data):
+        if ("ids" in data) == ("filter" in data):
+            raise serializers.ValidationError("Indique 'ids' o 'filter'")
+        if data["action"] == "update" and "fields" not in data:
+            raise serializers.ValidationError("Indique en 'fields' los campos a editar")
+        return data
+
+
 class MeterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Meter
-        fields = ['id', 'meter_type', 'name', 'client_number', 'macrozona', 'instalacion', 'direccion', 'coverage']
\ No newline at end of file
+        fields = ['id', 'meter_type', 'name', 'client_number', 'macrozona', 'instalacion', 'direccion', 'coverage']
+
+
+class MeterStatsSerializer(MeterSerializer):
+    """
+    Medidor con los datos de sus boletas anotados por MeterListView (?stats=1).
+    """
+    bill_count = serializers.IntegerField(read_only=True)
+    last_period = serializers.SerializerMethodField()
+    last_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta(MeterSerializer.Meta):
+        fields = MeterSerializer.Meta.fields + ['bill_count', 'last_period', 'last_total']
+
+    def get_last_period(self, meter):
+        # Período año * 12 + mes de la última boleta, como YYYY-MM
+        if meter.last_period is None:
+            return None
+        year, month = divmod(meter.last_period - 1, 12)
+        return f"{year:04d}-{month + 1:02d}"
@@ -0,0 +1,48 @@
+"""
+PDF de las boletas en BILL_STORAGE_DIR.
+
+Los PDF que dejan de estar enlazados al eliminar boletas se borran en un hilo de fondo después de
+confirmar la transacción: la petición no espera al disco y, si la transacción se revierte, los
+archivos se conservan. Los que quedan sin boleta por otras vías (un proceso interrumpido, un borrado
+fallido) los encuentra 'manage.py reconcile_storage'.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_cleanup_executor() -> ThreadPoolExecutor:
+    """
+    Un solo hilo por proceso: los borrados se aplican en orden y no compiten con las peticiones.
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf-cleanup')
+
+
+def release_pdfs(filenames: Iterable[str]) -> None:
+    """
+    Programa el borrado de los PDF para cuando se confirme la transacción en curso
+    (de inmediato si no hay una).
+    """
+    filenames = sorted({filename for filename in filenames if filename})
+    if filenames:
+        transaction.on_commit(lambda: get_cleanup_executor().submit(remove_pdfs, filenames))
+
+
+def remove_pdfs(filenames: Iterable[str]) -> None:
+    storage_dir = settings.BILL_STORAGE_DIR
+    for filename in filenames:
+        try:
+            os.unlink(os.path.join(storage_dir, filename))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # Queda como huérfano para 'manage.py reconcile_storage'
+            logger.warning("No se pudo eliminar el PDF %s", filename, exc_info=True)
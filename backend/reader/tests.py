@@ -1,3 +1,907 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from reader import ingest
+from reader.ingest import upsert_bills
+from reader.management.commands.ingest_inbox import Command as IngestInboxCommand
+from reader.models import Bill, BillText, Charge, IngestedFile, Meter
+from reader.serializers import BillSerializer
+from reader.storage import get_cleanup_executor
+from reader.versions import RESOURCES, get_version, write_version
+
+from reader.reader import (
+    AguasAndinasReader,
+    EnelReader,
+    ParseBudget,
+    ParseTimeout,
+    ReadingDateResolver,
+    ResultRetention,
+    find_section,
+)
+
+# Expresiones regulares originales que find_section reemplaza
+OLD_WATER_CHARGES = r'VENCIMIENTO.*?TOTAL A PAGAR.*?\n(.*?)(?:El valor neto|Acogido Pago|Los valores con IVA)'
+OLD_WATER_RATES = r'Los valores con IVA.*?son los siguientes:(.*?)(?:Plantas de Tratamiento|LECTURA ACTUAL|Corte o Reposición)'
+OLD_ENEL_CHARGES = r'(?:CLUB HIPICO|AVD TUPPER|Dirección suministro).*?\n(.*?)(?:Total Monto Neto|\d+-[\dkK]\s+[\d,]+\s+[\d,]+\s+\d+\s+\d+-\d+-\d+)'
+
+WATER_TEXT = """AGUAS ANDINAS
+Nro de cuenta 461384-8
+VENCIMIENTO 28-FEB-2025 TOTAL A PAGAR $ 149.948
+CARGO FIJO 1,00 1.012
+CONSUMO AGUA 40,00 18.464
+RECOLECCION AGUAS SERVIDAS 40,00 20.112
+IVA (19%) 23.941
+TOTAL VENTA 149.955
+DESCUENTO LEY REDONDEO -7
+El valor neto de los servicios
+Los valores con IVA vigentes son los siguientes:
+Cargo fijo = $ 1.012
+Metro cúbico agua potable = $ 461,61
+Plantas de Tratamiento
+LECTURA ACTUAL 06-FEB-2025 1690 m3
+"""
+
+ENEL_TEXT = """Enel Distribución Electricidad
+Dirección suministro AVD TUPPER 1007
+SANTIAGO - 3042290-2
+Administración del servicio 669 AT43 AREA 1 S Caso 3 (a)
+Electricidad Consumida (119092kWh) 9.121.637
+Dem. Horas punta (206,000kW) 1.494.224
+Cargo por Servicio Público 89.320
+Total Monto Neto 10.705.850
+Total I.V.A. (19%) 2.034.112
+"""
+
+
+class FindSectionTests(SimpleTestCase):
+    def assertSameSection(self, old_pattern, text, anchors, end_pattern, flags=0):
+        old_match = re.search(old_pattern, text, re.DOTALL | flags)
+        expected = old_match.group(1) if old_match else None
+        self.assertEqual(find_section(text, anchors, end_pattern, flags), expected)
+
+    def test_water_sections_match_old_regexes(self):
+        layouts = [
+            WATER_TEXT,
+            WATER_TEXT.replace('El valor neto', 'Acogido Pago'),
+            WATER_TEXT.replace('Plantas de Tratamiento\n', ''),
+            WATER_TEXT.replace('TOTAL A PAGAR', 'TOTAL'),
+            'VENCIMIENTO TOTAL A PAGAR sin salto de línea',
+        ]
+        for text in layouts:
+            with self.subTest(text=text[:40]):
+                self.assertSameSection(
+                    OLD_WATER_CHARGES, text,
+                    [r'VENCIMIENTO', r'TOTAL A PAGAR', r'\n'],
+                    r'El valor neto|Acogido Pago|Los valores con IVA'
+                )
+                self.assertSameSection(
+                    OLD_WATER_RATES, text,
+                    [r'Los valores con IVA', r'son los siguientes:'],
+                    r'Plantas de Tratamiento|LECTURA ACTUAL|Corte o Reposición'
+                )
+
+    def test_enel_section_matches_old_regex(self):
+        layouts = [
+            ENEL_TEXT,
+            ENEL_TEXT.replace('Dirección suministro AVD TUPPER', 'CLUB HIPICO'),
+            ENEL_TEXT.replace('Total Monto Neto', '177949-4 1,2 3,4 5 10-01-2024'),
+            ENEL_TEXT.replace('Total Monto Neto', 'Sin cierre'),
+        ]
+        for text in layouts:
+            with self.subTest(text=text[:40]):
+                self.assertSameSection(
+                    OLD_ENEL_CHARGES, text,
+                    [r'CLUB HIPICO|AVD TUPPER|Dirección suministro', r'\n'],
+                    r'Total Monto Neto|\d+-[\dkK]\s+[\d,]+\s+[\d,]+\s+\d+\s+\d+-\d+-\d+',
+                    re.IGNORECASE
+                )
+
+    def test_extractors_on_sample_layouts(self):
+        water_charges = AguasAndinasReader.extract_main_charges(WATER_TEXT)
+        self.assertIn({'name': 'CONSUMO AGUA', 'value': 40.0, 'value_type': 'm3', 'charge': 18464}, water_charges)
+        self.assertIn({'name': 'DESCUENTO LEY REDONDEO', 'value': 1, 'value_type': 'unidad', 'charge': -7}, water_charges)
+
+        enel_charges = EnelReader.extract_electricity_charges(ENEL_TEXT)
+        self.assertIn({'name': 'Electricidad Consumida', 'value': 119092.0, 'value_type': 'kWh', 'charge': 9121637}, enel_charges)
+
+    def test_unterminated_sections_are_linear(self):
+        start = time.monotonic()
+        AguasAndinasReader.extract_main_charges('VENCIMIENTO TOTAL A PAGAR x\n' * 20000)
+        EnelReader.extract_electricity_charges('CLUB HIPICO\n' * 20000)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class ReadingDateResolverTests(SimpleTestCase):
+    def test_priority_order(self):
+        labels = [
+            ('LECTURA ACTUAL 06-FEB-2025', (1, 2025)),
+            ('LECTURA ACTUAL 06/03/2025', (2, 2025)),
+            ('Periodo de Lectura del 06-ABR-2025', (3, 2025)),            # primera fecha tras la etiqueta
+            ('FECHA ESTIMADA PRÓXIMA LECTURA 05-JUN-2025', (4, 2025)),     # resta dos meses
+            ('FECHA EMISIÓN:11-JUN-2025', (5, 2025)),
+            ('VENCIMIENTO 28-AGO-2025', (6, 2025)),                         # resta dos meses
+            ('Julio 2025', (6, 2025)),
+        ]
+        # Cada etiqueta gana sobre todas las de menor prioridad, sin importar el orden en el texto
+        for index, (label, expected) in enumerate(labels):
+            with self.subTest(label=label):
+                text = '\n'.join(text for text, _ in reversed(labels[index:]))
+                self.assertEqual(ReadingDateResolver.resolve(text), expected)
+
+    def test_month_offsets_cross_year(self):
+        self.assertEqual(ReadingDateResolver.resolve('LECTURA ACTUAL 06-ENE-2025'), (12, 2024))
+        self.assertEqual(ReadingDateResolver.resolve('VENCIMIENTO 28-FEB-2025'), (12, 2024))
+        self.assertEqual(ReadingDateResolver.resolve('Enero 2025'), (12, 2024))
+        self.assertEqual(ReadingDateResolver.resolve('sin fecha'), (None, None))
+
+    def test_invalid_date_tries_next_occurrence_then_next_rule(self):
+        self.assertEqual(
+            ReadingDateResolver.resolve('LECTURA ACTUAL 31-FEB-2025 LECTURA ACTUAL 06-MAR-2025'),
+            (2, 2025)
+        )
+        # Una fecha de próxima lectura inválida no cambia el desfase de la regla siguiente
+        self.assertEqual(
+            ReadingDateResolver.resolve('FECHA ESTIMADA PRÓXIMA LECTURA 31-FEB-2025 FECHA EMISIÓN:11-MAR-2025'),
+            (2, 2025)
+        )
+
+    def test_malformed_text_is_linear(self):
+        text = 'LECTURA ANTERIOR 01-ENE-2024 1 m3 ' * 20000 + 'Periodo de Lectura ' * 20000
+        start = time.monotonic()
+        self.assertEqual(ReadingDateResolver.resolve(text), (None, None))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class ResultRetentionTests(SimpleTestCase):
+    def extracted(self):
+        return {'file': 'enero.pdf', 'client_number': '461384-8', 'month': 1, 'year': 2025,
+                'total_amount': 149948, 'complete_text': WATER_TEXT}
+
+    def test_drop_removes_text(self):
+        data = ResultRetention.apply(self.extracted(), 'drop')
+        self.assertNotIn('complete_text', data)
+        self.assertEqual(ResultRetention.summary(data)['client_number'], '461384-8')
+
+    def test_spill_writes_compressed_text(self):
+        spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spill_dir, ignore_errors=True)
+        data = ResultRetention.apply(self.extracted(), 'spill', spill_dir)
+        self.assertNotIn('complete_text', data)
+        with gzip.open(data['text_path'], 'rt', encoding='utf-8') as text_file:
+            self.assertEqual(text_file.read(), WATER_TEXT)
+        self.assertEqual(ResultRetention.summary(data)['text_path'], data['text_path'])
+
+    def test_keep_and_summary(self):
+        data = ResultRetention.apply(self.extracted(), 'keep')
+        self.assertEqual(data['complete_text'], WATER_TEXT)
+        self.assertNotIn('complete_text', ResultRetention.summary(data))
+        with self.assertRaises(ValueError):
+            ResultRetention.apply(self.extracted(), 'all')
+
+    @override_settings(BILL_TEXT_RETENTION='drop')
+    @mock.patch('reader.reader.extract_pdf_pages', return_value=[WATER_TEXT])
+    def test_validate_bill_returns_pages_only_to_store_them(self, extract_pdf_pages):
+        data = AguasAndinasReader().validate_bill('enero.pdf')
+        self.assertNotIn('pages', data)
+        self.assertNotIn('pages_compressed', data)
+        data = AguasAndinasReader().validate_bill('enero.pdf', keep_pages=True)
+        self.assertNotIn('pages', data)
+        self.assertEqual(BillText.decompress(data['pages_compressed']), [WATER_TEXT])
+
+
+class ParseBudgetTests(SimpleTestCase):
+    def test_run_stops_waiting_for_a_running_step(self):
+        budget = ParseBudget(0.1)
+
+        def slow_step():
+            with budget.track('slow_step'):
+                time.sleep(1)
+
+        start = time.monotonic()
+        with self.assertRaises(ParseTimeout) as ctx:
+            budget.run(slow_step)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(ctx.exception.extractor, 'slow_step')
+
+    def test_steps_after_the_deadline_do_not_run(self):
+        budget = ParseBudget(0.1)
+        steps = []
+
+        def two_steps():
+            for step in ('first', 'second'):
+                with budget.track(step):
+                    steps.append(step)
+                    time.sleep(0.3)
+
+        with self.assertRaises(ParseTimeout):
+            budget.run(two_steps)
+        # El hilo termina el paso en curso y no empieza el siguiente
+        time.sleep(0.4)
+        self.assertEqual(steps, ['first'])
+
+        # Un trabajo que espera en la cola después del plazo no llega a ejecutarse
+        with self.assertRaises(ParseTimeout):
+            budget.call(steps.append, 'queued')
+        self.assertEqual(steps, ['first'])
+
+    def test_run_returns_result_within_budget(self):
+        budget = ParseBudget(5)
+        self.assertEqual(budget.run(lambda: 42), 42)
+
+    async def test_arun_does_not_block_event_loop(self):
+        budget = ParseBudget(0.3)
+
+        def slow_step():
+            with budget.track('slow_step'):
+                time.sleep(1)
+
+        parse = asyncio.ensure_future(budget.arun(slow_step))
+        start = time.monotonic()
+        await asyncio.sleep(0.05)
+        self.assertLess(time.monotonic() - start, 0.2)
+        with self.assertRaises(ParseTimeout):
+            await parse
+        self.assertLess(time.monotonic() - start, 0.6)
+
+
+def slow_extract_info(text, file_pdf):
+    time.sleep(1)
+    return {}
+
+
+@override_settings(BILL_PARSE_TIMEOUT_SECONDS=0.2)
+@mock.patch('reader.reader.AguasAndinasReader.extract_info_from_text', side_effect=slow_extract_info)
+@mock.patch('reader.reader.extract_pdf_pages', return_value=[WATER_TEXT])
+class UploadTimeoutTests(SimpleTestCase):
+    def post_bill(self, url_name):
+        pdf = SimpleUploadedFile('boleta.pdf', b'%PDF-1.4', content_type='application/pdf')
+        response = self.client.post(reverse(url_name), {'files': [pdf]})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'][0]
+
+    def assertTimeoutResult(self, result):
+        self.assertEqual(result['status'], 'invalid')
+        self.assertIn('Tiempo de procesamiento excedido', result['detail'])
+        self.assertEqual(result['extractor'], 'extract_info_from_text')
+        self.assertIn('extract_info_from_text', result['timings'])
+
+    def test_validate_batch_reports_timeout_as_invalid(self, *mocks):
+        self.assertTimeoutResult(self.post_bill('validate-batch-bills'))
+
+    def test_process_multiple_reports_timeout_as_invalid(self, *mocks):
+        self.assertTimeoutResult(self.post_bill('process_multiple_bills'))
+
+
+def bill_pdf(name='boleta.pdf'):
+    return SimpleUploadedFile(name, b'%PDF-1.4', content_type='application/pdf')
+
+
+class StorageTestCase(TestCase):
+    """
+    Usa una carpeta temporal como BILL_STORAGE_DIR.
+    """
+    def setUp(self):
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir, ignore_errors=True)
+        storage_settings = override_settings(BILL_STORAGE_DIR=storage_dir)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.storage_dir = storage_dir
+
+
+@mock.patch('reader.views.BillDetector.detect_provider', return_value='aguas')
+class ValidateBatchBillsTests(StorageTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        Bill.objects.create(meter=meter, month=1, year=2025, total_to_pay=1000)
+
+    def post_validate(self, parsed):
+        files = [bill_pdf(f'boleta-{index}.pdf') for index in range(len(parsed))]
+        with mock.patch('reader.views.AguasAndinasReader.validate_bill', side_effect=parsed):
+            return self.client.post(reverse('validate-batch-bills'), {'files': files}).json()
+
+    def validate(self, parsed):
+        return [result['status'] for result in self.post_validate(parsed)['results']]
+
+    def test_statuses(self, detect_provider):
+        statuses = self.validate([
+            {'client_number': '461384-8', 'month': 2, 'year': 2025},
+            {'client_number': '461384-8', 'month': 1, 'year': 2025},
+            {'client_number': '999999-9', 'month': 1, 'year': 2025},
+            {'client_number': '461384-8', 'month': 2, 'year': 2025},
+            {'client_number': None, 'month': 3, 'year': 2025},
+            {'client_number': '461384-8', 'month': None, 'year': None},
+        ])
+        self.assertEqual(statuses, ['correct', 'in_db', 'not_found', 'duplicated', 'invalid', 'invalid'])
+
+    def test_query_count_does_not_grow_with_batch_size(self, detect_provider):
+        parsed = [{'client_number': '461384-8', 'month': month, 'year': year}
+                  for year in range(2000, 2010) for month in range(1, 13)]
+        with self.assertNumQueries(2):
+            statuses = self.validate(parsed)
+        self.assertEqual(statuses.count('correct'), len(parsed))
+
+    def test_process_validated_batch_by_token(self, detect_provider):
+        charges = [{'name': 'CARGO FIJO', 'value': 1, 'value_type': 'unidad', 'charge': 1012}]
+        data = self.post_validate([
+            {'client_number': '461384-8', 'month': 2, 'year': 2025, 'total_amount': 1012,
+             'charges': charges, 'complete_text': WATER_TEXT, 'pages_compressed': BillText.compress([WATER_TEXT])},
+            {'client_number': '461384-8', 'month': 1, 'year': 2025},
+        ])
+        token = data['batch_token']
+        # El texto va junto al PDF del lote y no en el manifiesto
+        manifest = json.loads((Path(self.storage_dir) / 'batches' / token / 'manifest.json').read_text())
+        self.assertEqual([(entry['pdf'], entry['pages']) for entry in manifest['entries']], [('0.pdf', '0.pages')])
+        self.assertNotIn('pages_compressed', manifest['entries'][0]['bill_data'])
+        validated_at = time.time() - 1200
+        os.utime(Path(self.storage_dir) / 'batches' / token / '0.pdf', (validated_at, validated_at))
+
+        with mock.patch('reader.reader.extract_pdf_pages') as extract_pdf_pages:
+            response = self.client.post(reverse('process_multiple_bills'), {'batch_token': token},
+                                        content_type='application/json')
+        extract_pdf_pages.assert_not_called()
+
+        self.assertEqual([result['status'] for result in response.json()['results']], ['procesado'])
+        bill = Bill.objects.get(month=2, year=2025)
+        self.assertEqual(list(bill.charges.values_list('name', 'charge')), [('CARGO FIJO', 1012)])
+        stored_pdf = os.path.join(self.storage_dir, bill.pdf_filename)
+        # La antigüedad del PDF para reconcile_storage se cuenta desde que se guarda
+        self.assertGreater(os.path.getmtime(stored_pdf), time.time() - 60)
+        self.assertEqual(BillText.decompress(bill.extracted_text.pages), [WATER_TEXT])
+
+        # El token solo se puede usar una vez
+        response = self.client.post(reverse('process_multiple_bills'), {'batch_token': token},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_failed_move_releases_moved_pdfs(self, detect_provider):
+        token = self.post_validate([
+            {'client_number': '461384-8', 'month': month, 'year': 2025, 'total_amount': 1000}
+            for month in (2, 3)
+        ])['batch_token']
+        move = shutil.move
+        calls = []
+
+        def failing_move(source, target):
+            calls.append(target)
+            if len(calls) > 1:
+                raise OSError('disco lleno')
+            return move(source, target)
+
+        with mock.patch('reader.views.shutil.move', side_effect=failing_move), self.assertRaises(OSError):
+            self.client.post(reverse('process_multiple_bills'), {'batch_token': token},
+                             content_type='application/json')
+        self.assertEqual([name for name in os.listdir(self.storage_dir) if name.endswith('.pdf')], [])
+        self.assertFalse(Bill.objects.filter(month__in=(2, 3)).exists())
+
+    def test_no_token_without_correct_bills(self, detect_provider):
+        data = self.post_validate([{'client_number': '461384-8', 'month': 1, 'year': 2025}])
+        self.assertNotIn('batch_token', data)
+        self.assertEqual(os.listdir(self.storage_dir), [])
+
+
+class UpsertBillsTests(TestCase):
+    def entry(self, invoice_number, total, charge, pdf_filename=None, client_number='461384-8'):
+        return {
+            'meter_type': 'WATER',
+            'pdf_filename': pdf_filename,
+            'bill_data': {
+                'client_number': client_number, 'month': 1, 'year': 2025,
+                'total_amount': total, 'invoice_number': invoice_number,
+                'charges': [{'name': 'CARGO FIJO', 'value': 1, 'value_type': 'unidad', 'charge': charge}],
+            },
+        }
+
+    def assertStoredBill(self, total, charges, pdf_filename):
+        bill = Bill.objects.get()
+        self.assertEqual(bill.total_to_pay, total)
+        self.assertEqual(list(bill.charges.values_list('charge', flat=True)), charges)
+        self.assertEqual(bill.pdf_filename, pdf_filename)
+
+    def test_skip_keeps_existing_bill(self):
+        first = upsert_bills([self.entry('100', 1000, 10, 'a.pdf')], 'skip')
+        second = upsert_bills([self.entry('200', 2000, 20, 'b.pdf')], 'skip')
+        self.assertEqual(first[0]['action'], 'created')
+        self.assertEqual(second[0], {'bill_id': None, 'action': 'skipped', 'replaced_pdf': None})
+        self.assertStoredBill(1000, [10], 'a.pdf')
+
+    def test_replace_overwrites_bill_and_charges(self):
+        upsert_bills([self.entry('100', 1000, 10, 'a.pdf')], 'replace')
+        outcome = upsert_bills([self.entry('90', 2000, 20, 'b.pdf')], 'replace')[0]
+        self.assertEqual((outcome['action'], outcome['replaced_pdf']), ('updated', 'a.pdf'))
+        self.assertStoredBill(2000, [20], 'b.pdf')
+
+    def test_newest_compares_invoice_numbers(self):
+        upsert_bills([self.entry('999', 1000, 10, 'a.pdf')], 'newest')
+        older = upsert_bills([self.entry('998', 2000, 20, 'b.pdf')], 'newest')[0]
+        self.assertEqual(older['action'], 'skipped')
+        # Un folio más largo es mayor aunque su texto sea menor
+        newer = upsert_bills([self.entry('1000', 3000, 30, 'c.pdf')], 'newest')[0]
+        self.assertEqual(newer['action'], 'updated')
+        self.assertStoredBill(3000, [30], 'c.pdf')
+
+    def test_period_created_by_a_concurrent_batch_is_reported_as_updated(self):
+        upsert_bills([self.entry('100', 1000, 10, 'a.pdf')], 'replace')
+        real_lock_bills = ingest.lock_bills
+        calls = []
+
+        def lock_bills(keys):
+            # El primer bloqueo no ve la boleta, como si otro lote la hubiera creado justo después
+            calls.append(keys)
+            return {} if len(calls) == 1 else real_lock_bills(keys)
+
+        with mock.patch('reader.ingest.lock_bills', side_effect=lock_bills):
+            outcome = upsert_bills([self.entry('90', 2000, 20, 'b.pdf')], 'replace')[0]
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((outcome['action'], outcome['replaced_pdf']), ('updated', 'a.pdf'))
+        self.assertStoredBill(2000, [20], 'b.pdf')
+
+    def test_repeated_period_in_batch_uses_policy(self):
+        entries = [self.entry('200', 2000, 20), self.entry('300', 3000, 30), self.entry('100', 1000, 10)]
+        self.assertEqual([o['action'] for o in upsert_bills(entries, 'newest')], ['skipped', 'created', 'skipped'])
+        self.assertStoredBill(3000, [30], None)
+
+    def test_one_insert_per_batch(self):
+        Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        entries = []
+        for month in range(1, 13):
+            entry = self.entry(str(month), 1000, 10)
+            entry['bill_data']['month'] = month
+            entries.append(entry)
+        # Medidores, boletas (INSERT ... ON CONFLICT) y cargos, dentro de un savepoint
+        with self.assertNumQueries(5):
+            upsert_bills(entries, 'skip')
+        self.assertEqual(Bill.objects.count(), 12)
+
+
+class ReparseTests(TestCase):
+    def test_rederives_only_changed_charges_from_stored_text(self):
+        charges = AguasAndinasReader().parse_text(WATER_TEXT, 'enero.pdf')['charges']
+        self.assertGreater(len(charges), 1)
+        # Boleta guardada con un extractor anterior que solo encontraba el primer cargo
+        upsert_bills([{
+            'provider': 'aguas',
+            'meter_type': 'WATER',
+            'bill_data': {
+                'client_number': '461384-8', 'month': 1, 'year': 2025, 'total_amount': 149948,
+                'charges': charges[:1], 'pages': [WATER_TEXT],
+            },
+        }])
+        bill = Bill.objects.get()
+        self.assertEqual(BillText.decompress(bill.extracted_text.pages), [WATER_TEXT])
+
+        out = io.StringIO()
+        call_command('reparse', workers=1, stdout=out)
+        self.assertIn('1 actualizadas', out.getvalue())
+        self.assertEqual(
+            sorted(bill.charges.values_list('name', flat=True)), sorted(charge['name'] for charge in charges)
+        )
+
+        bill.refresh_from_db()
+        self.assertEqual((bill.reader, bill.reader_version), ('aguas', AguasAndinasReader.VERSION))
+
+        out = io.StringIO()
+        call_command('reparse', workers=1, stdout=out)
+        self.assertIn('0 actualizadas, 1 sin cambios', out.getvalue())
+
+    def test_outdated_only_reprocesses_older_stamps(self):
+        upsert_bills([{
+            'provider': 'aguas',
+            'meter_type': 'WATER',
+            'bill_data': dict(AguasAndinasReader().parse_text(WATER_TEXT, 'enero.pdf'), total_amount=1000, pages=[WATER_TEXT]),
+        }])
+        bill = Bill.objects.get()
+        self.assertEqual(bill.reader_version, AguasAndinasReader.VERSION)
+
+        out = io.StringIO()
+        call_command('reparse', outdated=True, workers=1, stdout=out)
+        self.assertIn('0 boletas revisadas', out.getvalue())
+
+        Bill.objects.update(reader_version=AguasAndinasReader.VERSION - 1)
+        out = io.StringIO()
+        call_command('reparse', outdated=True, workers=1, dry_run=True, stdout=out)
+        self.assertIn('total 1000.00 -> 149948.00', out.getvalue())
+        self.assertIn('1 cambiarían', out.getvalue())
+
+
+@mock.patch('reader.views.BillDetector.detect_provider', return_value='aguas')
+@mock.patch('reader.reader.extract_pdf_pages', return_value=[WATER_TEXT])
+class ProcessMultipleBillsTests(StorageTestCase):
+    def post_bills(self, *names):
+        response = self.client.post(reverse('process_multiple_bills'), {'files': [bill_pdf(name) for name in names]})
+        return response.json()['results']
+
+    def test_stream_emits_one_line_per_file(self, *mocks):
+        response = self.client.post(
+            reverse('process_multiple_bills') + '?stream=ndjson',
+            {'files': [bill_pdf('enero.pdf'), bill_pdf('enero-copia.pdf'), bill_pdf('nota.pdf')]},
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        with mock.patch('reader.views.BillDetector.detect_provider', side_effect=['aguas', 'aguas', 'unknown']), \
+                self.assertLogs('reader.views', 'ERROR') as logs:
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines() if line]
+        self.assertIn('nota.pdf', logs.output[0])
+        self.assertEqual([line['file'] for line in lines], ['enero.pdf', 'enero-copia.pdf', 'nota.pdf'])
+        self.assertEqual([line['status'] for line in lines], ['procesado', 'omitido', 'error'])
+        self.assertEqual(
+            {key: lines[0][key] for key in ('client_number', 'month', 'year', 'total_amount')},
+            {'client_number': '461384-8', 'month': 1, 'year': 2025, 'total_amount': 149948.0}
+        )
+
+    def test_drf_negotiation_and_errors(self, *mocks):
+        response = self.client.post(reverse('process_multiple_bills'), {'files': [bill_pdf('enero.pdf')]},
+                                    HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['status'], 'procesado')
+
+        # JSON mal formado: respuesta de error de DRF, como en el resto de la API
+        response = self.client.post(reverse('process_multiple_bills'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detail', response.json())
+
+    def test_same_period_twice_is_skipped(self, *mocks):
+        results = self.post_bills('enero.pdf', 'enero-copia.pdf')
+        self.assertEqual([r['status'] for r in results], ['procesado', 'omitido'])
+        results = self.post_bills('enero.pdf')
+        self.assertEqual(results[0]['action'], 'skipped')
+
+        bill = Bill.objects.get()
+        self.assertEqual(os.listdir(self.storage_dir), [bill.pdf_filename])
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_views_do_not_load_heavy_dependencies(self):
+        script = (
+            "import sys, django; django.setup(); import reader.views, writer.views; "
+            "print(' '.join(m for m in ('pandas', 'numpy', 'pdfplumber', 'openpyxl') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class RequestSizeLimitTests(SimpleTestCase):
+    @override_settings(MAX_REQUEST_BODY_MB=1)
+    def test_oversized_upload_is_rejected_before_parsing(self):
+        pdf = SimpleUploadedFile('grande.pdf', b'0' * (1024 * 1024 + 1), content_type='application/pdf')
+        with mock.patch('reader.views.BillDetector.detect_provider') as detect_provider:
+            response = self.client.post(reverse('validate-batch-bills'), {'files': [pdf]})
+        self.assertEqual(response.status_code, 413)
+        detect_provider.assert_not_called()
+
+
+class IngestInboxTests(StorageTestCase):
+    def ingest(self, inbox):
+        call_command('ingest_inbox', inbox=inbox, once=True, workers=1, stdout=io.StringIO())
+
+    def test_processes_inbox_once_and_records_ledger(self):
+        inbox = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, inbox, ignore_errors=True)
+        sample = Path(settings.BASE_DIR) / 'reader' / 'input' / 'water_bills' / 'M1 461384 Enero.pdf'
+        shutil.copyfile(sample, inbox / 'enero.pdf')
+        (inbox / 'nota.pdf').write_bytes(b'no es un pdf')
+
+        self.ingest(inbox)
+        self.assertEqual(sorted(p.name for p in (inbox / 'done').iterdir()), ['enero.pdf'])
+        self.assertEqual(sorted(p.name for p in (inbox / 'failed').iterdir()), ['nota.pdf'])
+        bill = Bill.objects.get()
+        self.assertEqual((bill.meter.client_number, bill.month, bill.year), ('461384-8', 1, 2025))
+        self.assertEqual(IngestedFile.objects.get(status='done').bill, bill)
+
+        # El mismo PDF dejado de nuevo no se vuelve a procesar
+        shutil.copyfile(sample, inbox / 'enero-copia.pdf')
+        with mock.patch('reader.management.commands.ingest_inbox.upsert_bills') as upsert:
+            self.ingest(inbox)
+        upsert.assert_not_called()
+        self.assertEqual(sorted(p.name for p in (inbox / 'done').iterdir()), ['enero-copia.pdf', 'enero.pdf'])
+
+    def test_walk_skips_done_and_failed(self):
+        inbox = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, inbox, ignore_errors=True)
+        for folder in ('done', 'failed', 'sucursal'):
+            (inbox / folder).mkdir()
+            (inbox / folder / 'boleta.pdf').write_bytes(b'')
+
+        command = IngestInboxCommand()
+        command.inbox, command.done_dir, command.failed_dir = inbox, inbox / 'done', inbox / 'failed'
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            files = command.inbox_files()
+        self.assertEqual(files, [inbox / 'sucursal' / 'boleta.pdf'])
+        self.assertEqual(sorted(Path(call.args[0]).name for call in scandir.call_args_list),
+                         sorted([inbox.name, 'sucursal']))
+
+
+class BackfillBillsTests(StorageTestCase):
+    def test_resumes_from_last_committed_chunk(self):
+        archive = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, archive, ignore_errors=True)
+        samples = Path(settings.BASE_DIR) / 'reader' / 'input' / 'water_bills'
+        (archive / '2025' / 'a').mkdir(parents=True)
+        shutil.copyfile(samples / 'M1 461384 Enero.pdf', archive / '2025' / 'enero.pdf')
+        shutil.copyfile(samples / 'M1 461384 Febrero.pdf', archive / '2025' / 'a' / 'febrero.pdf')
+        (archive / '2025' / 'a' / 'nota.pdf').write_bytes(b'no es un pdf')
+        checkpoint = archive / 'checkpoint.json'
+
+        def backfill():
+            call_command('backfill_bills', str(archive), chunk_size=1, workers=1,
+                         checkpoint=str(checkpoint), stdout=io.StringIO())
+
+        # La segunda transacción falla: queda guardado solo el primer bloque
+        calls = []
+
+        def failing_upsert(entries, policy=None):
+            calls.append(entries)
+            if len(calls) > 1:
+                raise RuntimeError('caída')
+            return upsert_bills(entries, policy)
+
+        with mock.patch('reader.management.commands.backfill_bills.upsert_bills', side_effect=failing_upsert):
+            with self.assertRaises(RuntimeError):
+                backfill()
+        self.assertEqual(json.loads(checkpoint.read_text())['last_path'], '2025/enero.pdf')
+        self.assertEqual(Bill.objects.count(), 1)
+
+        backfill()
+        state = json.loads(checkpoint.read_text())
+        self.assertEqual(state['last_path'], '2025/a/nota.pdf')
+        self.assertEqual(state['counts'], {'created': 2, 'updated': 0, 'skipped': 0, 'failed': 1})
+        self.assertEqual(sorted(Bill.objects.values_list('month', flat=True)), [1, 2])
+        self.assertEqual(len(list(Path(settings.BILL_STORAGE_DIR).glob('*.pdf'))), 2)
+
+
+class MeterListViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.central = Meter.objects.create(
+            meter_type='WATER', client_number='461384-8', name='Casa Central', macrozona='Norte', instalacion='Oficina'
+        )
+        self.bodega = Meter.objects.create(
+            meter_type='ELECTRICITY', client_number='1234567-8', name='Bodega', macrozona='Sur', instalacion='Casa Sur'
+        )
+        Meter.objects.create(meter_type='WATER', client_number='999-1', name='Sin boletas')
+        Bill.objects.create(meter=self.central, month=12, year=2024, total_to_pay=18000)
+        Bill.objects.create(meter=self.central, month=2, year=2025, total_to_pay=20000)
+        Bill.objects.create(meter=self.central, month=1, year=2025, total_to_pay=19000)
+
+    def test_without_page_returns_full_list(self):
+        response = self.client.get(reverse('meters-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_prefix_search_on_any_field(self):
+        response = self.client.get(reverse('meters-list'), {'search': 'casa'})
+        self.assertEqual([meter['id'] for meter in response.json()], [self.central.pk, self.bodega.pk])
+        response = self.client.get(reverse('meters-list'), {'search': '4613'})
+        self.assertEqual([meter['id'] for meter in response.json()], [self.central.pk])
+        # Solo prefijos
+        response = self.client.get(reverse('meters-list'), {'search': 'central'})
+        self.assertEqual(response.json(), [])
+
+    def test_paginated_stats_in_one_query(self):
+        with self.assertNumQueries(2):  # Conteo de la paginación y la página
+            response = self.client.get(reverse('meters-list'), {'page': 1, 'page_size': 2, 'stats': 1})
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertIsNotNone(data['next'])
+        central, bodega = data['results']
+        self.assertEqual(
+            (central['bill_count'], central['last_period'], central['last_total']), (3, '2025-02', '20000.00')
+        )
+        self.assertEqual((bodega['bill_count'], bodega['last_period'], bodega['last_total']), (0, None, None))
+
+
+class VersionedResponseTests(TestCase):
+    def setUp(self):
+        version_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, version_dir, ignore_errors=True)
+        settings_override = override_settings(RESOURCE_VERSION_DIR=version_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.meter = Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        self.bill = Bill.objects.create(meter=self.meter, month=1, year=2025, total_to_pay=20000)
+        Charge.objects.create(bill=self.bill, name='CONSUMO AGUA', value=12, value_type='m3', charge=9000)
+
+    def test_etag_and_cached_body_until_bills_change(self):
+        url = reverse('bills-list')
+        first = self.client.get(url, {'year': 2025})
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        # Mismos parámetros: 304 o cuerpo en caché, sin consultar la base de datos
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'year': 2025}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            cached = self.client.get(url, {'year': 2025})
+        self.assertEqual(cached.json(), first.json())
+        self.assertNotEqual(self.client.get(url, {'year': 2024})['ETag'], etag)
+
+        # Editar la boleta (BillSerializer.update) cambia la versión
+        response = self.client.put(
+            reverse('bills-detail', args=[self.bill.pk]),
+            {'month': 1, 'year': 2025, 'total_to_pay': '21000.00',
+             'charges': [{'name': 'CONSUMO AGUA', 'value': '13.00', 'value_type': 'm3', 'charge': 9700}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        updated = self.client.get(url, {'year': 2025}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.json()['results'][0]['total_to_pay'], '21000.00')
+        charges = self.client.get(reverse('bill-charges', args=[self.bill.pk])).json()
+        self.assertEqual([charge['charge'] for charge in charges], [9700])
+
+    def test_concurrent_writes_and_missing_versions(self):
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: write_version(RESOURCES), range(200)))
+        self.assertEqual(sorted(os.listdir(settings.RESOURCE_VERSION_DIR)), sorted(RESOURCES))
+
+        # Sin archivo se crea una versión nueva en lugar de volver a una anterior
+        os.unlink(os.path.join(settings.RESOURCE_VERSION_DIR, 'bill'))
+        version = get_version(('bill',))
+        self.assertNotEqual(version, '0')
+        self.assertEqual(get_version(('bill',)), version)
+
+    def test_bulk_ingest_changes_the_version(self):
+        url = reverse('bill-charges', args=[self.bill.pk])
+        etag = self.client.get(url)['ETag']
+        upsert_bills([{
+            'meter_type': 'WATER',
+            'bill_data': {
+                'client_number': '461384-8', 'month': 1, 'year': 2025, 'total_amount': 21000,
+                'charges': [{'name': 'CONSUMO AGUA', 'value': 14, 'value_type': 'm3', 'charge': 9900}],
+            },
+        }], policy='replace')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([charge['charge'] for charge in response.json()], [9900])
+
+
+class BillChargesUpdateTests(TestCase):
+    def setUp(self):
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        self.bill = Bill.objects.create(meter=meter, month=1, year=2025, total_to_pay=20000)
+        self.consumo, self.fijo, self.ajuste = Charge.objects.bulk_create([
+            Charge(bill=self.bill, name='CONSUMO AGUA', value=12, value_type='m3', charge=9000),
+            Charge(bill=self.bill, name='CARGO FIJO', value=0, value_type='$', charge=950),
+            Charge(bill=self.bill, name='AJUSTE SENCILLO', value=0, value_type='$', charge=-8),
+        ])
+
+    def test_update_applies_charge_diff_and_keeps_ids(self):
+        charges = [
+            {'id': self.consumo.pk, 'name': 'CONSUMO AGUA', 'value': '13.00', 'value_type': 'm3', 'charge': 9700},
+            {'id': self.fijo.pk, 'name': 'CARGO FIJO', 'value': '0.00', 'value_type': '$', 'charge': 950},
+            {'name': 'INTERES Y REAJUSTE', 'value': '0.00', 'value_type': '$', 'charge': 120},
+        ]
+        serializer = BillSerializer(self.bill, data={'charges': charges}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        # Boleta, lectura de cargos, una eliminación, un bulk_update y un bulk_create (más el savepoint)
+        with self.assertNumQueries(7):
+            serializer.save()
+
+        stored = {charge.name: charge for charge in self.bill.charges.all()}
+        self.assertEqual(sorted(stored), ['CARGO FIJO', 'CONSUMO AGUA', 'INTERES Y REAJUSTE'])
+        self.assertEqual(stored['CONSUMO AGUA'].pk, self.consumo.pk)
+        self.assertEqual(stored['CONSUMO AGUA'].charge, 9700)
+        self.assertEqual(stored['CARGO FIJO'].pk, self.fijo.pk)
+        self.assertFalse(Charge.objects.filter(pk=self.ajuste.pk).exists())
+
+
+class BillBulkViewTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        version_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, version_dir, ignore_errors=True)
+        settings_override = override_settings(RESOURCE_VERSION_DIR=version_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.bills = []
+        for index in range(5):
+            meter = Meter.objects.create(meter_type='WATER', client_number=f'46138{index}-8')
+            pdf_filename = f'{index}.pdf'
+            Path(self.storage_dir, pdf_filename).write_bytes(b'%PDF')
+            bill = Bill.objects.create(meter=meter, month=3, year=2025, total_to_pay=1000, pdf_filename=pdf_filename)
+            Charge.objects.create(bill=bill, name='CONSUMO AGUA', value=12, value_type='m3', charge=900)
+            self.bills.append(bill)
+        Bill.objects.create(meter=meter, month=4, year=2025, total_to_pay=1000)
+
+    def post_bulk(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bills-bulk'), payload, content_type='application/json')
+        # Esperar los borrados de PDF programados
+        get_cleanup_executor().submit(lambda: None).result()
+        return response
+
+    def test_delete_by_filter_defers_pdf_cleanup(self):
+        version = get_version(('bill',))
+        # Las mismas consultas con 5 o con 300 boletas: lectura de los PDF y de las boletas y un DELETE por tabla
+        with self.assertNumQueries(9):
+            response = self.post_bulk({'action': 'delete', 'filter': {'year': 2025, 'month': 3}})
+        self.assertEqual(response.json(), {'action': 'delete', 'count': 5})
+        self.assertEqual(list(Bill.objects.values_list('month', flat=True)), [4])
+        self.assertFalse(Charge.objects.exists())
+        self.assertEqual(os.listdir(self.storage_dir), [])
+        self.assertNotEqual(get_version(('bill',)), version)
+
+    def test_update_by_ids(self):
+        ids = [bill.pk for bill in self.bills[:2]]
+        response = self.post_bulk({'action': 'update', 'ids': ids, 'fields': {'year': 2024, 'tarifa': 'BT1'}})
+        self.assertEqual(response.json(), {'action': 'update', 'count': 2})
+        self.assertEqual(Bill.objects.filter(year=2024, tarifa='BT1').count(), 2)
+        self.assertEqual(len(os.listdir(self.storage_dir)), 5)
+
+    def test_meter_delete_releases_its_bills_pdfs(self):
+        meter = self.bills[0].meter
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('meter-delete', args=[meter.pk]))
+        get_cleanup_executor().submit(lambda: None).result()
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(sorted(os.listdir(self.storage_dir)), ['1.pdf', '2.pdf', '3.pdf', '4.pdf'])
+
+    def test_rejects_unknown_filters_and_repeated_periods(self):
+        response = self.post_bulk({'action': 'delete', 'filter': {'month': 3, 'yaer': 2025}})
+        self.assertEqual(response.status_code, 400)
+        response = self.post_bulk({'action': 'update', 'ids': [self.bills[-1].pk], 'fields': {'month': 4}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Bill.objects.count(), 6)
+
+
+class ReconcileStorageTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        old = time.time() - 7200
+        for name in ('linked.pdf', 'orphan.pdf', 'recent.pdf', 'batches/token/0.pdf'):
+            path = Path(self.storage_dir, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'%PDF')
+            if name != 'recent.pdf':
+                os.utime(path, (old, old))
+        Bill.objects.create(meter=meter, month=1, year=2025, total_to_pay=1000, pdf_filename='linked.pdf')
+        Bill.objects.create(meter=meter, month=2, year=2025, total_to_pay=1000, pdf_filename='missing.pdf')
+
+    def reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_storage', '--chunk-size', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_without_changes_by_default(self):
+        output = self.reconcile()
+        self.assertIn('1 huérfanos sin cambios', output)
+        self.assertIn('1 boletas sin su PDF', output)
+        self.assertNotIn('orphan.pdf', output)
+
+        output = self.reconcile('-v', '2')
+        self.assertIn('Huérfano: orphan.pdf', output)
+        self.assertIn('no existe missing.pdf', output)
+        self.assertNotIn('recent.pdf', output)
+        self.assertTrue(Path(self.storage_dir, 'orphan.pdf').exists())
+
+    def test_quarantines_old_orphans_only(self):
+        quarantine = Path(self.storage_dir, 'quarantine')
+        self.reconcile('--quarantine', str(quarantine))
+        self.assertEqual(os.listdir(quarantine), ['orphan.pdf'])
+        self.assertEqual(
+            sorted(os.listdir(self.storage_dir)), ['batches', 'linked.pdf', 'quarantine', 'recent.pdf']
+        )
+        self.assertTrue(Path(self.storage_dir, 'batches/token/0.pdf').exists())
@@ -8,6 +8,7 @@ urlpatterns = [
     # Endpoints para listar y editar/eliminar facturas
     path("bills/", views.BillListView.as_view(), name="bills-list"),
     path("bills/<int:pk>/", views.BillDetailView.as_view(), name="bills-detail"),
+    path("bills/bulk/", views.BillBulkView.as_view(), name="bills-bulk"),
 
     # Endpoint para obtener cargos de una factura específica
     path("bills/<int:pk>/charges/", views.BillChargesView.as_view(), name="bill-charges"),
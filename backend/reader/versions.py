@@ -0,0 +1,145 @@
+"""
+Versiones de los datos de lectura para las respuestas en caché de la API.
+
+Cada recurso ('bill', 'charge', 'meter') tiene un archivo en RESOURCE_VERSION_DIR cuyo contenido
+cambia con cada escritura del modelo: las señales de reader.apps cubren save() y delete(), y las
+escrituras masivas (bulk_create, bulk_update, update, delete de querysets) llaman a bump() o se
+agrupan con bulk_write().
+Al estar en disco, todos los procesos del servidor ven la misma versión sin consultar la base de datos.
+Es el único esquema de invalidación: los reportes y el análisis de writer también la usan (ver
+writer.reports.data_version).
+
+VersionedResponseMixin usa las versiones para responder GET con ETag (304 si el cliente ya tiene
+la respuesta) y para guardar la respuesta en la caché de Django por ruta, parámetros y versión.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+RESOURCES = ('bill', 'charge', 'meter')
+
+# Bloques bulk_write() abiertos en cada hilo
+_bulk = threading.local()
+
+
+def version_dir() -> Path:
+    path = Path(settings.RESOURCE_VERSION_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_version(resources) -> str:
+    parts = []
+    for resource in resources:
+        path = version_dir() / resource
+        try:
+            parts.append(path.read_text())
+        except FileNotFoundError:
+            # Directorio nuevo o borrado: una versión nueva, para no coincidir con las respuestas
+            # y reportes guardados con una versión anterior
+            write_version((resource,))
+            parts.append(path.read_text())
+    return '-'.join(parts)
+
+
+def write_version(resources) -> None:
+    directory = version_dir()
+    token = f"{time.time_ns()}.{os.getpid()}.{threading.get_ident()}"
+    for resource in resources:
+        # Escritura atómica: un lector nunca ve un archivo a medio escribir. El temporal es único
+        # por escritura, ya que varios hilos del proceso pueden escribir a la vez
+        tmp_path = directory / f'{resource}.{uuid.uuid4().hex}.tmp'
+        try:
+            tmp_path.write_text(token)
+            os.replace(tmp_path, directory / resource)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+
+def bump(*resources) -> None:
+    """
+    Cambia la versión de los recursos de inmediato y otra vez al confirmar la transacción: una
+    respuesta calculada antes de la confirmación con los datos anteriores no queda en caché
+    con la versión nueva.
+    """
+    write_version(resources)
+    transaction.on_commit(lambda: write_version(resources))
+
+
+@contextmanager
+def bulk_write(*resources):
+    """
+    Agrupa las escrituras de un bloque en un solo cambio de versión: dentro del bloque las señales
+    de los modelos no cambian las versiones y al terminar se llama a bump(*resources). Evita que
+    eliminar un queryset de boletas escriba las versiones una vez por fila.
+    """
+    _bulk.depth = getattr(_bulk, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _bulk.depth -= 1
+    bump(*resources)
+
+
+def connect_signals() -> None:
+    """
+    Cambia las versiones en save() y delete() de los modelos. Charge no tiene receptor de
+    post_delete: obligaría a Django a cargar cada cargo al eliminar querysets (ingest, reparse);
+    Charge.delete() y quien elimina querysets de cargos llaman a bump('charge').
+    """
+    from django.db.models.signals import post_delete, post_save
+
+    from .models import Bill, Charge, Meter
+
+    post_save.connect(bump_on_write('bill'), sender=Bill, weak=False, dispatch_uid='versions_bill_save')
+    post_save.connect(bump_on_write('charge'), sender=Charge, weak=False, dispatch_uid='versions_charge_save')
+    post_save.connect(bump_on_write('meter'), sender=Meter, weak=False, dispatch_uid='versions_meter_save')
+    # Al eliminar una boleta se eliminan en cascada sus cargos
+    post_delete.connect(bump_on_write('bill', 'charge'), sender=Bill, weak=False, dispatch_uid='versions_bill_delete')
+    post_delete.connect(bump_on_write('meter'), sender=Meter, weak=False, dispatch_uid='versions_meter_delete')
+
+
+def bump_on_write(*resources):
+    def receiver(sender, **kwargs):
+        if not getattr(_bulk, 'depth', 0):
+            bump(*resources)
+    return receiver
+
+
+class VersionedResponseMixin:
+    """
+    GET con ETag y caché de respuestas para vistas de DRF. `cache_resources` son los recursos de
+    los que depende la respuesta; cualquier escritura en ellos genera una respuesta nueva.
+    """
+    cache_resources = RESOURCES
+
+    def get(self, request, *args, **kwargs):
+        query = sorted((key, sorted(request.query_params.getlist(key))) for key in request.query_params)
+        key = hashlib.sha1(repr((request.path, query, get_version(self.cache_resources))).encode()).hexdigest()
+        etag = f'"{key[:32]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache_key = f'api:{key}'
+        data = cache.get(cache_key)
+        if data is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(cache_key, data, settings.API_CACHE_SECONDS)
+        return Response(data, headers=headers)
@@ -1,98 +1,320 @@
-from django.http import JsonResponse, FileResponse, Http404
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
+import asyncio
+import json
+import logging
 import os
 import tempfile
+from pathlib import Path
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 from .models import Meter, Bill, Charge
-from .reader import EnelReader, BillDetector, AguasAndinasReader
+from .reader import EnelReader, BillDetector, AguasAndinasReader, ParseBudget, ParseTimeout, READERS, parse_upload
+from .batches import create_batch, claim_batch, discard_batch
+from .ingest import release_unlinked_pdfs, upsert_bills
+from .storage import release_pdfs
+from .versions import VersionedResponseMixin, bulk_write, bump
+import shutil
 import uuid
 from rest_framework import generics, permissions
-from .serializers import BillSerializer
+from .serializers import BillSerializer, BulkBillSerializer
 from django.views.generic import ListView, DetailView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import MeterSerializer, ChargeSerializer
-from django.db.models import F, Value, IntegerField
+from .serializers import MeterSerializer, MeterStatsSerializer, ChargeSerializer
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Q, Subquery, Value
 from django.db.models.functions import Coalesce
 from rest_framework.generics import ListAPIView
+from rest_framework.pagination import PageNumberPagination
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
 
-class ProcessMultipleBillsView(APIView):
-    def post(self, request):
-        files = request.FILES.getlist('files')
-        results = []
 
-        storage_dir = 'storage/'
-        os.makedirs(storage_dir, exist_ok=True)
+STREAM_CONTENT_TYPE = 'application/x-ndjson'
+STREAM_HEARTBEAT_SECONDS = 10
 
-        for file in files:
-            # Crear archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                for chunk in file.chunks():
-                    tmp_file.write(chunk)
-                tmp_path = tmp_file.name
 
-            try:
-                # Detectar tipo de boleta
-                provider = BillDetector.detect_provider(tmp_path)
+def spool_upload(file) -> str:
+    """
+    Escribe un archivo subido en un archivo temporal y retorna su ruta.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        for chunk in file.chunks():
+            tmp_file.write(chunk)
+        return tmp_file.name
 
-                if provider == "enel":
-                    reader = EnelReader()
-                elif provider == "aguas":
-                    reader = AguasAndinasReader()
-                else:
-                    raise ValueError("No se pudo identificar el proveedor de la boleta")
 
-                # Procesar PDF con el reader correcto
-                bill_data = reader.process_bill(tmp_path)
+def wants_stream(request):
+    """
+    Modo streaming pedido con ?stream=ndjson o con el encabezado Accept: application/x-ndjson.
+    """
+    return request.GET.get('stream') == 'ndjson' or STREAM_CONTENT_TYPE in request.headers.get('Accept', '')
 
-                meter = Meter.objects.filter(client_number=bill_data.get('client_number')).first()
 
-                unique_pdf_name = f"{uuid.uuid4()}.pdf"  # Nombre único para el archivo PDF
+def ndjson_line(result) -> bytes:
+    return (json.dumps(result, cls=DjangoJSONEncoder) + '\n').encode()
 
-                # Obtener boleta
-                bill = Bill.objects.filter(
-                    meter=meter,
-                    month=bill_data.get('month'),
-                    year=bill_data.get('year'),
-                ).first()
 
-                if not bill.pdf_filename:
-                    bill.pdf_filename = unique_pdf_name
-                    bill.save()
-                if bill.pdf_filename == unique_pdf_name:
-                    # Guardar PDF en el sistema de archivos solo si se creó una nueva boleta
-                    with open(f'{storage_dir}/{unique_pdf_name}', 'wb+') as destination:
-                        for chunk in file.chunks():
-                            destination.write(chunk)
+def request_batch_token(request):
+    """
+    batch_token enviado como JSON o como campo de formulario (ambos los interpretan los parsers de DRF).
+    """
+    data = request.data
+    return data.get('batch_token') if hasattr(data, 'get') else None
 
-                results.append({
-                    'file': file.name,
-                    'status': 'procesado',
-                    'client_number': bill_data.get('client_number'),
-                    'month': bill_data.get('month'),
-                    'year': bill_data.get('year'),
-                    'total_amount': bill_data.get('total_amount')
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Permite pedir el modo streaming con Accept: application/x-ndjson. Las respuestas que no son
+    streaming (errores de DRF) se entregan como una sola línea JSON.
+    """
+    media_type = STREAM_CONTENT_TYPE
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ndjson_line(data)
+
+
+class ProcessMultipleBillsView(APIView):
+    """
+    POST /api/reader/process-multiple-bills/
+    Procesa y guarda las facturas recibidas en 'files', o confirma un lote ya validado
+    enviando 'batch_token' (retornado por validate-batch-bills/) sin volver a subir los archivos.
+    Con ?stream=ndjson (o Accept: application/x-ndjson) responde una línea JSON por archivo
+    apenas termina, en lugar del JSON final; en ese modo cada boleta se guarda por separado.
+
+    Es una vista de DRF como el resto de la API (autenticación, permisos, parsers y errores), pero
+    el trabajo por archivo es async: post() lo ejecuta con async_to_sync, que bajo ASGI lo corre en
+    el event loop del servidor. El análisis de cada PDF corre en el pool acotado de procesamiento
+    y la base de datos se usa fuera del event loop, así el proceso atiende otras peticiones
+    mientras se procesa el lote.
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
+    def post(self, request):
+        batch_token = request_batch_token(request)
+        if batch_token:
+            return async_to_sync(self.process_validated_batch)(batch_token)
+
+        files = request.FILES.getlist('files')
+        if wants_stream(request):
+            return self.stream_response(request, files)
+        return async_to_sync(self.process_files)(files)
+
+    async def process_files(self, files):
+        results = []
+        # Boletas extraídas que se guardan juntas al final del lote
+        parsed = []
+
+        for file in files:
+            entry, result = await self.parse_file(file)
+            results.append(result)
+            if entry is not None:
+                entry['index'] = len(results) - 1
+                parsed.append(entry)
+
+        await sync_to_async(self.save_parsed)(parsed, results)
+        return Response({'results': results})
+
+    async def parse_file(self, file):
+        """
+        Extrae los datos de un archivo subido y mueve su PDF al almacenamiento con un nombre único.
+        Retorna (entrada para save_parsed, None) o (None, resultado con el error).
+        """
+        storage_dir = settings.BILL_STORAGE_DIR
+        os.makedirs(storage_dir, exist_ok=True)
+
+        # Crear archivo temporal
+        tmp_path = await sync_to_async(spool_upload)(file)
+
+        # Presupuesto de tiempo para todo el procesamiento de este archivo
+        budget = ParseBudget()
+
+        try:
+            # Detectar tipo de boleta y extraer los datos con el reader correcto
+            provider, bill_data = await budget.arun(parse_upload, tmp_path, budget)
+            if provider is None:
+                raise ValueError("No se pudo identificar el proveedor de la boleta")
+
+            # El PDF se guarda con un nombre único antes de enlazarlo a la boleta
+            unique_pdf_name = f"{uuid.uuid4()}.pdf"
+            shutil.move(tmp_path, os.path.join(storage_dir, unique_pdf_name))
+
+            return {
+                'file': file.name,
+                'reader': READERS[provider](),
+                'bill_data': bill_data,
+                'pdf_filename': unique_pdf_name,
+            }, None
+
+        except ParseTimeout as e:
+            return None, {
+                'file': file.name,
+                'status': 'invalid',
+                'detail': str(e),
+                'extractor': e.extractor,
+                'timings': e.timings,
+            }
+        except Exception as e:
+            logger.exception("Error procesando la boleta %s", file.name)
+            return None, {
+                'file': file.name,
+                'status': 'error',
+                'error': str(e)
+            }
+        finally:
+            # Limpiar archivo temporal
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def stream_response(self, request, files):
+        """
+        Respuesta NDJSON: una línea por archivo apenas termina, con el mismo esquema de 'results'.
+        Bajo ASGI se envía una línea vacía cada STREAM_HEARTBEAT_SECONDS mientras un archivo
+        se procesa, para que los intermediarios no cierren la conexión inactiva.
+        """
+        if isinstance(request._request, ASGIRequest):
+            lines = self.stream_results(files)
+        else:
+            # WSGI acumula los iteradores async completos antes de enviarlos: se procesa
+            # cada archivo con su propio event loop, sin líneas de espera
+            lines = (ndjson_line(async_to_sync(self.process_file)(file)) for file in files)
+
+        response = StreamingHttpResponse(lines, content_type=STREAM_CONTENT_TYPE)
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream_results(self, files):
+        for file in files:
+            task = asyncio.ensure_future(self.process_file(file))
+            while not task.done():
+                done, _ = await asyncio.wait({task}, timeout=STREAM_HEARTBEAT_SECONDS)
+                if not done:
+                    yield b'\n'
+            yield ndjson_line(task.result())
+
+    async def process_file(self, file):
+        """
+        Procesa y guarda un archivo por separado (un upsert por boleta) y retorna su resultado.
+        """
+        entry, result = await self.parse_file(file)
+        if entry is None:
+            return result
+
+        results = [None]
+        entry['index'] = 0
+        await sync_to_async(self.save_parsed)([entry], results)
+        return results[0]
+
+    async def process_validated_batch(self, batch_token):
+        """
+        Guarda las facturas de un lote validado reutilizando los datos ya extraídos;
+        solo se escriben la base de datos y los PDF.
+        """
+        batch = await sync_to_async(claim_batch)(batch_token)
+        if batch is None:
+            return Response({
+                'error': 'El lote validado no existe o expiró. Vuelva a validar los archivos.'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        batch_path, manifest = batch
+        parsed = await sync_to_async(self.move_validated_pdfs)(batch_path, manifest)
+        results = [None] * len(parsed)
+
+        await sync_to_async(self.save_parsed)(parsed, results)
+        return Response({'results': results})
+
+    @staticmethod
+    def move_validated_pdfs(batch_path, manifest):
+        """
+        Mueve los PDF de un lote validado al almacenamiento con un nombre único y retorna las
+        entradas para save_parsed. Si un movimiento falla se eliminan los PDF ya movidos, que aún
+        no están enlazados a una boleta. El lote se descarta en ambos casos.
+        """
+        storage_dir = settings.BILL_STORAGE_DIR
+        os.makedirs(storage_dir, exist_ok=True)
+        parsed = []
+        completed = False
+        try:
+            for index, entry in enumerate(manifest['entries']):
+                unique_pdf_name = f"{uuid.uuid4()}.pdf"
+                stored_path = os.path.join(storage_dir, unique_pdf_name)
+                shutil.move(batch_path / entry['pdf'], stored_path)
+                # move conserva la fecha de la validación: reconcile_storage --min-age mide desde aquí
+                os.utime(stored_path)
+                bill_data = entry['bill_data']
+                if entry.get('pages'):
+                    bill_data['pages_compressed'] = (batch_path / entry['pages']).read_bytes()
+                parsed.append({
+                    'index': index,
+                    'file': entry['file'],
+                    'reader': READERS[entry['provider']](),
+                    'bill_data': bill_data,
+                    'pdf_filename': unique_pdf_name,
                 })
+            completed = True
+        finally:
+            if not completed:
+                for entry in parsed:
+                    Path(storage_dir, entry['pdf_filename']).unlink(missing_ok=True)
+            discard_batch(batch_path)
+        return parsed
+
+    @staticmethod
+    def save_parsed(parsed, results):
+        """
+        Guarda las boletas extraídas del lote con un solo upsert (ver reader.ingest)
+        y completa sus resultados. Los PDF que no quedan enlazados a una boleta se eliminan.
+        """
+        try:
+            outcomes = upsert_bills([
+                {
+                    'provider': entry['reader'].PROVIDER,
+                    'meter_type': entry['reader'].METER_TYPE,
+                    'bill_data': entry['bill_data'],
+                    'pdf_filename': entry['pdf_filename'],
+                }
+                for entry in parsed
+            ])
+        except Exception as e:
+            logger.exception("Error guardando un lote de %d boletas", len(parsed))
+            outcomes = [{'action': 'error', 'error': str(e), 'replaced_pdf': None} for _ in parsed]
 
-            except Exception as e:
-                results.append({
-                    'file': file.name,
+        release_unlinked_pdfs(parsed, outcomes)
+
+        for entry, outcome in zip(parsed, outcomes):
+            bill_data = entry['bill_data']
+            if outcome['action'] == 'error':
+                results[entry['index']] = {
+                    'file': entry['file'],
                     'status': 'error',
-                    'error': str(e)
-                })
-            finally:
-                # Limpiar archivo temporal
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
+                    'error': outcome['error']
+                }
+                continue
 
-        return JsonResponse({'results': results})
+            results[entry['index']] = {
+                'file': entry['file'],
+                # Una boleta ya existente que la política conserva se informa como omitida
+                'status': 'omitido' if outcome['action'] == 'skipped' else 'procesado',
+                'action': outcome['action'],
+                'client_number': bill_data.get('client_number'),
+                'month': bill_data.get('month'),
+                'year': bill_data.get('year'),
+                'total_amount': bill_data.get('total_amount')
+            }
 
 
-class BillListView(generics.ListAPIView):
+class BillListView(VersionedResponseMixin, generics.ListAPIView):
     """
     GET /api/reader/bills/?client_number=...&meter_type=...&month=...&year=...&start_date=...&end_date=...
     Lista facturas con filtros opcionales, incluyendo rango de fechas.
@@ -109,75 +331,171 @@ class BillListView(generics.ListAPIView):
 
     def get_queryset(self):
         qs = Bill.objects.select_related("meter").prefetch_related("charges").all()
-        client_number = self.request.query_params.get("client_number")
-        meter_type = self.request.query_params.get("meter_type")
-        month = self.request.query_params.get("month")
-        year = self.request.query_params.get("year")
-        start_date = self.request.query_params.get("start_date")  # Formato: YYYY-MM
-        end_date = self.request.query_params.get("end_date")      # Formato: YYYY-MM
-
-        if client_number:
-            qs = qs.filter(meter__client_number=client_number)
-        if meter_type:
-            qs = qs.filter(meter__meter_type=meter_type)
-        if month:
-            qs = qs.filter(month=month)
-        if year:
-            qs = qs.filter(year=year)
-
-        # Filtrar por rango de fechas
-        if start_date and end_date:
-            try:
-                start_year, start_month = map(int, start_date.split('-'))
-                end_year, end_month = map(int, end_date.split('-'))
-                start_period = start_year * 12 + start_month
-                end_period = end_year * 12 + end_month
-
-                # Anotar el período en meses y filtrar
-                qs = qs.annotate(
-                    period_in_months=Coalesce(F('year') * 12 + F('month'), Value(0, output_field=IntegerField()))
-                ).filter(
-                    period_in_months__gte=start_period,
-                    period_in_months__lte=end_period
-                )
-            except ValueError:
-                raise ValueError("Formato inválido de fechas. Use YYYY-MM.")
+        return filter_bills(qs, self.request.query_params)
 
-        return qs
 
-class BillDetailView(generics.RetrieveUpdateDestroyAPIView):
+def filter_bills(qs, params):
+    """
+    Aplica los filtros de BillListView (client_number, meter_type, month, year y el rango
+    start_date / end_date en formato YYYY-MM) tomados de `params`.
+    """
+    client_number = params.get("client_number")
+    meter_type = params.get("meter_type")
+    month = params.get("month")
+    year = params.get("year")
+    start_date = params.get("start_date")  # Formato: YYYY-MM
+    end_date = params.get("end_date")      # Formato: YYYY-MM
+
+    if client_number:
+        qs = qs.filter(meter__client_number=client_number)
+    if meter_type:
+        qs = qs.filter(meter__meter_type=meter_type)
+    if month:
+        qs = qs.filter(month=month)
+    if year:
+        qs = qs.filter(year=year)
+
+    # Filtrar por rango de fechas
+    if start_date and end_date:
+        try:
+            start_year, start_month = map(int, start_date.split('-'))
+            end_year, end_month = map(int, end_date.split('-'))
+            start_period = start_year * 12 + start_month
+            end_period = end_year * 12 + end_month
+
+            # Período en meses como alias, para que el queryset también sirva en update() y delete()
+            qs = qs.alias(
+                period_in_months=Coalesce(F('year') * 12 + F('month'), Value(0, output_field=IntegerField()))
+            ).filter(
+                period_in_months__gte=start_period,
+                period_in_months__lte=end_period
+            )
+        except ValueError:
+            raise ValueError("Formato inválido de fechas. Use YYYY-MM.")
+
+    return qs
+
+class BillDetailView(VersionedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     GET / PUT / DELETE para una factura por pk.
     """
     queryset = Bill.objects.select_related("meter").prefetch_related("charges").all()
     serializer_class = BillSerializer
 
+    @transaction.atomic
     def perform_destroy(self, instance):
-        # Eliminar PDF asociado en storage/ si existe antes de borrar la instancia
-        try:
-            pdf_name = instance.pdf_filename
-            if pdf_name:
-                file_path = os.path.join(settings.BASE_DIR, 'storage', pdf_name)
-                if os.path.exists(file_path):
-                    os.unlink(file_path)
-        except Exception as e:
-            # No interrumpir el borrado por errores al eliminar el archivo; registrar para debug
-            print(f"Warning: no se pudo eliminar el PDF asociado {getattr(instance, 'pdf_filename', None)}: {e}")
+        # El PDF asociado se elimina en segundo plano una vez confirmado el borrado
+        release_pdfs([instance.pdf_filename])
         return super().perform_destroy(instance)
 
 
-class MeterListView(APIView):
+class BillBulkView(APIView):
     """
-    GET /api/reader/meters/
-    Devuelve una lista de todos los medidores.
+    POST /api/reader/bills/bulk/
+    Edita o elimina varias facturas en una transacción, con una sentencia UPDATE o DELETE:
+      - ids: lista de ids, o filter: los filtros de BillListView ({"year": 2024, "month": 3, ...})
+      - action: "update" (asigna 'fields': meter_id, month, year, total_to_pay o tarifa) o "delete"
+    Responde {'action', 'count'}. Los PDF de las facturas eliminadas se borran en segundo plano.
     """
-    def get(self, request):
-        meters = Meter.objects.all()
-        serializer = MeterSerializer(meters, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-        
+    def post(self, request):
+        serializer = BulkBillSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if 'ids' in data:
+            bills = Bill.objects.filter(pk__in=data['ids'])
+        else:
+            bills = filter_bills(Bill.objects.all(), data['filter'])
+
+        try:
+            with transaction.atomic():
+                if data['action'] == 'update':
+                    # update() no cambia updated_at ni envía señales
+                    count = bills.update(**data['fields'], updated_at=timezone.now())
+                    if count:
+                        bump('bill')
+                else:
+                    release_pdfs(bills.exclude(pdf_filename=None).values_list('pdf_filename', flat=True))
+                    with bulk_write('bill', 'charge'):
+                        count = bills.delete()[1].get(Bill._meta.label, 0)
+        except IntegrityError:
+            return Response(
+                {'detail': 'La edición repetiría el período de una factura del mismo medidor.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response({'action': data['action'], 'count': count})
+
+
+class MeterPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
 
-class MeterDetailView(generics.RetrieveUpdateDestroyAPIView):
+
+class MeterListView(VersionedResponseMixin, generics.ListAPIView):
+    """
+    GET /api/reader/meters/?search=...&meter_type=...&page=...&page_size=...&stats=1
+    Lista los medidores:
+      - search: prefijo (sin distinguir mayúsculas) de client_number, name, macrozona o instalacion
+      - page / page_size: respuesta paginada ({count, next, previous, results}); sin 'page' se
+        devuelve la lista completa, como antes
+      - stats=1: agrega bill_count, last_period (YYYY-MM) y last_total de la última boleta,
+        calculados en la misma consulta
+    """
+    pagination_class = MeterPagination
+    cache_resources = ('meter', 'bill')
+
+    def get_serializer_class(self):
+        return MeterStatsSerializer if self.wants_stats() else MeterSerializer
+
+    def wants_stats(self):
+        return self.request.query_params.get('stats') in ('1', 'true')
+
+    def paginate_queryset(self, queryset):
+        if 'page' not in self.request.query_params:
+            return None
+        return super().paginate_queryset(queryset)
+
+    def get_queryset(self):
+        qs = Meter.objects.order_by('pk')
+        search = self.request.query_params.get('search', '').strip()
+        meter_type = self.request.query_params.get('meter_type')
+
+        if search:
+            # Prefijos con índice en PostgreSQL (migración 0014_meter_search_indexes)
+            qs = qs.filter(
+                Q(client_number__istartswith=search)
+                | Q(name__istartswith=search)
+                | Q(macrozona__istartswith=search)
+                | Q(instalacion__istartswith=search)
+            )
+        if meter_type:
+            qs = qs.filter(meter_type=meter_type)
+
+        if self.wants_stats():
+            last_bill = Bill.objects.filter(meter=OuterRef('pk')).order_by('-year', '-month')
+            qs = qs.annotate(
+                bill_count=Count('bills'),
+                last_period=Max(F('bills__year') * 12 + F('bills__month')),
+                last_total=Subquery(last_bill.values('total_to_pay')[:1]),
+            )
+        return qs
+
+
+class MeterDestroyMixin:
+    """
+    Al eliminar un medidor se eliminan en cascada sus boletas: sus PDF se borran en segundo plano
+    una vez confirmado el borrado.
+    """
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        release_pdfs(instance.bills.exclude(pdf_filename=None).values_list('pdf_filename', flat=True))
+        with bulk_write('meter', 'bill', 'charge'):
+            instance.delete()
+
+
+class MeterDetailView(MeterDestroyMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     GET / PUT / DELETE para un medidor por pk.
     """
@@ -202,7 +520,7 @@ class MeterUpdateView(generics.UpdateAPIView):
     queryset = Meter.objects.all()
     serializer_class = MeterSerializer
 
-class MeterDeleteView(generics.DestroyAPIView):
+class MeterDeleteView(MeterDestroyMixin, generics.DestroyAPIView):
     """
     DELETE /api/reader/meters/<pk>/delete/
     Elimina un medidor por pk.
@@ -210,12 +528,13 @@ class MeterDeleteView(generics.DestroyAPIView):
     queryset = Meter.objects.all()
     serializer_class = MeterSerializer
 
-class BillChargesView(ListAPIView):
+class BillChargesView(VersionedResponseMixin, ListAPIView):
     """
     GET /api/reader/bills/<pk>/charges/
     Devuelve los cargos asociados a una factura específica.
     """
     serializer_class = ChargeSerializer
+    cache_resources = ('charge',)
 
     def get_queryset(self):
         pk = self.kwargs.get('pk')  # Obtener el pk de la factura desde la URL
@@ -239,7 +558,7 @@ class DownloadBillView(APIView):
                 )
 
             # Construir la ruta completa al archivo
-            file_path = os.path.join(settings.BASE_DIR, 'storage', bill.pdf_filename)
+            file_path = os.path.join(settings.BILL_STORAGE_DIR, bill.pdf_filename)
 
             # Verificar si el archivo existe
             if not os.path.exists(file_path):
@@ -263,24 +582,28 @@ class ValidateBatchBillsView(APIView):
     - in_db: factura ya existente en la base de datos
     - invalid: factura con formato incorrecto o no reconocida
     - not_found: medidor no encontrado
+    Si hay facturas correctas retorna además 'batch_token', con el que
+    process-multiple-bills/ las guarda sin volver a subirlas ni procesarlas.
+    Vista de DRF con el trabajo por archivo async, igual que ProcessMultipleBillsView.
     """
     def post(self, request):
-        # Debug: ver qué está llegando en el request
-        print(f"DEBUG - request.FILES keys: {list(request.FILES.keys())}")
-        print(f"DEBUG - request.POST keys: {list(request.POST.keys())}")
-        
         files = request.FILES.getlist('files')
-        print(f"DEBUG - Número de archivos recibidos: {len(files)}")
-        
+        logger.debug("Validación de %d archivos (campos: %s)", len(files), list(request.FILES.keys()))
+
         if not files:
-            return JsonResponse({
+            return Response({
                 'error': 'No se recibieron archivos. Verifique que está seleccionando archivos PDF.'
-            }, status=400)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return async_to_sync(self.validate_files)(files)
+
+    async def validate_files(self, files):
         
         results = []
-        seen_keys = set()
         lote_keys = set()
+        # Facturas que pasaron las validaciones del PDF; su archivo temporal se conserva
+        pending = []
 
+        # Fase 1: procesar todos los archivos
         for file in files:
             # Validar primero que sea un archivo PDF
             if not file.name.lower().endswith('.pdf'):
@@ -291,20 +614,15 @@ class ValidateBatchBillsView(APIView):
                 })
                 continue
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                for chunk in file.chunks():
-                    tmp_file.write(chunk)
-                tmp_path = tmp_file.name
+            tmp_path = await sync_to_async(spool_upload)(file)
+
+            # Presupuesto de tiempo para todo el procesamiento de este archivo
+            budget = ParseBudget()
+            keep_tmp = False
 
             try:
-                provider = BillDetector.detect_provider(tmp_path)
-                if provider == "enel":
-                    reader = EnelReader()
-                    bill_data = reader.validate_bill(tmp_path)
-                elif provider == "aguas":
-                    reader = AguasAndinasReader()
-                    bill_data = reader.validate_bill(tmp_path)
-                else:
+                provider, bill_data = await budget.arun(parse_upload, tmp_path, budget, validate=True)
+                if provider is None:
                     results.append({
                         'file': file.name,
                         'status': 'invalid',
@@ -318,11 +636,7 @@ class ValidateBatchBillsView(APIView):
                     bill_data.get('year'),
                 )
 
-                # Debug: imprimir información de extracción
-                print(f"Archivo: {file.name}")
-                print(f"  Cliente: {bill_data.get('client_number')}")
-                print(f"  Mes: {bill_data.get('month')}, Año: {bill_data.get('year')}")
-                print(f"  Key: {key}")
+                logger.debug("%s: cliente %s, período %s/%s", file.name, *key)
 
                 # Verificar si se pudo extraer la fecha
                 if bill_data.get('month') is None or bill_data.get('year') is None:
@@ -352,36 +666,25 @@ class ValidateBatchBillsView(APIView):
                     })
                     continue
 
-                # Verifica existencia en la base de datos
-                meter = Meter.objects.filter(client_number=bill_data.get('client_number')).first()
-                if not meter:
-                    results.append({
-                        'file': file.name,
-                        'status': 'not_found',
-                        'detail': f'El medidor {bill_data.get("client_number")} no existe',
-                        'meter': bill_data.get("client_number")
-                    })
-                    continue
-
-                exists = Bill.objects.filter(
-                    meter=meter,
-                    month=bill_data.get('month'),
-                    year=bill_data.get('year'),
-                ).exists()
-
-                if exists:
-                    results.append({
-                        'file': file.name,
-                        'status': 'in_db',
-                        'detail': 'Ya existe en la base de datos.'
-                    })
-                else:
-                    results.append({
-                        'file': file.name,
-                        'status': 'correct',
-                        'detail': 'Factura válida y no duplicada.'
-                    })
+                # La existencia en la base de datos se resuelve para todo el lote al final
+                results.append(None)
+                pending.append({
+                    'index': len(results) - 1,
+                    'file': file.name,
+                    'provider': provider,
+                    'bill_data': bill_data,
+                    'tmp_path': tmp_path,
+                })
+                keep_tmp = True
 
+            except ParseTimeout as e:
+                results.append({
+                    'file': file.name,
+                    'status': 'invalid',
+                    'detail': str(e),
+                    'extractor': e.extractor,
+                    'timings': e.timings,
+                })
             except Exception as e:
                 results.append({
                     'file': file.name,
@@ -389,7 +692,82 @@ class ValidateBatchBillsView(APIView):
                     'detail': str(e)
                 })
             finally:
-                if os.path.exists(tmp_path):
+                if not keep_tmp and os.path.exists(tmp_path):
                     os.unlink(tmp_path)
 
-        return JsonResponse({'results': results})
+        # Fase 2: verificar medidores y facturas existentes con una consulta para cada uno
+        validated = []
+        for entry, result in await self._resolve_against_db(pending):
+            results[entry['index']] = result
+            if result['status'] == 'correct':
+                validated.append(entry)
+            elif os.path.exists(entry['tmp_path']):
+                os.unlink(entry['tmp_path'])
+
+        response = {'results': results}
+        if validated:
+            # Guardar los archivos y datos extraídos para confirmar el lote sin reprocesarlo
+            response['batch_token'] = await sync_to_async(create_batch)(validated)
+
+        return Response(response)
+
+    @staticmethod
+    async def _resolve_against_db(pending):
+        """
+        Determina el estado (not_found, in_db o correct) de las facturas pendientes del lote.
+        Usa una sola consulta para los medidores y otra para las facturas, sin importar el tamaño del lote.
+        """
+        if not pending:
+            return []
+
+        client_numbers = {entry['bill_data']['client_number'] for entry in pending}
+        meters = {}
+        # client_number no es único: se usa el primer medidor por pk, igual que .first()
+        async for meter_id, client_number in (
+            Meter.objects.filter(client_number__in=client_numbers)
+            .order_by('pk')
+            .values_list('id', 'client_number')
+        ):
+            meters.setdefault(client_number, meter_id)
+
+        keys = {
+            (meters[entry['bill_data']['client_number']], entry['bill_data']['month'], entry['bill_data']['year'])
+            for entry in pending
+            if entry['bill_data']['client_number'] in meters
+        }
+        existing = set()
+        if keys:
+            # Superconjunto acotado por los medidores, meses y años del lote; se filtra en memoria
+            existing = {
+                row async for row in Bill.objects.filter(
+                    meter_id__in={meter_id for meter_id, _, _ in keys},
+                    month__in={month for _, month, _ in keys},
+                    year__in={year for _, _, year in keys},
+                ).values_list('meter_id', 'month', 'year')
+            } & keys
+
+        resolved = []
+        for entry in pending:
+            file_name, bill_data = entry['file'], entry['bill_data']
+            client_number = bill_data['client_number']
+            if client_number not in meters:
+                result = {
+                    'file': file_name,
+                    'status': 'not_found',
+                    'detail': f'El medidor {client_number} no existe',
+                    'meter': client_number
+                }
+            elif (meters[client_number], bill_data['month'], bill_data['year']) in existing:
+                result = {
+                    'file': file_name,
+                    'status': 'in_db',
+                    'detail': 'Ya existe en la base de datos.'
+                }
+            else:
+                result = {
+                    'file': file_name,
+                    'status': 'correct',
+                    'detail': 'Factura válida y no duplicada.'
+                }
+            resolved.append((entry, result))
+        return resolved
@@ -0,0 +1,11 @@
+#!/bin/sh
+# Inicia el backend según SERVER_MODE:
+# - production (por defecto): gunicorn con varios procesos e hilos (gunicorn.conf.py)
+# - development: servidor de desarrollo de Django
+set -e
+
+if [ "${SERVER_MODE:-production}" = "development" ]; then
+    exec python manage.py runserver 0.0.0.0:8000
+fi
+
+exec gunicorn -c gunicorn.conf.py
@@ -0,0 +1,72 @@
+"""
+Agregados de consumo y costo calculados en la base de datos, para los paneles de análisis.
+
+Cada fila agrupa las boletas por un campo del medidor (opcional) y por mes o año, con la cantidad
+de boletas, el total a pagar, el consumo en kWh y m3 (cargos de CONSUMPTION_CHARGES) y el monto
+de los cargos pedidos por nombre.
+"""
+from typing import Iterable, Optional
+
+from django.db.models import Count, Q, Sum
+
+from reader.models import Charge
+
+from .reports import CONSUMPTION_CHARGES
+
+# Agrupación -> campos de Bill que la forman
+GROUP_FIELDS = {
+    'meter': ('meter_id', 'meter__client_number', 'meter__meter_type'),
+    'macrozona': ('meter__macrozona',),
+    'instalacion': ('meter__instalacion',),
+    'meter_type': ('meter__meter_type',),
+}
+
+INTERVAL_FIELDS = {
+    'month': ('year', 'month'),
+    'year': ('year',),
+}
+
+# Columna de consumo -> tipo de medidor cuyo cargo de consumo suma
+CONSUMPTION_COLUMNS = {'kwh': 'ELECTRICITY', 'm3': 'WATER'}
+
+
+def field_label(field: str) -> str:
+    return field.rsplit('__', 1)[-1]
+
+
+def aggregate_bills(bills, group_by: Optional[str] = None, interval: str = 'month', charges: Iterable[str] = ()):
+    """
+    Agrega el queryset de boletas con dos consultas agrupadas por los mismos campos: una sobre las
+    boletas (cantidad y total) y otra sobre sus cargos (consumo y montos), para no duplicar el total
+    de cada boleta por la unión con sus cargos. Retorna las filas ordenadas por grupo y período.
+    """
+    charges = list(charges)
+    keys = GROUP_FIELDS.get(group_by, ()) + INTERVAL_FIELDS[interval]
+
+    rows = {}
+    for row in bills.values(*keys).annotate(bills=Count('pk'), total=Sum('total_to_pay')).order_by(*keys):
+        rows[tuple(row[key] for key in keys)] = {
+            **{field_label(key): row[key] for key in keys},
+            'bills': row['bills'],
+            'total_to_pay': float(row['total']),
+            **{column: 0.0 for column in CONSUMPTION_COLUMNS},
+            'charges': {name: 0 for name in charges},
+        }
+
+    pivot = {
+        column: Sum('value', filter=Q(bill__meter__meter_type=meter_type, name__icontains=CONSUMPTION_CHARGES[meter_type]))
+        for column, meter_type in CONSUMPTION_COLUMNS.items()
+    }
+    for index, name in enumerate(charges):
+        pivot[f'c{index}'] = Sum('charge', filter=Q(name=name))
+    charge_keys = [f'bill__{key}' for key in keys]
+    charge_rows = Charge.objects.filter(bill__in=bills.values('pk')).values(*charge_keys).annotate(**pivot).order_by()
+    for row in charge_rows:
+        result = rows.get(tuple(row[key] for key in charge_keys))
+        if result is None:
+            continue
+        for column in CONSUMPTION_COLUMNS:
+            result[column] = float(row[column] or 0)
+        for index, name in enumerate(charges):
+            result['charges'][name] = row[f'c{index}'] or 0
+    return list(rows.values())
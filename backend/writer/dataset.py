@@ -0,0 +1,125 @@
+"""
+Boletas de un tipo de medidor y rango de períodos en formato columnar, compartidas por la
+exportación Excel y los cálculos de análisis.
+
+Se cargan con values_list desde la matriz boletas × cargos de writer.reports.charge_matrix, sin
+instanciar modelos, en arreglos tipados de pandas/NumPy:
+- bills: una fila por boleta (índice bill_id) con meter_id, year, month, period (año * 12 + mes),
+  total_to_pay, consumption y los datos de identificación.
+- quantities / amounts: boletas × cargos con la cantidad en m3/kWh y el monto en $; NaN sin valor.
+
+Este módulo importa pandas, por lo que se importa al usarlo y no al iniciar Django.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .reports import CONSUMPTION_CHARGES, charge_matrix, charge_names, report_bills
+
+# Columnas de la consulta -> (columna del DataFrame, dtype)
+BILL_FIELDS = {
+    'pk': ('bill_id', 'int64'),
+    'meter_id': ('meter_id', 'int64'),
+    'year': ('year', 'int32'),
+    'month': ('month', 'int32'),
+    'total_to_pay': ('total_to_pay', 'float64'),
+    'consumption': ('consumption', 'float64'),
+    'invoice_number': ('invoice_number', object),
+    'tarifa': ('tarifa', object),
+    'meter__client_number': ('client_number', object),
+    'meter__macrozona': ('macrozona', object),
+    'meter__instalacion': ('instalacion', object),
+    'meter__direccion': ('direccion', object),
+}
+
+
+class BillDataset:
+    def __init__(self, meter_type: str, bills: pd.DataFrame, quantities: pd.DataFrame, amounts: pd.DataFrame):
+        self.meter_type = meter_type
+        self.bills = bills
+        self.quantities = quantities
+        self.amounts = amounts
+
+    @classmethod
+    def load(cls, meter_type: str, start_period: Optional[int] = None, end_period: Optional[int] = None,
+             meters=None, charges: bool = True):
+        """
+        Carga las boletas del tipo y rango (ver report_bills) con dos consultas: los nombres de
+        los cargos incluidos y la matriz boletas × cargos.
+        `meters` limita la carga a esos medidores (ids o queryset de ids); con charges=False no se
+        cargan las columnas de cargos y quantities/amounts quedan sin columnas.
+        """
+        queryset = report_bills(meter_type, start_period, end_period)
+        if meters is not None:
+            queryset = queryset.filter(meter_id__in=meters)
+        names = charge_names(queryset) if charges else []
+        quantity_fields = [f'q{index}' for index in range(len(names))]
+        amount_fields = [f'a{index}' for index in range(len(names))]
+        fields = list(BILL_FIELDS) + quantity_fields + amount_fields
+
+        rows = charge_matrix(queryset, names, CONSUMPTION_CHARGES[meter_type]).values_list(*fields)
+        frame = pd.DataFrame.from_records(list(rows), columns=fields)
+
+        bills = frame[list(BILL_FIELDS)].rename(columns={field: column for field, (column, _) in BILL_FIELDS.items()})
+        bills = bills.astype({column: dtype for column, dtype in BILL_FIELDS.values()})
+        bills['period'] = bills['year'] * 12 + bills['month']
+        bills = bills.set_index('bill_id')
+
+        def charge_frame(charge_fields):
+            values = frame[charge_fields].to_numpy(dtype='float64', na_value=np.nan)
+            return pd.DataFrame(values, index=bills.index, columns=names)
+
+        return cls(meter_type, bills, charge_frame(quantity_fields), charge_frame(amount_fields))
+
+    def __len__(self):
+        return len(self.bills)
+
+    @property
+    def charge_names(self) -> list:
+        return list(self.amounts.columns)
+
+    def totals_by_period(self) -> pd.DataFrame:
+        """
+        Por período: cantidad de boletas, total a pagar y consumo.
+        """
+        return self.bills.groupby('period').agg(
+            bills=('total_to_pay', 'size'),
+            total_to_pay=('total_to_pay', 'sum'),
+            consumption=('consumption', 'sum'),
+        )
+
+    def charge_totals(self) -> pd.DataFrame:
+        """
+        Por cargo: cantidad y monto sumados en todas las boletas.
+        """
+        return pd.DataFrame({'quantity': self.quantities.sum(), 'amount': self.amounts.sum()})
+
+    def anomaly_scores(self, window: int = 12, min_history: int = 4, min_relative_std: float = 0.05) -> pd.DataFrame:
+        """
+        Compara cada boleta con la historia de su medidor, para todos los medidores a la vez.
+        Por boleta (índice bill_id) y para consumption y total_to_pay:
+        - <métrica>_z: z-score frente a la media y desviación de las `window` boletas anteriores del
+          medidor (al menos min_history). La desviación tiene un mínimo de min_relative_std veces la
+          media, para que una historia plana no convierta cualquier variación en anomalía.
+        - <métrica>_yoy: variación respecto de la boleta del mismo mes del año anterior.
+        """
+        bills = self.bills.sort_values(['meter_id', 'period'])
+        meters = bills['meter_id']
+        last_year = pd.MultiIndex.from_arrays([meters, bills['period'] - 12])
+        scores = pd.DataFrame(index=bills.index)
+
+        for metric, column in (('consumption', 'consumption'), ('total', 'total_to_pay')):
+            values = bills[column]
+            # Solo las boletas anteriores forman la base de comparación
+            previous = values.groupby(meters, sort=False).shift(1)
+            rolling = previous.groupby(meters, sort=False).rolling(window, min_periods=min_history)
+            mean = rolling.mean().droplevel(0)
+            std = np.maximum(rolling.std().droplevel(0), mean.abs() * min_relative_std)
+            scores[f'{metric}_z'] = (values - mean) / std.where(std > 0)
+
+            by_period = pd.Series(values.to_numpy(), index=pd.MultiIndex.from_arrays([meters, bills['period']]))
+            reference = pd.Series(by_period.reindex(last_year).to_numpy(), index=bills.index)
+            scores[f'{metric}_yoy'] = values / reference.where(reference > 0) - 1
+
+        return scores.replace([np.inf, -np.inf], np.nan)
@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from reader.models import Bill, BillAnomalyScore
+
+SCORE_FIELDS = ['consumption_z', 'total_z', 'consumption_yoy', 'total_yoy']
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca las boletas cuyo consumo o total se aleja de la historia de su medidor (z-score "
+        "frente a las boletas anteriores) y guarda los puntajes en BillAnomalyScore. Por defecto "
+        "solo puntúa las boletas nuevas o modificadas desde su último puntaje, cargando la historia "
+        "de sus medidores"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Volver a puntuar todas las boletas")
+        parser.add_argument('--window', type=int, default=12, help="Boletas anteriores que forman la base")
+        parser.add_argument('--min-history', type=int, default=4,
+                            help="Boletas anteriores necesarias para puntuar")
+        parser.add_argument('--threshold', type=float, default=4.0,
+                            help="Valor absoluto del z-score desde el que se marca la boleta")
+
+    def handle(self, *args, **options):
+        # pandas se importa al usarlo (ver writer.dataset)
+        from writer.dataset import BillDataset
+
+        self.verbosity = options['verbosity']
+        if options['min_history'] < 2 or options['window'] < options['min_history']:
+            raise CommandError("Se requiere 2 <= --min-history <= --window")
+
+        start = time.perf_counter()
+        pending = Bill.objects.all()
+        if not options['full']:
+            pending = pending.filter(Q(anomaly_score__isnull=True) | Q(updated_at__gt=F('anomaly_score__scored_at')))
+
+        counts = {'scored': 0, 'flagged': 0}
+        for meter_type in ('WATER', 'ELECTRICITY'):
+            pending_of_type = pending.filter(meter__meter_type=meter_type)
+            meters = None if options['full'] else pending_of_type.values('meter_id')
+            dataset = BillDataset.load(meter_type, meters=meters, charges=False)
+            if not len(dataset):
+                continue
+            scores = dataset.anomaly_scores(options['window'], options['min_history'])
+            if not options['full']:
+                scores = scores[scores.index.isin(list(pending_of_type.values_list('pk', flat=True)))]
+            self.save(scores, options['threshold'], counts)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['scored']} boletas puntuadas en {time.perf_counter() - start:.2f}s, "
+            f"{counts['flagged']} marcadas"
+        ))
+
+    def save(self, scores, threshold, counts):
+        flagged = (scores['consumption_z'].abs() >= threshold) | (scores['total_z'].abs() >= threshold)
+        # None en lugar de NaN para la base de datos
+        values = scores[SCORE_FIELDS].astype(object).where(scores[SCORE_FIELDS].notna(), None)
+        now = timezone.now()
+        rows = [
+            BillAnomalyScore(bill_id=bill_id, flagged=is_flagged, scored_at=now, **dict(zip(SCORE_FIELDS, row)))
+            for bill_id, is_flagged, row in zip(
+                scores.index.tolist(), flagged.tolist(), values.itertuples(index=False, name=None)
+            )
+        ]
+        BillAnomalyScore.objects.bulk_create(
+            rows,
+            batch_size=2000,
+            update_conflicts=True,
+            unique_fields=['bill'],
+            update_fields=SCORE_FIELDS + ['flagged', 'scored_at'],
+        )
+        counts['scored'] += len(rows)
+        counts['flagged'] += sum(row.flagged for row in rows)
+
+        if self.verbosity > 1:
+            for row in rows:
+                if row.flagged:
+                    self.stdout.write(
+                        f"Bill {row.bill_id}: consumo z={row.consumption_z} yoy={row.consumption_yoy}, "
+                        f"total z={row.total_z} yoy={row.total_yoy}"
+                    )
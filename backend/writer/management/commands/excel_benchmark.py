@@ -0,0 +1,102 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reader.models import Bill, Charge, Meter
+from writer.views import ExportExcelView, SheetStyles
+
+# Cargos de una boleta de agua simulada: (nombre, valor, tipo de valor, monto)
+SAMPLE_CHARGES = [
+    ('CONSUMO AGUA', 24, 'm3', 21500),
+    ('CARGO FIJO', 0, '', 950),
+    ('RECOLECCION AGUAS SERVIDAS', 24, 'm3', 14200),
+    ('TRATAMIENTO AGUAS SERVIDAS', 24, 'm3', 9800),
+    ('INTERES Y REAJUSTE', 0, '', 120),
+    ('AJUSTE SENCILLO', 0, '', -8),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la generación de la hoja Excel de agua (filas por segundo) y el tiempo de guardado "
+        "del libro con boletas simuladas. Las boletas se crean en una transacción que se revierte "
+        "al terminar"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bills', type=int, default=10000, help="Boletas simuladas")
+        parser.add_argument('--meters', type=int, default=500, help="Medidores entre los que se reparten")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.create_bills(options['bills'], options['meters'])
+                self.measure()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_bills(self, count, meter_count):
+        start = time.perf_counter()
+        meters = Meter.objects.bulk_create([
+            Meter(
+                meter_type='WATER',
+                client_number=f"bench-{index}",
+                macrozona='Macrozona',
+                instalacion=f"Instalación {index}",
+                direccion=f"Dirección de prueba {index}",
+            )
+            for index in range(meter_count)
+        ])
+        bills = Bill.objects.bulk_create([
+            Bill(
+                meter=meters[index % meter_count],
+                # Períodos distintos para cada boleta del mismo medidor
+                month=(index // meter_count) % 12 + 1,
+                year=1900 + index // (meter_count * 12),
+                total_to_pay=46562,
+                invoice_number=str(index),
+                reader='aguas',
+                reader_version=1,
+            )
+            for index in range(count)
+        ])
+        Charge.objects.bulk_create([
+            Charge(bill=bill, name=name, value=value, value_type=value_type, charge=charge)
+            for bill in bills
+            for name, value, value_type, charge in SAMPLE_CHARGES
+        ], batch_size=5000)
+        self.stdout.write(f"{count} boletas simuladas creadas en {time.perf_counter() - start:.2f}s")
+
+    def measure(self):
+        from openpyxl import Workbook
+
+        from writer.dataset import BillDataset
+
+        # Solo las boletas simuladas: sus períodos (años 1900+) no se cruzan con datos reales
+        start = time.perf_counter()
+        dataset = BillDataset.load('WATER', 0, 1950 * 12)
+        load_time = time.perf_counter() - start
+        total = len(dataset)
+
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        start = time.perf_counter()
+        ExportExcelView()._create_formatted_sheet(workbook, 'Agua', dataset, 'Consumo [m3]', SheetStyles())
+        build_time = time.perf_counter() - start
+
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as output:
+            start = time.perf_counter()
+            workbook.save(output.name)
+            save_time = time.perf_counter() - start
+
+        self.stdout.write(
+            f"Carga: {load_time:.2f}s; hoja: {total} filas en {build_time:.2f}s ({total / build_time:.0f} filas/s); "
+            f"guardado: {save_time:.2f}s"
+        )
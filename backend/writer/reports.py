@@ -0,0 +1,212 @@
+"""
+Reportes Excel generados en segundo plano.
+
+Cada reporte se identifica por (meter_type, start_date, end_date, versión de los datos). La versión
+es la de reader.versions, que cambia con cada escritura de boletas, cargos o medidores. El archivo
+terminado queda en EXCEL_REPORT_DIR y se entrega directamente mientras la versión no cambie.
+
+El estado se guarda en disco para que lo compartan todos los procesos del servidor:
+- <nombre>.xlsx: reporte terminado.
+- <nombre>.building: reporte en generación; se considera abandonado después de EXCEL_REPORT_TIMEOUT_SECONDS.
+- <nombre>.error: mensaje del último intento fallido.
+"""
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F, Max, Q, Sum
+
+from reader.models import Bill, Charge
+from reader.versions import RESOURCES, get_version
+
+logger = logging.getLogger(__name__)
+
+# Tipos de valor que son una cantidad consumida (columna m3/kWh de la desagregación)
+QUANTITY_VALUE_TYPES = ('m3', 'kWh')
+# Tipos de valor de datos de contexto, que sin monto no son cargos
+INFORMATIVE_VALUE_TYPES = ('código', 'fecha', 'texto', 'número')
+# Tarifas unitarias y datos informativos: no son cargos aplicados aunque tengan valor
+INFORMATIVE_NAME_PREFIXES = ('Tarifa',)
+INFORMATIVE_NAME_PARTS = ('Factor de cobro', 'Grupo tarifario', 'Último pago', 'Diámetro arranque')
+# Cargo del que se toma el consumo de cada tipo de medidor
+CONSUMPTION_CHARGES = {'WATER': 'CONSUMO AGUA', 'ELECTRICITY': 'Electricidad Consumida'}
+
+
+def reports_dir() -> Path:
+    path = Path(settings.EXCEL_REPORT_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@lru_cache(maxsize=None)
+def get_report_executor() -> ThreadPoolExecutor:
+    """
+    Pool acotado de hilos donde se generan los reportes, para que varias exportaciones
+    simultáneas no compitan con las peticiones por la CPU.
+    """
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, 'EXCEL_REPORT_WORKERS', 1),
+        thread_name_prefix='excel-report',
+    )
+
+
+def report_bills(meter_type: Optional[str], start_period: Optional[int] = None, end_period: Optional[int] = None):
+    """
+    Boletas de un tipo de medidor (de todos si es None) cuyo período (año * 12 + mes) está en el
+    rango; sin rango, todas.
+    """
+    bills = Bill.objects.all()
+    if meter_type is not None:
+        bills = bills.filter(meter__meter_type=meter_type)
+    if start_period is not None:
+        # Los años del rango permiten usar el índice (year, month); el período recorta los meses de los extremos
+        bills = bills.filter(year__gte=(start_period - 1) // 12, year__lte=(end_period - 1) // 12)
+        bills = bills.alias(period=F('year') * 12 + F('month')).filter(
+            period__gte=start_period, period__lte=end_period
+        )
+    return bills
+
+
+def has_amount(prefix: str = '') -> Q:
+    """
+    Cargos con monto en $, incluidos los negativos (descuentos).
+    `prefix` aplica el filtro desde otro modelo, por ejemplo 'charges__' desde Bill.
+    """
+    return ~Q(**{f'{prefix}charge': 0})
+
+
+def has_quantity(prefix: str = '') -> Q:
+    """
+    Cargos con una cantidad consumida positiva.
+    """
+    return Q(**{f'{prefix}value__gt': 0, f'{prefix}value_type__in': QUANTITY_VALUE_TYPES})
+
+
+def included_charges(prefix: str = '') -> Q:
+    """
+    Cargos que forman la desagregación de los reportes: los que tienen monto o cantidad, excepto
+    los datos informativos (códigos, fechas o textos sin monto y tarifas unitarias).
+    """
+    informative = Q(**{f'{prefix}value_type__in': INFORMATIVE_VALUE_TYPES, f'{prefix}charge': 0})
+    for name_prefix in INFORMATIVE_NAME_PREFIXES:
+        informative |= Q(**{f'{prefix}name__startswith': name_prefix})
+    for part in INFORMATIVE_NAME_PARTS:
+        informative |= Q(**{f'{prefix}name__contains': part})
+    return (has_amount(prefix) | has_quantity(prefix)) & ~informative
+
+
+def charge_names(bills) -> list:
+    """
+    Nombres de los cargos incluidos en la desagregación de las boletas, ordenados.
+    """
+    names = Charge.objects.filter(included_charges(), bill__in=bills).values_list('name', flat=True).distinct()
+    return sorted(names)
+
+
+def charge_matrix(bills, names, consumption_charge: str):
+    """
+    Boletas × cargos en una sola consulta con agregación condicional: una fila por boleta con sus
+    datos, el consumo ('consumption', valor del cargo cuyo nombre contiene consumption_charge) y,
+    para el cargo names[i], la cantidad 'q<i>' y el monto 'a<i>'. Las celdas sin valor son None.
+    """
+    pivot = {'consumption': Max('charges__value', filter=Q(charges__name__icontains=consumption_charge))}
+    for index, name in enumerate(names):
+        is_charge = Q(charges__name=name)
+        pivot[f'q{index}'] = Sum('charges__value', filter=is_charge & has_quantity('charges__'))
+        pivot[f'a{index}'] = Sum('charges__charge', filter=is_charge & has_amount('charges__'))
+    return bills.order_by('pk').values(
+        'pk', 'meter_id', 'invoice_number', 'tarifa', 'month', 'year', 'total_to_pay',
+        'meter__client_number', 'meter__macrozona', 'meter__instalacion', 'meter__direccion',
+    ).annotate(**pivot)
+
+
+def data_version() -> str:
+    """
+    Versión de las boletas, cargos y medidores (ver reader.versions): cambia con cualquier escritura
+    y se lee de disco, sin consultar la base de datos.
+    """
+    return hashlib.sha1(get_version(RESOURCES).encode()).hexdigest()[:16]
+
+
+def report_status(name: str) -> Tuple[str, Optional[str]]:
+    """
+    Retorna ('ready', ruta), ('pending', None), ('failed', mensaje) o ('missing', None).
+    """
+    directory = reports_dir()
+    path = directory / f'{name}.xlsx'
+    if path.exists():
+        return 'ready', str(path)
+
+    marker = directory / f'{name}.building'
+    try:
+        if time.time() - marker.stat().st_mtime < settings.EXCEL_REPORT_TIMEOUT_SECONDS:
+            return 'pending', None
+    except FileNotFoundError:
+        pass
+
+    error = directory / f'{name}.error'
+    if error.exists():
+        return 'failed', error.read_text(encoding='utf-8')
+    return 'missing', None
+
+
+def request_report(name: str, build: Callable[[str], None]) -> None:
+    """
+    Encola la generación del reporte si no está listo ni en curso en algún proceso.
+    `build` recibe la ruta donde escribir el .xlsx.
+    """
+    directory = reports_dir()
+    marker = directory / f'{name}.building'
+    if marker.exists() and time.time() - marker.stat().st_mtime >= settings.EXCEL_REPORT_TIMEOUT_SECONDS:
+        # El proceso que lo generaba terminó sin terminar el reporte
+        marker.unlink(missing_ok=True)
+    try:
+        # O_EXCL: solo un proceso toma la generación de cada reporte
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return
+
+    (directory / f'{name}.error').unlink(missing_ok=True)
+    get_report_executor().submit(run_report, name, build)
+
+
+def discard_failure(name: str) -> None:
+    (reports_dir() / f'{name}.error').unlink(missing_ok=True)
+
+
+def run_report(name: str, build: Callable[[str], None]) -> None:
+    directory = reports_dir()
+    marker = directory / f'{name}.building'
+    tmp_path = directory / f'{name}.xlsx.tmp'
+    close_old_connections()
+    start = time.perf_counter()
+    try:
+        build(str(tmp_path))
+        os.replace(tmp_path, directory / f'{name}.xlsx')
+        logger.info("Reporte %s generado en %.1fs", name, time.perf_counter() - start)
+        purge_previous_versions(name)
+    except Exception as e:
+        logger.exception("Error generando el reporte %s", name)
+        (directory / f'{name}.error').write_text(str(e) or e.__class__.__name__, encoding='utf-8')
+        tmp_path.unlink(missing_ok=True)
+    finally:
+        marker.unlink(missing_ok=True)
+        # Cada hilo del pool abre su propia conexión a la base de datos
+        connections.close_all()
+
+
+def purge_previous_versions(name: str) -> None:
+    """
+    Elimina los reportes de los mismos parámetros con una versión de datos anterior.
+    """
+    prefix = name.rsplit('_', 1)[0]
+    for path in reports_dir().glob(f'{prefix}_*.xlsx'):
+        if path.stem != name and path.stem.rsplit('_', 1)[0] == prefix:
+            path.unlink(missing_ok=True)
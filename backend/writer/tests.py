@@ -1,3 +1,223 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from reader.models import Bill, BillAnomalyScore, Charge, Meter
+from writer.reports import charge_matrix, charge_names
+from writer.views import ExportExcelView
+
+
+class ExportExcelReportTests(TransactionTestCase):
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.report_dir, ignore_errors=True)
+        settings_override = override_settings(EXCEL_REPORT_DIR=self.report_dir, EXCEL_REPORT_WAIT_SECONDS=10)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8', name='Casa Central')
+        self.bill = Bill.objects.create(meter=meter, month=1, year=2025, total_to_pay=149948)
+        Charge.objects.create(bill=self.bill, name='CONSUMO AGUA', value=12, value_type='m3', charge=9000)
+
+    def export(self, **params):
+        params = {'meter_type': 'WATER', 'start_date': '2025-01', 'end_date': '2025-12', **params}
+        return self.client.get(reverse('export-excel'), params)
+
+    def reports(self):
+        return sorted(path.name for path in Path(self.report_dir).glob('*.xlsx'))
+
+    def test_report_is_cached_until_bills_in_range_change(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Facturas_AguasAndinas_2025-01_a_2025-12.xlsx', response['Content-Disposition'])
+        b''.join(response.streaming_content)
+        first = self.reports()
+        self.assertEqual(len(first), 1)
+
+        # Misma versión de los datos: se entrega el archivo sin generarlo de nuevo
+        with mock.patch.object(ExportExcelView, 'build_report') as build_report:
+            self.assertEqual(self.export().status_code, 200)
+        build_report.assert_not_called()
+
+        # Editar una boleta genera una nueva versión y elimina la anterior
+        self.bill.total_to_pay = 150000
+        self.bill.save()
+        self.assertEqual(self.export().status_code, 200)
+        self.assertEqual(len(self.reports()), 1)
+        self.assertNotEqual(self.reports(), first)
+
+        # También editar o eliminar uno de sus cargos
+        for change in ('save', 'delete'):
+            previous = self.reports()
+            charge = self.bill.charges.first()
+            charge.charge += 1
+            getattr(charge, change)()
+            self.assertEqual(self.export().status_code, 200)
+            self.assertEqual(len(self.reports()), 1)
+            self.assertNotEqual(self.reports(), previous)
+
+    def test_pending_report_returns_202(self):
+        with mock.patch('writer.views.request_report'):
+            response = self.export(wait='0')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertIn('Retry-After', response)
+
+
+class ChargeMatrixTests(TestCase):
+    def test_matrix_pivots_included_charges_per_bill(self):
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        first = Bill.objects.create(meter=meter, month=1, year=2025, total_to_pay=20000)
+        second = Bill.objects.create(meter=meter, month=2, year=2025, total_to_pay=9500)
+        Charge.objects.bulk_create([
+            Charge(bill=first, name='CONSUMO AGUA', value=12, value_type='m3', charge=9000),
+            Charge(bill=first, name='CARGO FIJO', value=0, value_type='$', charge=950),
+            Charge(bill=first, name='AJUSTE SENCILLO', value=0, value_type='$', charge=-8),
+            # Informativos: no forman columnas
+            Charge(bill=first, name='Tarifa agua potable', value=750, value_type='$/unidad', charge=750),
+            Charge(bill=first, name='Diámetro arranque', value=25, value_type='mm', charge=0),
+            Charge(bill=first, name='Fecha de vencimiento', value=0, value_type='fecha', charge=0),
+            Charge(bill=second, name='CARGO FIJO', value=0, value_type='$', charge=950),
+            Charge(bill=second, name='CONSUMO AGUA', value=0, value_type='m3', charge=0),
+        ])
+
+        bills = Bill.objects.filter(meter=meter)
+        names = charge_names(bills)
+        self.assertEqual(names, ['AJUSTE SENCILLO', 'CARGO FIJO', 'CONSUMO AGUA'])
+
+        with self.assertNumQueries(1):
+            rows = list(charge_matrix(bills, names, 'CONSUMO AGUA'))
+        self.assertEqual([row['pk'] for row in rows], [first.pk, second.pk])
+        self.assertEqual(
+            [(rows[0][f'q{index}'], rows[0][f'a{index}']) for index in range(3)],
+            [(None, -8), (None, 950), (12, 9000)],
+        )
+        self.assertEqual(rows[0]['consumption'], 12)
+        # Consumo en cero: la cantidad y el monto quedan vacíos pero el consumo se informa
+        self.assertEqual((rows[1]['q2'], rows[1]['a2'], rows[1]['consumption']), (None, None, 0))
+
+
+class BillDatasetTests(TestCase):
+    def test_load_builds_typed_columns_and_vectorized_totals(self):
+        from writer.dataset import BillDataset
+
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8', direccion='Av. Central 1')
+        january = Bill.objects.create(meter=meter, month=1, year=2025, total_to_pay=20000, invoice_number='10')
+        february = Bill.objects.create(meter=meter, month=2, year=2025, total_to_pay=9500.50)
+        Bill.objects.create(meter=meter, month=1, year=2024, total_to_pay=1)  # Fuera del rango
+        Charge.objects.bulk_create([
+            Charge(bill=january, name='CONSUMO AGUA', value=12, value_type='m3', charge=9000),
+            Charge(bill=january, name='CARGO FIJO', value=0, value_type='$', charge=950),
+            Charge(bill=february, name='CONSUMO AGUA', value=3.5, value_type='m3', charge=2600),
+        ])
+
+        dataset = BillDataset.load('WATER', 2025 * 12 + 1, 2025 * 12 + 12)
+        self.assertEqual(len(dataset), 2)
+        self.assertEqual(dataset.charge_names, ['CARGO FIJO', 'CONSUMO AGUA'])
+        self.assertEqual(list(dataset.bills.index), [january.pk, february.pk])
+        self.assertEqual(str(dataset.bills['total_to_pay'].dtype), 'float64')
+        self.assertEqual(str(dataset.amounts.dtypes.unique()[0]), 'float64')
+        self.assertEqual(dataset.bills.loc[january.pk, 'direccion'], 'Av. Central 1')
+
+        by_period = dataset.totals_by_period()
+        self.assertEqual(by_period.loc[2025 * 12 + 2, 'total_to_pay'], 9500.5)
+        self.assertEqual(by_period.loc[2025 * 12 + 1, 'consumption'], 12)
+        charges = dataset.charge_totals()
+        self.assertEqual(charges.loc['CONSUMO AGUA', 'amount'], 11600)
+        self.assertEqual(charges.loc['CONSUMO AGUA', 'quantity'], 15.5)
+        self.assertEqual(charges.loc['CARGO FIJO', 'quantity'], 0)
+
+
+class AnalyticsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        water = Meter.objects.create(meter_type='WATER', client_number='461384-8', macrozona='Norte')
+        energy = Meter.objects.create(meter_type='ELECTRICITY', client_number='1234567-8', macrozona='Norte')
+        self.water_bill = Bill.objects.create(meter=water, month=1, year=2025, total_to_pay=20000)
+        Bill.objects.create(meter=water, month=2, year=2025, total_to_pay=15000)
+        energy_bill = Bill.objects.create(meter=energy, month=1, year=2025, total_to_pay=50000)
+        Bill.objects.create(meter=energy, month=1, year=2024, total_to_pay=1)
+        Charge.objects.bulk_create([
+            Charge(bill=self.water_bill, name='CONSUMO AGUA', value=12, value_type='m3', charge=9000),
+            Charge(bill=self.water_bill, name='CARGO FIJO', value=0, value_type='$', charge=950),
+            Charge(bill=energy_bill, name='Electricidad Consumida', value=300, value_type='kWh', charge=40000),
+            Charge(bill=energy_bill, name='CARGO FIJO', value=0, value_type='$', charge=1000),
+        ])
+
+    def analytics(self, **params):
+        response = self.client.get(reverse('analytics'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_monthly_series_grouped_by_macrozona(self):
+        results = self.analytics(
+            group_by='macrozona', start_date='2025-01', end_date='2025-12', charges=['CARGO FIJO']
+        )
+        self.assertEqual(results, [
+            {'macrozona': 'Norte', 'year': 2025, 'month': 1, 'bills': 2, 'total_to_pay': 70000.0,
+             'kwh': 300.0, 'm3': 12.0, 'charges': {'CARGO FIJO': 1950}},
+            {'macrozona': 'Norte', 'year': 2025, 'month': 2, 'bills': 1, 'total_to_pay': 15000.0,
+             'kwh': 0.0, 'm3': 0.0, 'charges': {'CARGO FIJO': 0}},
+        ])
+
+    def test_yearly_series_by_meter_type(self):
+        results = self.analytics(group_by='meter_type', interval='year', meter_type='ELECTRICITY')
+        self.assertEqual(
+            [(row['meter_type'], row['year'], row['bills'], row['total_to_pay']) for row in results],
+            [('ELECTRICITY', 2024, 1, 1.0), ('ELECTRICITY', 2025, 1, 50000.0)],
+        )
+
+    def test_cached_response_is_replaced_when_a_bill_changes(self):
+        self.assertEqual(self.analytics(interval='year')[-1]['total_to_pay'], 85000.0)
+        # La versión de los datos se lee de disco: la respuesta en caché no consulta la base de datos
+        with mock.patch('writer.views.aggregate_bills') as aggregate_bills, self.assertNumQueries(0):
+            self.analytics(interval='year')
+        aggregate_bills.assert_not_called()
+
+        self.water_bill.total_to_pay = 21000
+        self.water_bill.save()
+        self.assertEqual(self.analytics(interval='year')[-1]['total_to_pay'], 86000.0)
+
+    def test_invalid_group_by_returns_400(self):
+        response = self.client.get(reverse('analytics'), {'group_by': 'direccion'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DetectAnomaliesTests(TestCase):
+    def create_bill(self, meter, period, consumption):
+        year, month = divmod(period, 12)
+        bill = Bill.objects.create(meter=meter, year=2020 + year, month=month + 1, total_to_pay=consumption * 800)
+        Charge.objects.create(bill=bill, name='CONSUMO AGUA', value=consumption, value_type='m3', charge=consumption * 700)
+        return bill
+
+    def test_flags_jumps_against_meter_history_and_scores_only_new_bills(self):
+        meter = Meter.objects.create(meter_type='WATER', client_number='461384-8')
+        history = [self.create_bill(meter, period, consumption)
+                   for period, consumption in enumerate([20, 22, 21, 19, 20, 23, 21, 20, 22, 21, 20, 21])]
+        spike = self.create_bill(meter, 12, 80)
+
+        call_command('detect_anomalies', stdout=StringIO())
+        scores = {score.bill_id: score for score in BillAnomalyScore.objects.all()}
+        self.assertEqual(len(scores), 13)
+        # Sin historia suficiente no hay z-score
+        self.assertIsNone(scores[history[0].pk].consumption_z)
+        self.assertFalse(any(scores[bill.pk].flagged for bill in history))
+        self.assertTrue(scores[spike.pk].flagged)
+        self.assertGreater(scores[spike.pk].consumption_z, 4)
+        self.assertAlmostEqual(scores[spike.pk].consumption_yoy, 3.0)
+
+        # Solo se puntúan las boletas nuevas o modificadas
+        scored_at = scores[history[0].pk].scored_at
+        normal = self.create_bill(meter, 13, 21)
+        output = StringIO()
+        call_command('detect_anomalies', stdout=output)
+        self.assertIn("1 boletas puntuadas", output.getvalue())
+        self.assertFalse(BillAnomalyScore.objects.get(bill=normal).flagged)
+        self.assertEqual(BillAnomalyScore.objects.get(bill=history[0]).scored_at, scored_at)
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import ExportExcelView
+from .views import AnalyticsView, ExportExcelView
 
 urlpatterns = [
     path('export-excel/', ExportExcelView.as_view(), name='export-excel'),
+    path('analytics/', AnalyticsView.as_view(), name='analytics'),
 ]
@@ -1,11 +1,23 @@
-from io import BytesIO
-from django.http import HttpResponse
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+import hashlib
+import time
+from functools import partial
+from itertools import product
+from math import isnan
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from reader.models import Meter, Bill
+
+from .analytics import GROUP_FIELDS, INTERVAL_FIELDS, aggregate_bills
+from .reports import data_version, discard_failure, report_bills, report_status, request_report
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Segundos sugeridos al cliente entre consultas de un reporte en generación
+REPORT_RETRY_AFTER_SECONDS = 2
 
 
 class ExportExcelView(APIView):
@@ -16,6 +28,9 @@ class ExportExcelView(APIView):
       - Si meter_type = 'BOTH': Ambas hojas en un mismo Excel (requiere fechas)
       - Si meter_type = 'ALL': Histórico completo de ambos tipos (no requiere fechas)
       - Formato con celdas combinadas, estilos y colores
+    El Excel se genera en segundo plano (writer.reports) y se guarda en caché por tipo, rango y
+    versión de los datos: si está listo se descarga de inmediato; si no, se espera hasta
+    EXCEL_REPORT_WAIT_SECONDS (o 'wait') y, si aún no termina, se responde 202 para volver a consultar.
     """
 
     def get(self, request):
@@ -39,10 +54,10 @@ class ExportExcelView(APIView):
 
         # Si es ALL, no requiere fechas (exporta todo el histórico)
         if meter_type == 'ALL':
-            start_period = 0  # Desde el inicio de los tiempos
-            end_period = float('inf')  # Hasta el fin de los tiempos
+            start_period = end_period = None  # Sin filtro de período
             start_date = 'inicio'
             end_date = 'fin'
+            period_key = 'inicio_fin'
         else:
             # Validar que se proporcionen fechas para otros tipos
             if not start_date or not end_date:
@@ -63,184 +78,127 @@ class ExportExcelView(APIView):
 
             start_period = start_year * 12 + start_month
             end_period = end_year * 12 + end_month
+            period_key = f"{start_year:04d}-{start_month:02d}_{end_year:04d}-{end_month:02d}"
+
+        if meter_type == 'ALL':
+            filename = "Facturas_Historico_Completo.xlsx"
+        elif meter_type == 'BOTH':
+            filename = f"Facturas_Completas_{start_date}_a_{end_date}.xlsx"
+        elif meter_type == 'WATER':
+            filename = f"Facturas_AguasAndinas_{start_date}_a_{end_date}.xlsx"
+        else:  # ELECTRICITY
+            filename = f"Facturas_Enel_{start_date}_a_{end_date}.xlsx"
+
+        # El reporte se genera en segundo plano y queda en caché hasta que cambien los datos
+        name = f"{meter_type}_{period_key}_{data_version()}"
+
+        report, detail = report_status(name)
+        if report == 'missing':
+            request_report(name, partial(ExportExcelView().build_report, meter_type, start_period, end_period))
+            report, detail = self.wait_for_report(name, request.query_params.get('wait'))
+        elif report == 'pending':
+            report, detail = self.wait_for_report(name, request.query_params.get('wait'))
 
-        # Crear workbook
-        output = BytesIO()
+        if report == 'ready':
+            return FileResponse(open(detail, 'rb'), as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+        if report == 'failed':
+            # El siguiente intento vuelve a generar el reporte
+            discard_failure(name)
+            return Response(
+                {"detail": f"Error al generar el reporte: {detail}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(
+            {"status": "pending", "detail": "El reporte se está generando. Vuelva a consultar con los mismos parámetros."},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Retry-After': str(REPORT_RETRY_AFTER_SECONDS)}
+        )
+
+    @staticmethod
+    def wait_for_report(name, wait=None):
+        """
+        Espera hasta `wait` segundos (como máximo EXCEL_REPORT_WAIT_SECONDS) a que el reporte deje de
+        estar en generación, para responder en la misma petición los reportes rápidos.
+        """
+        try:
+            wait = min(float(wait), settings.EXCEL_REPORT_WAIT_SECONDS) if wait is not None else settings.EXCEL_REPORT_WAIT_SECONDS
+        except ValueError:
+            wait = settings.EXCEL_REPORT_WAIT_SECONDS
+        deadline = time.monotonic() + wait
+        report, detail = report_status(name)
+        while report == 'pending' and time.monotonic() < deadline:
+            time.sleep(0.2)
+            report, detail = report_status(name)
+        return report, detail
+
+    def build_report(self, meter_type, start_period, end_period, path):
+        """
+        Genera el Excel en `path`. Se ejecuta en el pool de writer.reports.
+        """
+        # Crear workbook (openpyxl y pandas se importan al exportar para no cargarlos al iniciar Django)
+        from openpyxl import Workbook
+        from .dataset import BillDataset
         workbook = Workbook()
         
         # Eliminar la hoja por defecto
         workbook.remove(workbook.active)
 
+        # Paleta de estilos compartida por todas las hojas del libro
+        styles = SheetStyles()
+
         # Crear hojas según el tipo de medidor seleccionado
-        if meter_type == 'BOTH' or meter_type == 'ALL':
-            # Exportar ambos tipos en hojas separadas
-            # Hoja de Agua
-            water_meters = Meter.objects.filter(meter_type='WATER')
-            water_bills = Bill.objects.filter(meter__in=water_meters)
-            water_bills = [b for b in water_bills if start_period <= (b.year * 12 + b.month) <= end_period]
-            self._create_formatted_sheet(workbook, 'Agua', water_bills, 'Consumo [m3]')
-            
-            # Hoja de Electricidad
-            electricity_meters = Meter.objects.filter(meter_type='ELECTRICITY')
-            electricity_bills = Bill.objects.filter(meter__in=electricity_meters)
-            electricity_bills = [b for b in electricity_bills if start_period <= (b.year * 12 + b.month) <= end_period]
-            self._create_formatted_sheet(workbook, 'Electricidad', electricity_bills, 'Consumo [kWh]')
-            
-            if meter_type == 'ALL':
-                filename = f"Facturas_Historico_Completo.xlsx"
-            else:
-                filename = f"Facturas_Completas_{start_date}_a_{end_date}.xlsx"
-        else:
-            # Exportar solo un tipo
-            meters = Meter.objects.filter(meter_type=meter_type)
-            bills = Bill.objects.filter(meter__in=meters)
-            bills = [b for b in bills if start_period <= (b.year * 12 + b.month) <= end_period]
-
-            if meter_type == 'WATER':
-                self._create_formatted_sheet(workbook, 'Agua', bills, 'Consumo [m3]')
-                filename = f"Facturas_AguasAndinas_{start_date}_a_{end_date}.xlsx"
-            else:  # ELECTRICITY
-                self._create_formatted_sheet(workbook, 'Electricidad', bills, 'Consumo [kWh]')
-                filename = f"Facturas_Enel_{start_date}_a_{end_date}.xlsx"
-
-        # Guardar y enviar el archivo
-        workbook.save(output)
-        output.seek(0)
-            
-        response = HttpResponse(
-            output,
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        if meter_type in ('WATER', 'BOTH', 'ALL'):
+            dataset = BillDataset.load('WATER', start_period, end_period)
+            self._create_formatted_sheet(workbook, 'Agua', dataset, 'Consumo [m3]', styles)
+        if meter_type in ('ELECTRICITY', 'BOTH', 'ALL'):
+            dataset = BillDataset.load('ELECTRICITY', start_period, end_period)
+            self._create_formatted_sheet(workbook, 'Electricidad', dataset, 'Consumo [kWh]', styles)
 
-    def _get_unique_charges(self, bills):
-        """
-        Obtiene todos los cargos únicos de las boletas que tienen valor monetario o de consumo.
-        Excluye solo cargos puramente informativos (textos, códigos, fechas sin monto asociado).
-        Retorna una lista ordenada de nombres de cargos.
-        """
-        charge_names = set()
-        
-        for bill in bills:
-            for charge in bill.charges.all():
-                # Incluir solo cargos que:
-                # 1. Tienen monto en $ (charge != 0), incluyendo negativos (descuentos), O
-                # 2. Tienen valor numérico en m3/kWh (value > 0 y value_type es m3 o kWh)
-                has_monetary_value = charge.charge != 0
-                has_quantity_value = (
-                    charge.value > 0 and 
-                    charge.value_type in ['m3', 'kWh']
-                )
-                
-                # Excluir SOLO cargos puramente informativos (sin ningún valor monetario/cantidad)
-                # que son datos de contexto, no cargos reales
-                is_informative = (
-                    charge.value_type in ['código', 'fecha', 'texto', 'número'] and
-                    charge.charge == 0
-                ) or (
-                    # Excluir tarifas unitarias (son informativas, no cargos aplicados)
-                    charge.name.startswith('Tarifa') or
-                    'Factor de cobro' in charge.name or
-                    'Grupo tarifario' in charge.name or
-                    'Último pago' in charge.name or
-                    'Diámetro arranque' in charge.name
-                )
-                
-                if (has_monetary_value or has_quantity_value) and not is_informative:
-                    charge_names.add(charge.name)
-        
-        # Ordenar para tener consistencia
-        return sorted(list(charge_names))
+        workbook.save(path)
 
-    def _create_formatted_sheet(self, workbook, sheet_name, bills, consumo_label):
+    def _create_formatted_sheet(self, workbook, sheet_name, dataset, consumo_label, styles=None):
         """
         Crea una hoja formateada con el estilo de la imagen de referencia.
         Incluye desagregación dinámica de cargos.
+        Las filas se escriben desde las columnas de `dataset` (writer.dataset.BillDataset).
+        `styles` es la paleta del libro (SheetStyles); si no se indica se crea una.
         """
+        from openpyxl.utils import get_column_letter
+
+        styles = styles or SheetStyles()
+        border = styles.border
+
         sheet = workbook.create_sheet(title=sheet_name)
         
         # Obtener todos los cargos únicos que tienen m3 o monto
-        unique_charges = self._get_unique_charges(bills)
+        unique_charges = dataset.charge_names
         num_charge_columns = len(unique_charges) * 2  # Cada cargo tiene 2 columnas (m3 y Monto)
         
-        # Definir estilos
-        header_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")  # Gris claro
-        header_font = Font(name="Arial", bold=True, size=11)
-        data_font = Font(name="Arial", size=11)
-        center_alignment = Alignment(horizontal="center", vertical="center")
-        bottom_center_alignment = Alignment(horizontal="center", vertical="bottom")
+        # Estilos compartidos de la paleta
+        header_fill = styles.header_fill
+        header_font = styles.header_font
+        data_font = styles.data_font
+        center_alignment = styles.center_alignment
+        bottom_center_alignment = styles.bottom_center_alignment
         
         # Bordes
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        thin_border = border()
         
         # Borde derecho grueso para separar IDENTIFICACIÓN de CIFRAS DESTACADAS
-        thick_right_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thick', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        thick_right_border = border(right=True)
         
         # Borde inferior grueso para separar encabezados de datos
-        thick_bottom_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thick', color='000000')
-        )
+        thick_bottom_border = border(bottom=True)
         
         # Borde esquina (grueso derecho + grueso inferior)
-        thick_corner_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thick', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thick', color='000000')
-        )
+        thick_corner_border = border(right=True, bottom=True)
         
         # Bordes para esquinas exteriores de la tabla
-        top_left_corner = Border(
-            left=Side(style='thick', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thick', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-        
-        top_right_corner = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thick', color='000000'),
-            top=Side(style='thick', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        top_left_corner = border(left=True, top=True)
+        top_right_corner = border(right=True, top=True)
         
         # Bordes superiores gruesos
-        thick_top_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thick', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-        
-        # Borde izquierdo grueso
-        thick_left_border = Border(
-            left=Side(style='thick', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-        
-        # Borde derecho grueso (borde exterior derecho)
-        thick_outer_right_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thick', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        thick_top_border = border(top=True)
         
         # Calcular posiciones de columnas
         # Para AGUA: Columnas A-E (5 columnas), F-H (3 columnas), I+ (desagregación)
@@ -263,7 +221,6 @@ class ExportExcelView(APIView):
         
         # Combinar celdas para DESAGREGACIÓN DE CARGOS si hay cargos (solo fila 1)
         if num_charge_columns > 0:
-            from openpyxl.utils import get_column_letter
             start_col_letter = get_column_letter(first_charge_col)
             end_col_letter = get_column_letter(last_charge_col)
             sheet.merge_cells(f'{start_col_letter}1:{end_col_letter}1')
@@ -296,12 +253,7 @@ class ExportExcelView(APIView):
             cell.border = thick_top_border
         
         # Última celda de IDENTIFICACIÓN tiene borde superior grueso y derecho grueso (división vertical)
-        sheet[f'{id_end_col}1'].border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thick', color='000000'),
-            top=Side(style='thick', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        sheet[f'{id_end_col}1'].border = border(right=True, top=True)
         
         # Celdas intermedias de CIFRAS DESTACADAS con borde superior grueso
         cifras_intermediate_cols = ['G', 'H'] if is_electricity else ['F', 'G']
@@ -310,16 +262,10 @@ class ExportExcelView(APIView):
             cell.border = thick_top_border
         
         # Última celda de CIFRAS DESTACADAS - borde superior grueso y derecho grueso (división con desagregación)
-        sheet[f'{cifras_end_col}1'].border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thick', color='000000'),
-            top=Side(style='thick', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        sheet[f'{cifras_end_col}1'].border = border(right=True, top=True)
         
         # Aplicar bordes a las celdas de Desagregación de Cargos en fila 1
         if num_charge_columns > 0:
-            from openpyxl.utils import get_column_letter
             for col_idx in range(first_charge_col, last_charge_col):
                 col_letter = get_column_letter(col_idx)
                 sheet[f'{col_letter}1'].border = thick_top_border
@@ -335,7 +281,6 @@ class ExportExcelView(APIView):
         # Para cada cargo, combinar 2 celdas para el nombre del cargo
         col_idx = first_charge_col
         for charge_name in unique_charges:
-            from openpyxl.utils import get_column_letter
             start_col = get_column_letter(col_idx)
             end_col = get_column_letter(col_idx + 1)
             sheet.merge_cells(f'{start_col}2:{end_col}2')
@@ -376,27 +321,13 @@ class ExportExcelView(APIView):
             cell.font = header_font
             cell.alignment = center_alignment
             
-            # Calcular la última columna de IDENTIFICACIÓN y CIFRAS
-            last_id_col_num = num_id_cols
-            last_cifras_col_num = last_cifras_col
-            
             # Aplicar bordes según la posición
             if col_num == 1:  # Primera columna - borde izquierdo grueso
-                cell.border = Border(
-                    left=Side(style='thick', color='000000'),
-                    right=Side(style='thin', color='000000'),
-                    top=Side(style='thin', color='000000'),
-                    bottom=Side(style='thick', color='000000')
-                )
-            elif col_num == last_id_col_num:  # Dirección (última columna de IDENTIFICACIÓN)
+                cell.border = border(left=True, bottom=True)
+            elif col_num == num_id_cols:  # Dirección (última columna de IDENTIFICACIÓN)
                 cell.border = thick_corner_border  # Grueso abajo y derecho
-            elif col_num == last_cifras_col_num:  # Total a Pagar (última columna de CIFRAS DESTACADAS)
-                cell.border = Border(
-                    left=Side(style='thin', color='000000'),
-                    right=Side(style='thick', color='000000'),
-                    top=Side(style='thin', color='000000'),
-                    bottom=Side(style='thick', color='000000')
-                )
+            elif col_num == last_cifras_col:  # Total a Pagar (última columna de CIFRAS DESTACADAS)
+                cell.border = thick_corner_border
             else:
                 cell.border = thick_bottom_border  # Solo grueso abajo
         
@@ -406,8 +337,6 @@ class ExportExcelView(APIView):
         
         col_idx = first_charge_col
         for charge_name in unique_charges:
-            from openpyxl.utils import get_column_letter
-            
             # Columna de unidad (m3 o kWh/kW)
             m3_col = get_column_letter(col_idx)
             cell_m3 = sheet[f'{m3_col}3']
@@ -427,36 +356,16 @@ class ExportExcelView(APIView):
             
             # Si es la última columna, aplicar borde derecho grueso
             is_last_charge = (col_idx + 1 == last_charge_col)
-            if is_last_charge:
-                cell_monto.border = Border(
-                    left=Side(style='thin', color='000000'),
-                    right=Side(style='thick', color='000000'),
-                    top=Side(style='thin', color='000000'),
-                    bottom=Side(style='thick', color='000000')
-                )
-            else:
-                cell_monto.border = thick_bottom_border
+            cell_monto.border = thick_corner_border if is_last_charge else thick_bottom_border
             
             col_idx += 2
         
         # Ajustar borde derecho grueso en columnas de división
         # Última columna de IDENTIFICACIÓN (E para agua, F para electricidad)
-        for row in [1, 2, 3]:
-            sheet.cell(row=row, column=num_id_cols).border = Border(
-                left=Side(style='thin', color='000000'),
-                right=Side(style='thick', color='000000'),
-                top=Side(style='thick' if row == 1 else 'thin', color='000000'),
-                bottom=Side(style='thick' if row == 3 else 'thin', color='000000')
-            )
-        
-        # Última columna de CIFRAS DESTACADAS (H para agua, I para electricidad)
-        for row in [1, 2, 3]:
-            sheet.cell(row=row, column=last_cifras_col).border = Border(
-                left=Side(style='thin', color='000000'),
-                right=Side(style='thick', color='000000'),
-                top=Side(style='thick' if row == 1 else 'thin', color='000000'),
-                bottom=Side(style='thick' if row == 3 else 'thin', color='000000')
-            )
+        # y última columna de CIFRAS DESTACADAS (H para agua, I para electricidad)
+        for column in (num_id_cols, last_cifras_col):
+            for row in [1, 2, 3]:
+                sheet.cell(row=row, column=column).border = border(right=True, top=row == 1, bottom=row == 3)
         
         # Ajustar ancho de columnas
         sheet.column_dimensions['A'].width = 12  # ID Factura
@@ -479,109 +388,70 @@ class ExportExcelView(APIView):
             sheet.column_dimensions['H'].width = 20  # Total a Pagar
         
         # Ajustar ancho de columnas de desagregación
-        from openpyxl.utils import get_column_letter
         for col_idx in range(first_charge_col, last_charge_col + 1):
             col_letter = get_column_letter(col_idx)
             sheet.column_dimensions[col_letter].width = 15  # Aumentado de 12 a 15
+
+        # Borde y alineación de cada columna de datos, para filas intermedias [False] y la última [True].
+        # Se calculan una vez por hoja y cada celda reutiliza los mismos objetos.
+        periodo_col = num_id_cols + 1
+        consumo_col = num_id_cols + 2
+        total_col = num_id_cols + 3
+        column_styles = {}
+        for is_last_row in (False, True):
+            row_styles = column_styles[is_last_row] = {}
+            for col_num in range(1, last_cifras_col + 1):
+                if col_num == 1:  # Primera columna
+                    cell_border = border(left=True, bottom=is_last_row)
+                elif col_num in (num_id_cols, last_cifras_col):  # Dirección y Total a Pagar - división vertical
+                    cell_border = border(right=True, bottom=is_last_row)
+                else:
+                    cell_border = border(bottom=is_last_row)
+                # ID, Período, Consumo, Total - centrado
+                if col_num in [1, periodo_col, consumo_col, total_col]:
+                    row_styles[col_num] = (cell_border, center_alignment)
+                else:
+                    row_styles[col_num] = (cell_border, styles.left_alignment)
+            for col_num in range(first_charge_col, last_charge_col + 1):
+                # Si es la última columna, aplicar borde derecho grueso
+                row_styles[col_num] = (border(right=col_num == last_charge_col, bottom=is_last_row), center_alignment)
         
-        # FILA 4+: Datos de las facturas
+        # FILA 4+: Datos de las facturas, desde las columnas del dataset
+        id_columns = ['invoice_number', 'client_number'] + (['tarifa'] if is_electricity else [])
+        id_columns += ['macrozona', 'instalacion', 'direccion']
+        bill_rows = dataset.bills[id_columns + ['month', 'year', 'consumption', 'total_to_pay']].itertuples(
+            index=False, name=None
+        )
+        # Cantidades y montos por boleta como listas de float (NaN sin valor)
+        quantities = dataset.quantities.to_numpy().tolist()
+        amounts = dataset.amounts.to_numpy().tolist()
         row_num = 4
-        total_rows = len(bills)
+        total_rows = len(dataset)
         
-        for idx, bill in enumerate(bills):
+        for idx, (*identification, month, year, consumption, total_to_pay) in enumerate(bill_rows):
             # Determinar si es la última fila
             is_last_row = (idx == total_rows - 1)
+            row_styles = column_styles[is_last_row]
             
             # Formatear período como "MM/YYYY"
-            periodo = f"{bill.month:02d}/{bill.year}"
-            
-            # Obtener el valor de consumo desde los cargos
-            consumo_value = ''
-            if sheet_name == 'Electricidad':
-                cargo_consumo = bill.charges.filter(name__icontains='Electricidad Consumida').first()
-                if cargo_consumo:
-                    consumo_value = float(cargo_consumo.value)
-            else:  # Agua
-                cargo_consumo = bill.charges.filter(name__icontains='CONSUMO AGUA').first()
-                if cargo_consumo:
-                    consumo_value = float(cargo_consumo.value)
+            periodo = f"{month:02d}/{year}"
             
-            # Datos de IDENTIFICACIÓN y CIFRAS DESTACADAS
-            data_row = [
-                bill.invoice_number,  # ID Factura
-                bill.meter.client_number,
-            ]
-            
-            # Agregar Tarifa solo para electricidad
-            if is_electricity:
-                data_row.append(bill.tarifa)
+            # Valor de consumo desde los cargos
+            consumo_value = '' if isnan(consumption) else consumption
             
-            data_row.extend([
-                bill.meter.macrozona,
-                bill.meter.instalacion,
-                bill.meter.direccion,
+            # Datos de IDENTIFICACIÓN (incluye Tarifa solo para electricidad) y CIFRAS DESTACADAS
+            data_row = identification + [
                 periodo,
                 consumo_value,
-                int(bill.total_to_pay)  # Convertir a entero (sin decimales)
-            ])
+                int(total_to_pay)  # Convertir a entero (sin decimales)
+            ]
 
             # Escribir datos de IDENTIFICACIÓN y CIFRAS DESTACADAS
             for col_num, value in enumerate(data_row, start=1):
                 cell = sheet.cell(row=row_num, column=col_num)
                 cell.value = value
                 cell.font = data_font
-                
-                # Aplicar bordes según la posición
-                if col_num == 1:  # Primera columna
-                    if is_last_row:
-                        cell.border = Border(
-                            left=Side(style='thick', color='000000'),
-                            right=Side(style='thin', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thick', color='000000')
-                        )
-                    else:
-                        cell.border = thick_left_border
-                elif col_num == num_id_cols:  # Dirección (última col de IDENTIFICACIÓN) - división vertical
-                    if is_last_row:
-                        cell.border = Border(
-                            left=Side(style='thin', color='000000'),
-                            right=Side(style='thick', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thick', color='000000')
-                        )
-                    else:
-                        cell.border = thick_right_border
-                elif col_num == last_cifras_col:  # Total a Pagar - división vertical
-                    if is_last_row:
-                        cell.border = Border(
-                            left=Side(style='thin', color='000000'),
-                            right=Side(style='thick', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thick', color='000000')
-                        )
-                    else:
-                        cell.border = thick_right_border
-                else:
-                    if is_last_row:
-                        cell.border = Border(
-                            left=Side(style='thin', color='000000'),
-                            right=Side(style='thin', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thick', color='000000')
-                        )
-                    else:
-                        cell.border = thin_border
-                
-                # Alineación
-                periodo_col = num_id_cols + 1
-                consumo_col = num_id_cols + 2
-                total_col = num_id_cols + 3
-                
-                if col_num in [1, periodo_col, consumo_col, total_col]:  # ID, Período, Consumo, Total - centrado
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                else:
-                    cell.alignment = Alignment(horizontal="left", vertical="center")
+                cell.border, cell.alignment = row_styles[col_num]
                 
                 # Formato de número
                 if col_num == consumo_col and consumo_value:  # Consumo
@@ -591,73 +461,137 @@ class ExportExcelView(APIView):
             
             # Escribir datos de DESAGREGACIÓN DE CARGOS
             col_idx = first_charge_col
-            for charge_name in unique_charges:
-                from openpyxl.utils import get_column_letter
-                
-                # Buscar el cargo correspondiente en esta boleta
-                charge = bill.charges.filter(name=charge_name).first()
-                
-                # Valor de m3/kWh
-                m3_value = ''
-                if charge and charge.value > 0 and charge.value_type in ['m3', 'kWh']:
-                    m3_value = float(charge.value)
+            for quantity, amount in zip(quantities[idx], amounts[idx]):
+                # Valor de m3/kWh (solo cantidades positivas, ver writer.reports.has_quantity)
+                m3_value = quantity if quantity > 0 else ''
                 
                 # Valor de Monto [$] (incluye negativos como descuentos)
-                monto_value = ''
-                if charge and charge.charge != 0:
-                    monto_value = int(charge.charge)  # Convertir a entero (sin decimales)
+                monto_value = int(amount) if amount and not isnan(amount) else ''  # Convertir a entero
                 
                 # Escribir m3
-                m3_col = get_column_letter(col_idx)
-                cell_m3 = sheet[f'{m3_col}{row_num}']
+                cell_m3 = sheet.cell(row=row_num, column=col_idx)
                 cell_m3.value = m3_value
                 cell_m3.font = data_font
-                cell_m3.alignment = Alignment(horizontal="center", vertical="center")
+                cell_m3.border, cell_m3.alignment = row_styles[col_idx]
                 if m3_value:
                     cell_m3.number_format = '#,##0.00'
                 
-                if is_last_row:
-                    cell_m3.border = Border(
-                        left=Side(style='thin', color='000000'),
-                        right=Side(style='thin', color='000000'),
-                        top=Side(style='thin', color='000000'),
-                        bottom=Side(style='thick', color='000000')
-                    )
-                else:
-                    cell_m3.border = thin_border
-                
                 # Escribir Monto [$]
-                monto_col = get_column_letter(col_idx + 1)
-                cell_monto = sheet[f'{monto_col}{row_num}']
+                cell_monto = sheet.cell(row=row_num, column=col_idx + 1)
                 cell_monto.value = monto_value
                 cell_monto.font = data_font
-                cell_monto.alignment = Alignment(horizontal="center", vertical="center")
+                cell_monto.border, cell_monto.alignment = row_styles[col_idx + 1]
                 if monto_value:
                     cell_monto.number_format = '#,##0'  # Sin decimales para dinero
                 
-                # Si es la última columna, aplicar borde derecho grueso
-                is_last_charge = (col_idx + 1 == last_charge_col)
-                if is_last_charge:
-                    if is_last_row:
-                        cell_monto.border = Border(
-                            left=Side(style='thin', color='000000'),
-                            right=Side(style='thick', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thick', color='000000')
-                        )
-                    else:
-                        cell_monto.border = thick_outer_right_border
-                else:
-                    if is_last_row:
-                        cell_monto.border = Border(
-                            left=Side(style='thin', color='000000'),
-                            right=Side(style='thin', color='000000'),
-                            top=Side(style='thin', color='000000'),
-                            bottom=Side(style='thick', color='000000')
-                        )
-                    else:
-                        cell_monto.border = thin_border
-                
                 col_idx += 2
             
             row_num += 1
+
+
+class AnalyticsView(APIView):
+    """
+    GET /api/writer/analytics/?group_by=...&interval=...&meter_type=...&start_date=YYYY-MM&end_date=YYYY-MM&charges=...
+    Agregados de consumo y costo calculados en la base de datos (writer.analytics):
+      - group_by: 'meter', 'macrozona', 'instalacion' o 'meter_type' (opcional; sin él, solo por período)
+      - interval: 'month' (por defecto) o 'year'
+      - meter_type: 'WATER' o 'ELECTRICITY' (opcional; sin él, ambos)
+      - start_date / end_date: rango de períodos (opcional; sin él, todo el histórico)
+      - charges: nombres de cargos cuyo monto se suma, repitiendo el parámetro
+    La respuesta se guarda en caché por parámetros y versión de los datos (reader.versions), por lo
+    que cualquier boleta, cargo o medidor creado, modificado o eliminado genera una respuesta nueva.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        group_by = params.get('group_by') or None
+        interval = params.get('interval') or 'month'
+        meter_type = params.get('meter_type') or None
+        charges = sorted(set(params.getlist('charges')))
+
+        if group_by is not None and group_by not in GROUP_FIELDS:
+            return Response(
+                {"detail": f"Agrupación inválida. Use {', '.join(GROUP_FIELDS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if interval not in INTERVAL_FIELDS:
+            return Response(
+                {"detail": f"Intervalo inválido. Use {', '.join(INTERVAL_FIELDS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if meter_type not in (None, 'WATER', 'ELECTRICITY'):
+            return Response(
+                {"detail": "Tipo de medidor inválido. Use 'WATER' o 'ELECTRICITY'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(charges) > settings.ANALYTICS_MAX_CHARGES:
+            return Response(
+                {"detail": f"Se pueden pedir hasta {settings.ANALYTICS_MAX_CHARGES} cargos."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        start_date = params.get('start_date')
+        end_date = params.get('end_date')
+        start_period = end_period = None
+        if start_date or end_date:
+            try:
+                start_year, start_month = map(int, start_date.split('-'))
+                end_year, end_month = map(int, end_date.split('-'))
+            except (AttributeError, ValueError):
+                return Response(
+                    {"detail": "Formato inválido de fechas. Use YYYY-MM en 'start_date' y 'end_date'."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            start_period = start_year * 12 + start_month
+            end_period = end_year * 12 + end_month
+
+        query = (group_by, interval, meter_type, start_period, end_period, charges)
+        key = 'analytics:' + hashlib.sha1(repr((query, data_version())).encode()).hexdigest()
+
+        payload = cache.get(key)
+        if payload is None:
+            bills = report_bills(meter_type, start_period, end_period)
+            payload = {
+                'group_by': group_by,
+                'interval': interval,
+                'results': aggregate_bills(bills, group_by, interval, charges),
+            }
+            cache.set(key, payload, settings.ANALYTICS_CACHE_SECONDS)
+        return Response(payload)
+
+
+class SheetStyles:
+    """
+    Paleta de estilos de un libro: cada fuente, relleno, alineación y borde se crea una sola vez
+    y las celdas la reutilizan por referencia, en lugar de crear objetos nuevos por celda que
+    openpyxl debe comparar y deduplicar al guardar.
+    Los bordes se precalculan para cada combinación de lados gruesos.
+    """
+
+    def __init__(self):
+        from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+        thin = Side(style='thin', color='000000')
+        thick = Side(style='thick', color='000000')
+        self.borders = {
+            (left, right, top, bottom): Border(
+                left=thick if left else thin,
+                right=thick if right else thin,
+                top=thick if top else thin,
+                bottom=thick if bottom else thin,
+            )
+            for left, right, top, bottom in product((False, True), repeat=4)
+        }
+
+        self.header_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")  # Gris claro
+        self.header_font = Font(name="Arial", bold=True, size=11)
+        self.data_font = Font(name="Arial", size=11)
+        self.center_alignment = Alignment(horizontal="center", vertical="center")
+        self.left_alignment = Alignment(horizontal="left", vertical="center")
+        self.bottom_center_alignment = Alignment(horizontal="center", vertical="bottom")
+
+    def border(self, left=False, right=False, top=False, bottom=False):
+        """
+        Borde delgado con los lados indicados gruesos.
+        """
+        return self.borders[(left, right, top, bottom)]
@@ -64,10 +64,19 @@ const ExportPage: React.FC = () => {
         params.end_date = endDate;
       }
 
-      const response = await axios.get(`${API_BASE}/writer/export-excel/`, {
+      // El reporte se genera en segundo plano: mientras responda 202 se vuelve a consultar
+      let response = await axios.get(`${API_BASE}/writer/export-excel/`, {
         params,
         responseType: "arraybuffer",
       });
+      while (response.status === 202) {
+        const retryAfter = Number(response.headers["retry-after"]) || 2;
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+        response = await axios.get(`${API_BASE}/writer/export-excel/`, {
+          params,
+          responseType: "arraybuffer",
+        });
+      }
 
       const blob = new Blob([response.data], {
         type: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
@@ -11,6 +11,10 @@ const FileUpload = () => {
   const [validationResults, setValidationResults] = useState<any[] | null>(null);
   const [validated, setValidated] = useState(false);
   const [validating, setValidating] = useState(false);
+  // Token del lote validado: permite guardar sin volver a subir ni procesar los archivos
+  const [batchToken, setBatchToken] = useState<string | null>(null);
+  // Avance de la subida en modo streaming ("3 de 120")
+  const [progress, setProgress] = useState<string | null>(null);
   const [selectFolder, setSelectFolder] = useState(false);
 
   const handleFileSelect = (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -25,12 +29,14 @@ const FileUpload = () => {
     setError(null);
     setValidationResults(null);
     setValidated(false);
+    setBatchToken(null);
   };
 
   const handleValidate = async () => {
     setError(null);
     setValidationResults(null);
     setValidated(false);
+    setBatchToken(null);
     setValidating(true);
 
     if (files.length === 0) {
@@ -48,6 +54,7 @@ const FileUpload = () => {
       const res = await axios.post(`${API_BASE}/reader/validate-batch-bills/`, formData, { headers: { 'Content-Type': 'multipart/form-data' } });
       const results = res.data.results;
       setValidationResults(results);
+      setBatchToken(res.data.batch_token || null);
       // Solo se considera validado si todos los archivos tienen status 'correct'
       const allCorrect = results.length > 0 && results.every((r: any) => r.status === 'correct');
       setValidated(allCorrect);
@@ -59,41 +66,78 @@ const FileUpload = () => {
     }
   };
 
+  // Sube los archivos en modo streaming: el backend responde una línea JSON por archivo procesado
+  const uploadWithProgress = async (token: string | null) => {
+    const formData = new FormData();
+    files.forEach(file => {
+      formData.append('files', file);
+    });
+
+    const response = await fetch(`${API_BASE}/reader/process-multiple-bills/?stream=ndjson`, {
+      method: 'POST',
+      headers: {
+        'Authorization': token ? `Bearer ${token}` : '',
+        'Accept': 'application/x-ndjson',
+      },
+      body: formData,
+    });
+    if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let processed = 0;
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() || '';
+      // Las líneas vacías solo mantienen viva la conexión
+      processed += lines.filter(line => line.trim()).length;
+      setProgress(`${processed} de ${files.length}`);
+    }
+  };
+
   const handleSubmit = async (event: React.FormEvent) => {
     event.preventDefault();
     setUploading(true);
     setSuccess(null);
     setError(null);
 
-    const formData = new FormData();
-    files.forEach(file => {
-      formData.append('files', file);
-    });
-
     try {
       const token = localStorage.getItem('auth_token');
-      await axios.post(`${API_BASE}/reader/process-multiple-bills/`, formData, {
-        headers: {
-          'Authorization': token ? `Bearer ${token}` : '',
-          'Content-Type': 'multipart/form-data',
-        },
-      });
+      if (batchToken) {
+        // Con un lote validado solo se envía el token
+        await axios.post(`${API_BASE}/reader/process-multiple-bills/`, { batch_token: batchToken }, {
+          headers: {
+            'Authorization': token ? `Bearer ${token}` : '',
+            'Content-Type': 'application/json',
+          },
+        });
+      } else {
+        await uploadWithProgress(token);
+      }
       setSuccess('Archivos subidos correctamente.');
       setFiles([]);
       setValidationResults(null);
       setValidated(false);
+      setBatchToken(null);
       const input = document.getElementById('file-input') as HTMLInputElement;
       if (input) input.value = '';
     } catch (err: any) {
       setError('Error al subir archivos');
     } finally {
       setUploading(false);
+      setProgress(null);
     }
   };
 
   const handleRemoveFile = (index: number) => {
     const newFiles = files.filter((_, i) => i !== index);
     setFiles(newFiles);
+    // El lote validado incluye el archivo eliminado; se vuelve a subir el resto al guardar
+    setBatchToken(null);
 
     // Actualiza los resultados de validación solo para los archivos restantes
     if (validationResults && validationResults.length > 0) {
@@ -141,6 +185,7 @@ const FileUpload = () => {
                     setFiles([]);
                     setValidationResults(null);
                     setValidated(false);
+                    setBatchToken(null);
                     const input = document.getElementById('file-input') as HTMLInputElement;
                     if (input) input.value = '';
                   }}
@@ -199,7 +244,7 @@ const FileUpload = () => {
                       <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4" fill="none"/>
                       <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8v8z"/>
                     </svg>
-                    Subiendo...
+                    Subiendo...{progress && ` ${progress}`}
                   </span>
                 ) : (
                   `Guardar archivos`